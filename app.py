@@ -34,6 +34,11 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 # 最適化APIインスタンス
 optimization_api = MovieOptimizationAPI()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """DB処理スレッドを止めて接続を閉じる"""
+    optimization_api.close()
+
 # リクエストモデル
 class SearchRequest(BaseModel):
     date: str = "2025-07-14"
@@ -45,8 +50,19 @@ class OptimizationRequest(BaseModel):
     plan_type: str = "all"
     max_travel_time: int = 30
     buffer_time: int = 15
+    max_total_duration: int = 480
     time_from: str = "19:00"
     time_to: str = "22:00"
+    max_films: int = 5  # plan_type="marathon" の最大本数
+
+class ScheduleRequest(BaseModel):
+    date: str = "2025-07-14"
+    time_from: str = "19:00"
+    time_to: str = "24:00"
+    max_films: int = 5
+    top_k: int = 10
+    max_travel_time: int = 30
+    buffer_time: int = 15
 
 @app.get("/")
 async def read_root():
@@ -77,7 +93,7 @@ async def test_api():
 async def search_movies(request: SearchRequest):
     """映画を検索"""
     try:
-        movies = optimization_api.get_available_movies(
+        movies = await optimization_api.get_available_movies_async(
             date=request.date,
             time_from=request.time_from,
             time_to=request.time_to
@@ -100,24 +116,44 @@ async def search_movies(request: SearchRequest):
 async def optimize_plan(request: OptimizationRequest):
     """プランを最適化"""
     try:
-        result = optimization_api.optimize_plan(
+        result = await optimization_api.optimize_plan_async(
             showtime_id=request.showtime_id,
             max_travel_time=request.max_travel_time,
             buffer_time=request.buffer_time,
             plan_type=request.plan_type,
+            max_total_duration=request.max_total_duration,
             time_from=request.time_from,
-            time_to=request.time_to
+            time_to=request.time_to,
+            max_films=request.max_films
         )
         return result
     except Exception as e:
         logger.error(f"Optimization failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/schedules")
+async def find_best_schedules(request: ScheduleRequest):
+    """空き時間に観られる最良のスケジュールを検索（上映の指定不要）"""
+    try:
+        result = await optimization_api.find_best_schedules_async(
+            date=request.date,
+            time_from=request.time_from,
+            time_to=request.time_to,
+            max_films=request.max_films,
+            top_k=request.top_k,
+            max_travel_time=request.max_travel_time,
+            buffer_time=request.buffer_time
+        )
+        return result
+    except Exception as e:
+        logger.error(f"Schedule search failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/crawling-status")
 async def get_crawling_status():
     """クローリング状況を取得"""
     try:
-        status = optimization_api.get_crawling_status()
+        status = await optimization_api.get_crawling_status_async()
         return status
     except Exception as e:
         logger.error(f"Failed to get crawling status: {e}")
@@ -127,7 +163,7 @@ async def get_crawling_status():
 async def get_plan_details(plan_id: int):
     """プランの詳細を取得"""
     try:
-        plan = optimization_api.get_plan_details(plan_id)
+        plan = await optimization_api.get_plan_details_async(plan_id)
         return plan
     except Exception as e:
         logger.error(f"Failed to get plan details: {e}")
@@ -137,7 +173,7 @@ async def get_plan_details(plan_id: int):
 async def get_database_stats():
     """データベース統計情報を取得"""
     try:
-        stats = optimization_api.get_database_stats()
+        stats = await optimization_api.get_database_stats_async()
         return {
             "success": True,
             "stats": stats,
@@ -147,11 +183,25 @@ async def get_database_stats():
         logger.error(f"Failed to get database stats: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/cache-stats")
+async def get_cache_stats():
+    """プランキャッシュの統計（ヒット・ミス・追い出し件数）を取得"""
+    try:
+        stats = optimization_api.get_plan_cache_stats()
+        return {
+            "success": True,
+            "stats": stats,
+            "generated_at": datetime.now().isoformat()
+        }
+    except Exception as e:
+        logger.error(f"Failed to get cache stats: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/theater-distances")
 async def get_theater_distances():
     """映画館間距離を取得"""
     try:
-        distances = optimization_api.get_theater_distances()
+        distances = await optimization_api.get_theater_distances_async()
         return {
             "success": True,
             "distances": distances,
@@ -166,6 +216,8 @@ async def trigger_crawling():
     """クローリングを実行（デモ用）"""
     try:
         # 実際のクローリングは時間がかかるため、ここでは状態を返すだけ
+        # 取り込み済みデータはスケジュール索引をバックグラウンドで再構築して反映
+        await optimization_api.refresh_schedule_index_async()
         return {
             "success": True,
             "message": "クローリングが開始されました",
@@ -181,7 +233,7 @@ async def get_system_info():
     """システム情報を取得"""
     try:
         # データベース統計
-        db_stats = optimization_api.get_database_stats()
+        db_stats = await optimization_api.get_database_stats_async()
         
         # システム情報
         system_info = {
@@ -190,6 +242,9 @@ async def get_system_info():
             "status": "running",
             "database_path": optimization_api.db_path,
             "database_stats": db_stats,
+            "connection_pool": optimization_api.get_connection_pool_stats(),
+            "db_executor": optimization_api.get_db_executor_stats(),
+            "optimization_workers": optimization_api.get_process_pool_stats(),
             "features": [
                 "映画検索",
                 "プラン最適化",
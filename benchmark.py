@@ -0,0 +1,661 @@
+#!/usr/bin/env python3
+"""
+ベンチマーク - 一時DBを作成してストレージ・取り込み・最適化の性能を計測
+
+使い方:
+    python benchmark.py read-during-import --rows 20000 --readers 4
+    python benchmark.py import --sizes 10000 100000 1000000
+    python benchmark.py batch-load --areas 5
+    python benchmark.py health-under-load --requests 50
+    python benchmark.py optimize-throughput --workers 0 1 2 4
+    python benchmark.py crawl --connections 1 4 8 --rate 2 --serial
+    python benchmark.py crawl-cache --changed 0.2
+    python benchmark.py parse --rounds 5
+    python benchmark.py replay --corpus shinjuku.jsonl.gz --latency-ms 0 50
+"""
+
+import argparse
+import contextlib
+import hashlib
+import http.client
+import io
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+import logging
+
+from complete_eiga_crawler import CompleteEigaCrawler
+from schedule_parser import available_parsers, get_parser
+from page_corpus import PageCorpus
+from setup_database import DatabaseSetup
+from database_manager import DatabaseManager
+from connection_pool import configure_pool, STORAGE_PRAGMAS
+from optimization_api import MovieOptimizationAPI
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+BENCH_DATE = "2025-07-14"
+
+def build_fixture(db_path: str, showtimes: int = 2000, movies: int = 60, seed: int = 1):
+    """映画館・距離はセットアップ済みのDBに、映画と上映を乱数で投入"""
+    # スキーマファイルはリポジトリ直下から読むので作業ディレクトリを合わせる
+    cwd = os.getcwd()
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        DatabaseSetup(db_path).setup_complete_database()
+    finally:
+        os.chdir(cwd)
+    
+    rng = random.Random(seed)
+    with DatabaseManager(db_path) as db:
+        theater_ids = [t['theater_id'] for t in db.get_theaters()]
+        movie_ids = [db.insert_or_update_movie(f"ベンチ映画{i}", duration=rng.randint(85, 160))
+                     for i in range(movies)]
+        for _ in range(showtimes):
+            start = rng.randint(8 * 60, 23 * 60)
+            db.insert_or_update_showtime(rng.choice(theater_ids), rng.choice(movie_ids), BENCH_DATE,
+                                         f"{start // 60:02d}:{start % 60:02d}", rng.randint(1, 12))
+        db.connection.commit()
+
+def write_import_file(path: str, db_path: str, rows: int, target_date: str, seed: int = 2):
+    """import_schedule_data 形式のJSONを作成"""
+    rng = random.Random(seed)
+    with DatabaseManager(db_path) as db:
+        theater_names = [t['name'] for t in db.get_theaters()]
+    schedule = []
+    for i in range(rows):
+        start = rng.randint(8 * 60, 25 * 60)
+        schedule.append({
+            "title": f"取り込み映画{i % 300}",
+            "theater_name": rng.choice(theater_names),
+            "date": target_date,
+            "start_time": f"{start // 60:02d}:{start % 60:02d}"
+        })
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"metadata": {"target_date": target_date}, "schedule": schedule}, f, ensure_ascii=False)
+
+def percentile(values: List[float], ratio: float) -> float:
+    """パーセンタイル（ミリ秒）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))] * 1000
+
+def run_read_during_import(fixture: str, import_file: str, profile: str, readers: int) -> Dict:
+    """取り込み中の読み取りスループットを1つのストレージ設定で計測"""
+    db_path = os.path.join(os.path.dirname(fixture), f"{profile}.db")
+    shutil.copyfile(fixture, db_path)
+    
+    if profile == "legacy":
+        # 従来の構成: ロールバックジャーナル・既定の PRAGMA・読み書き兼用の接続
+        with sqlite3.connect(db_path) as connection:
+            connection.execute("PRAGMA journal_mode = DELETE")
+        configure_pool(db_path, pragmas={})
+        read_only = False
+    else:
+        configure_pool(db_path)
+        read_only = True
+    
+    def read_once(kind: int):
+        with DatabaseManager(db_path, read_only=read_only) as db:
+            if kind == 0:
+                db.get_showtimes(date=BENCH_DATE, start_min_from=19 * 60, end_min_to=24 * 60)
+            elif kind == 1:
+                db.get_theater_distances()
+            else:
+                db.get_database_stats()
+    
+    latencies: List[float] = []
+    errors: List[str] = []
+    lock = threading.Lock()
+    done = threading.Event()
+    
+    def reader(seed: int):
+        rng = random.Random(seed)
+        local_latencies = []
+        while not done.is_set():
+            started = time.perf_counter()
+            try:
+                read_once(rng.randrange(3))
+                local_latencies.append(time.perf_counter() - started)
+            except sqlite3.Error as e:
+                with lock:
+                    errors.append(str(e))
+        with lock:
+            latencies.extend(local_latencies)
+    
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    for thread in threads:
+        thread.start()
+    
+    started = time.perf_counter()
+    with DatabaseManager(db_path) as db:
+        result = db.import_schedule_data(import_file)
+    import_seconds = time.perf_counter() - started
+    done.set()
+    for thread in threads:
+        thread.join()
+    
+    return {
+        "profile": profile,
+        "imported_showtimes": result['imported_showtimes'],
+        "import_seconds": round(import_seconds, 2),
+        "reads": len(latencies),
+        "reads_per_sec": round(len(latencies) / import_seconds, 1) if import_seconds else 0.0,
+        "p50_ms": round(percentile(latencies, 0.5), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "max_ms": round(max(latencies) * 1000, 2) if latencies else 0.0,
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2) if latencies else 0.0,
+        "errors": len(errors)
+    }
+
+def bench_read_during_import(args):
+    """クローリング取り込み中の読み取り性能を従来構成と WAL + 読み取り専用接続で比較"""
+    workdir = tempfile.mkdtemp(prefix="movie_bench_")
+    try:
+        fixture = os.path.join(workdir, "fixture.db")
+        import_file = os.path.join(workdir, "import.json")
+        build_fixture(fixture, showtimes=args.showtimes)
+        write_import_file(import_file, fixture, args.rows, "2025-07-15")
+        
+        print(f"取り込み {args.rows}行 / 読み取りスレッド {args.readers}")
+        print(f"{'profile':<8} {'import_s':>9} {'reads':>7} {'reads/s':>9} {'p50_ms':>8} {'p99_ms':>8} {'max_ms':>8} {'errors':>7}")
+        for profile in ("legacy", "tuned"):
+            r = run_read_during_import(fixture, import_file, profile, args.readers)
+            print(f"{r['profile']:<8} {r['import_seconds']:>9} {r['reads']:>7} {r['reads_per_sec']:>9} "
+                  f"{r['p50_ms']:>8} {r['p99_ms']:>8} {r['max_ms']:>8} {r['errors']:>7}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def bench_import(args):
+    """import_schedule_data の取り込み速度（行/秒）を一括取り込みと従来の1行ずつで比較"""
+    workdir = tempfile.mkdtemp(prefix="movie_bench_")
+    try:
+        fixture = os.path.join(workdir, "fixture.db")
+        build_fixture(fixture, showtimes=args.showtimes)
+        
+        print(f"{'rows':>9} {'mode':<7} {'seconds':>8} {'rows/s':>10} {'showtimes':>10}")
+        for rows in args.sizes:
+            import_file = os.path.join(workdir, f"import_{rows}.json")
+            write_import_file(import_file, fixture, rows, "2025-07-15")
+            modes = ["bulk", "legacy"] if rows <= args.legacy_max else ["bulk"]
+            for mode in modes:
+                db_path = os.path.join(workdir, f"{mode}_{rows}.db")
+                shutil.copyfile(fixture, db_path)
+                random.seed(args.seed)
+                started = time.perf_counter()
+                with DatabaseManager(db_path) as db:
+                    result = db.import_schedule_data(import_file, bulk=(mode == "bulk"))
+                    showtimes = db.get_database_stats()['showtimes_by_date'].get("2025-07-15", 0)
+                seconds = time.perf_counter() - started
+                print(f"{rows:>9} {mode:<7} {seconds:>8.2f} {result['imported_showtimes'] / seconds:>10.0f} {showtimes:>10}")
+                os.remove(db_path)
+            os.remove(import_file)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def load_crawled_areas(db: DatabaseManager, areas: int, theaters_per_area: int, showtimes_per_theater: int,
+                       seed: int = 3) -> int:
+    """クローリング結果の書き込みを模して get_or_create_* と add_showtime を呼ぶ（呼び出し回数を返す）"""
+    rng = random.Random(seed)
+    calls = 0
+    for area in range(areas):
+        for t in range(theaters_per_area):
+            theater_id = db.get_or_create_theater(f"エリア{area}シネマ{t}", prefecture="東京都")
+            calls += 1
+            for i in range(showtimes_per_theater):
+                movie_id = db.get_or_create_movie(f"クロール映画{rng.randrange(80)}", duration=rng.randint(85, 160))
+                start = 8 * 60 + (i // 10) * 10
+                end = start + rng.randint(85, 160)
+                db.add_showtime(movie_id, theater_id, BENCH_DATE, f"{start // 60:02d}:{start % 60:02d}",
+                                f"{end // 60:02d}:{end % 60:02d}", screen_number=i % 10 + 1)
+                calls += 2
+    return calls
+
+def bench_batch_load(args):
+    """複数エリアの書き込みを1行ずつコミットする場合と db.batch() でまとめる場合を比較"""
+    workdir = tempfile.mkdtemp(prefix="movie_bench_")
+    try:
+        fixture = os.path.join(workdir, "fixture.db")
+        build_fixture(fixture, showtimes=0)
+        
+        print(f"{args.areas}エリア × {args.theaters}館 × {args.showtimes}上映 (synchronous={args.synchronous})")
+        print(f"{'mode':<9} {'seconds':>8} {'calls':>7} {'commits':>8} {'calls/s':>9} {'showtimes':>10}")
+        for mode in ("per-row", "batch"):
+            db_path = os.path.join(workdir, f"{mode}.db")
+            shutil.copyfile(fixture, db_path)
+            configure_pool(db_path, pragmas={**STORAGE_PRAGMAS, "synchronous": args.synchronous})
+            started = time.perf_counter()
+            with DatabaseManager(db_path) as db:
+                changes = db.connection.total_changes
+                if mode == "batch":
+                    with db.batch(max_rows=args.max_rows, max_interval_ms=args.max_interval_ms) as batch:
+                        calls = load_crawled_areas(db, args.areas, args.theaters, args.showtimes)
+                    commits = batch.commits
+                else:
+                    calls = load_crawled_areas(db, args.areas, args.theaters, args.showtimes)
+                    # 行ごとの書き込みは挿入した行数だけコミットする
+                    commits = db.connection.total_changes - changes
+                seconds = time.perf_counter() - started
+                showtimes = db.get_database_stats()['showtimes']
+            print(f"{mode:<9} {seconds:>8.2f} {calls:>7} {commits:>8} {calls / seconds:>9.0f} {showtimes:>10}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def http_request(port: int, method: str, path: str, body: Dict = None, timeout: float = 120.0) -> Tuple[int, float]:
+    """HTTPリクエストを送り、ステータスと所要秒数を返す"""
+    started = time.perf_counter()
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        payload = json.dumps(body) if body is not None else None
+        connection.request(method, path, body=payload, headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        response.read()
+        return response.status, time.perf_counter() - started
+    finally:
+        connection.close()
+
+def measure_health(port: int, stop: threading.Event, interval: float, latencies: List[float]):
+    """stop されるまで /health を一定間隔で呼んで応答時間を記録"""
+    while not stop.is_set():
+        try:
+            _, seconds = http_request(port, "GET", "/health")
+            latencies.append(seconds)
+        except OSError:
+            pass
+        stop.wait(interval)
+
+def bench_health_under_load(args):
+    """最適化リクエストの同時実行中に /health の応答時間が変わらないかを計測"""
+    workdir = tempfile.mkdtemp(prefix="movie_bench_")
+    server = None
+    try:
+        # アプリは作業ディレクトリの movie_optimization.db を使う
+        db_path = os.path.join(workdir, "movie_optimization.db")
+        build_fixture(db_path, showtimes=args.showtimes)
+        with DatabaseManager(db_path) as db:
+            showtime_ids = [s['showtime_id'] for s in db.get_showtimes(date=BENCH_DATE)]
+        
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--port", str(args.port),
+                                   "--log-level", "warning"], cwd=workdir, env=env)
+        deadline = time.time() + 30
+        while True:
+            try:
+                http_request(args.port, "GET", "/health", timeout=1.0)
+                break
+            except OSError:
+                if time.time() > deadline or server.poll() is not None:
+                    raise RuntimeError("server did not start")
+                time.sleep(0.2)
+        
+        idle: List[float] = []
+        stop = threading.Event()
+        threading.Timer(args.idle_seconds, stop.set).start()
+        measure_health(args.port, stop, args.interval, idle)
+        
+        loaded: List[float] = []
+        optimize_latencies: List[float] = []
+        errors: List[int] = []
+        stop = threading.Event()
+        pinger = threading.Thread(target=measure_health, args=(args.port, stop, args.interval, loaded))
+        pinger.start()
+        
+        def optimize(i: int):
+            body = {"showtime_id": showtime_ids[i * len(showtime_ids) // args.requests], "plan_type": "all",
+                    "time_from": "08:00", "time_to": "26:00"}
+            status, seconds = http_request(args.port, "POST", "/api/optimize", body)
+            optimize_latencies.append(seconds)
+            if status != 200:
+                errors.append(status)
+        
+        started = time.perf_counter()
+        workers = [threading.Thread(target=optimize, args=(i,)) for i in range(args.requests)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        load_seconds = time.perf_counter() - started
+        stop.set()
+        pinger.join()
+        
+        print(f"最適化 {args.requests}件を同時実行: {load_seconds:.2f}秒 (エラー {len(errors)}件, "
+              f"最適化 p50 {percentile(optimize_latencies, 0.5):.0f}ms)")
+        print(f"{'/health':<8} {'count':>6} {'p50_ms':>8} {'p95_ms':>8} {'max_ms':>8}")
+        for label, values in (("idle", idle), ("load", loaded)):
+            print(f"{label:<8} {len(values):>6} {percentile(values, 0.5):>8.2f} {percentile(values, 0.95):>8.2f} "
+                  f"{max(values) * 1000 if values else 0.0:>8.2f}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def bench_optimize_throughput(args):
+    """最適化をスレッドのみ（workers=0）と最適化プロセスで実行した時の処理件数/秒を比較"""
+    workdir = tempfile.mkdtemp(prefix="movie_bench_")
+    try:
+        db_path = os.path.join(workdir, "fixture.db")
+        build_fixture(db_path, showtimes=args.showtimes)
+        with DatabaseManager(db_path) as db:
+            showtime_ids = [s['showtime_id'] for s in db.get_showtimes(date=BENCH_DATE)]
+        requests = [(showtime_ids[i * len(showtime_ids) // args.requests], args.plan_type)
+                    for i in range(args.requests)]
+        
+        print(f"CPU {os.cpu_count()}コア / 最適化 {args.requests}件 (plan_type={args.plan_type})")
+        print(f"{'workers':>7} {'seconds':>8} {'req/s':>8} {'plans':>7}")
+        for workers in args.workers:
+            # 結果キャッシュを無効にして毎回探索させる
+            api = MovieOptimizationAPI(db_path, plan_cache_size=0, optimize_workers=workers)
+            threads = max(workers, 4)
+            try:
+                def run(request):
+                    showtime_id, plan_type = request
+                    return api.optimize_plan(showtime_id, plan_type=plan_type, time_from="08:00", time_to="26:00")
+                
+                with ThreadPoolExecutor(threads) as pool:
+                    # プロセスの起動と索引の構築は計測から除く
+                    list(pool.map(run, requests[:threads]))
+                    started = time.perf_counter()
+                    results = list(pool.map(run, requests))
+                    seconds = time.perf_counter() - started
+            finally:
+                api.close()
+            plans = sum(result['total_plans'] for result in results)
+            print(f"{workers:>7} {seconds:>8.2f} {len(requests) / seconds:>8.1f} {plans:>7}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+class EigaStandInHandler(BaseHTTPRequestHandler):
+    """映画.com の代わりに用意したページを返すローカルサーバー（キープアライブ・ETag 対応）"""
+    protocol_version = "HTTP/1.1"
+    pages: Dict[str, bytes] = {}
+    latency = 0.0  # 1リクエストごとの応答遅延（秒）
+    
+    def do_GET(self):
+        time.sleep(self.latency)
+        body = self.pages.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+def standin_chrome(rng: random.Random) -> Tuple[str, str]:
+    """映画.com のページと同じく、スケジュール以外のヘッダー・ナビゲーション・広告・フッターを生成"""
+    nav = "".join(f'<li><a href="/news/{rng.randint(1, 99999)}/">ニュース記事{n}・上映開始まであと5分</a></li>'
+                  for n in range(60))
+    ranking = "".join(f'<li><a href="/ranking/{n}/"><span class="rank">{n}</span>ランキング作品{n}</a></li>'
+                      for n in range(1, 31))
+    header = (f'<head><title>映画.com</title><script>var ads = {json.dumps(list(range(400)))};</script></head>'
+              f'<body><header><ul class="global-nav">{nav}</ul><p>新宿駅から徒歩5分</p></header><main>')
+    footer = (f'</main><aside><ol class="ranking">{ranking}</ol></aside>'
+              f'<footer>{"<p>Copyright eiga.com, inc. All rights reserved.</p>" * 20}</footer></body>')
+    return header, footer
+
+def build_standin_pages(crawler: CompleteEigaCrawler, movies_per_theater: int, seed: int = 1) -> Dict[str, bytes]:
+    """映画館ページと映画ごとの上映スケジュールページを映画.com と同じ構造で生成"""
+    rng = random.Random(seed)
+    pages = {}
+    movie_pool = [f"{100000 + i}" for i in range(movies_per_theater * 2)]
+    header, footer = standin_chrome(rng)
+    for theater_name, theater in crawler.theaters.items():
+        movie_ids = rng.sample(movie_pool, movies_per_theater)
+        links = "".join(f'<a href="/movie/{movie_id}/"><img alt="ベンチ映画{movie_id}" src="/img/{movie_id}.jpg"></a>'
+                        for movie_id in movie_ids)
+        pages[f"/theater/{theater['area_id']}/"] = f"<html>{header}<h1>{theater_name}</h1>{links}{footer}</html>".encode()
+        for movie_id in movie_ids:
+            cells = []
+            for day in range(14, 21):
+                starts = sorted(rng.sample(range(9 * 60, 24 * 60, 5), 5))
+                slots = "".join(f"<span>{start // 60:02d}:{start % 60:02d}</span>" for start in starts)
+                cells.append(f'<td><p class="date">7/{day}</p>{slots}</td>')
+            body = (f"<html>{header}<h1>ベンチ映画{movie_id}</h1><p>上映時間：{rng.randint(85, 160)}分</p>"
+                    f'<table class="weekly-schedule"><tr>{"".join(cells)}</tr></table>{footer}</html>')
+            pages[f"/movie-theater/{movie_id}/{theater['area_id']}/"] = body.encode()
+    return pages
+
+@contextlib.contextmanager
+def standin_server(pages: Dict[str, bytes], latency: float):
+    """ローカルの代替サーバーを別スレッドで起動し、ベースURLを返す"""
+    handler = type("Handler", (EigaStandInHandler,), {"pages": pages, "latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def bench_crawl(args):
+    """ローカルの代替サーバーに対して逐次クローリングと並行クローリングの経過時間を比較"""
+    pages = build_standin_pages(CompleteEigaCrawler(cache_dir=None), args.movies)
+    with standin_server(pages, args.latency_ms / 1000) as base_url:
+        print(f"ページ {len(pages)}件 / 応答遅延 {args.latency_ms}ms / 速度制限 {args.rate}件/秒 (burst {args.burst})")
+        print(f"{'mode':<10} {'conns':>5} {'seconds':>8} {'requests':>8} {'req/s':>7} {'waits':>6} {'showtimes':>9}")
+        runs = [("serial", 1)] if args.serial else []
+        runs += [("concurrent", connections) for connections in args.connections]
+        for mode, connections in runs:
+            crawler = CompleteEigaCrawler(base_url=base_url, cache_dir=None)
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                data = crawler.crawl_all_theaters(concurrent=mode == "concurrent", max_connections=connections,
+                                                  rate_per_host=args.rate, burst=args.burst)
+            seconds = time.perf_counter() - started
+            stats = crawler.crawl_stats
+            requests = stats.get("requests", len(pages))
+            print(f"{mode:<10} {connections:>5} {seconds:>8.2f} {requests:>8} {requests / seconds:>7.1f} "
+                  f"{stats.get('rate_limit_waits', '-'):>6} {len(data['showtimes']):>9}")
+
+def bench_crawl_cache(args):
+    """空のキャッシュでクローリングした後、一部のページを変えて再クローリングし、ヒット率と節約した転送量を計測"""
+    workdir = tempfile.mkdtemp(prefix="movie_bench_")
+    try:
+        pages = build_standin_pages(CompleteEigaCrawler(cache_dir=None), args.movies)
+        rng = random.Random(args.seed)
+        with standin_server(pages, args.latency_ms / 1000) as base_url:
+            print(f"ページ {len(pages)}件 / 2回目までに変更 {args.changed * 100:.0f}%")
+            print(f"{'run':<5} {'seconds':>8} {'requests':>8} {'hits':>5} {'hit%':>6} {'downloaded':>10} {'saved':>9}")
+            for run in ("cold", "warm"):
+                if run == "warm":
+                    # スケジュールが更新されたページだけ本文を変える
+                    for path in rng.sample(sorted(pages), int(len(pages) * args.changed)):
+                        pages[path] = pages[path].replace(b"</body>", b"<!-- updated --></body>")
+                crawler = CompleteEigaCrawler(base_url=base_url, cache_dir=os.path.join(workdir, "http_cache"))
+                started = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    crawler.crawl_all_theaters(rate_per_host=args.rate, burst=args.burst)
+                seconds = time.perf_counter() - started
+                cache = crawler.crawl_stats['cache']
+                print(f"{run:<5} {seconds:>8.2f} {cache['requests']:>8} {cache['hits']:>5} {cache['hit_rate']:>6.1f} "
+                      f"{cache['bytes_downloaded']:>10} {cache['bytes_saved']:>9}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def bench_parse(args):
+    """代替サーバーと同じページを各解析方式で解析し、ページあたりの時間と結果の一致を確認"""
+    pages = build_standin_pages(CompleteEigaCrawler(cache_dir=None), args.movies)
+    theater_pages = [body for path, body in pages.items() if path.startswith("/theater/")]
+    schedule_pages = [body for path, body in pages.items() if path.startswith("/movie-theater/")]
+    reference = get_parser("soup")
+    expected = ([reference.theater_movies(body) for body in theater_pages],
+                [reference.movie_schedule(body) for body in schedule_pages])
+    print(f"ページ {len(pages)}件 (平均 {sum(map(len, pages.values())) // len(pages)} bytes) / {args.rounds}回")
+    print(f"{'parser':<9} {'theater ms':>10} {'schedule ms':>11} {'pages/s':>8} {'speedup':>7} {'same':>5}")
+    baseline = None
+    for name in available_parsers():
+        parser = get_parser(name)
+        result = ([parser.theater_movies(body) for body in theater_pages],
+                  [parser.movie_schedule(body) for body in schedule_pages])
+        timings = []
+        for parse, bodies in ((parser.theater_movies, theater_pages), (parser.movie_schedule, schedule_pages)):
+            started = time.perf_counter()
+            for _ in range(args.rounds):
+                for body in bodies:
+                    parse(body)
+            timings.append((time.perf_counter() - started) / (args.rounds * len(bodies)))
+        per_page = sum(timings[i] * len(bodies) for i, bodies in enumerate((theater_pages, schedule_pages))) / len(pages)
+        baseline = baseline or per_page
+        print(f"{name:<9} {timings[0] * 1000:>10.2f} {timings[1] * 1000:>11.2f} {1 / per_page:>8.0f} "
+              f"{baseline / per_page:>6.1f}x {'yes' if result == expected else 'NO':>5}")
+
+def bench_replay(args):
+    """記録したページのコーパスをオフラインで再生し、新宿エリア全体のクローリングの取得・解析・DB書き込みを計測"""
+    workdir = tempfile.mkdtemp(prefix="movie_bench_")
+    try:
+        if args.corpus:
+            corpus, base_url = PageCorpus.load(args.corpus), args.base_url
+        else:
+            # コーパスの指定がなければ代替サーバーに対するクローリングを記録して使う
+            pages = build_standin_pages(CompleteEigaCrawler(cache_dir=None), args.movies)
+            corpus = PageCorpus(os.path.join(workdir, "corpus.jsonl.gz"))
+            with standin_server(pages, 0.0) as base_url:
+                crawler = CompleteEigaCrawler(base_url=base_url, cache_dir=None,
+                                              db_path=os.path.join(workdir, "record.db"))
+                crawler.record_corpus(corpus)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    crawler.crawl_all_theaters(rate_per_host=1000, burst=100)
+            corpus.save()
+            body_bytes = sum(len(entry["body"]) for entry in corpus.entries.values())
+            print(f"記録: {len(corpus)}ページ {body_bytes}バイト → {os.path.getsize(corpus.path)}バイト (gzip)")
+        
+        template = os.path.join(workdir, "template.db")
+        build_fixture(template, showtimes=0, movies=0)
+        print(f"同時接続 {args.connections} / 速度制限 {args.rate}件/秒 (burst {args.burst})")
+        print(f"{'parser':<9} {'lat ms':>6} {'pages':>5} {'crawl s':>7} {'pages/s':>7} {'parse ms':>8} "
+              f"{'rows':>5} {'db s':>6} {'rows/s':>7} {'miss':>4} {'same':>4}")
+        expected = None
+        for name in args.parsers or available_parsers():
+            for latency_ms in args.latency_ms:
+                db_path = os.path.join(workdir, f"replay_{name}_{latency_ms:g}.db")
+                shutil.copy(template, db_path)
+                crawler = CompleteEigaCrawler(base_url=base_url, cache_dir=None, parser=name, db_path=db_path)
+                replay = crawler.replay_corpus(corpus, latency_ms / 1000)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    started = time.perf_counter()
+                    data = crawler.crawl_all_theaters(max_connections=args.connections, rate_per_host=args.rate,
+                                                      burst=args.burst)
+                    crawl_seconds = time.perf_counter() - started
+                    started = time.perf_counter()
+                    crawler.update_database(data)
+                    db_seconds = time.perf_counter() - started
+                pages = replay.replayed + replay.missing
+                rows = len(data['theaters']) + len(data['movies']) + len(data['showtimes'])
+                expected = expected or data
+                print(f"{name:<9} {latency_ms:>6g} {pages:>5} {crawl_seconds:>7.2f} {pages / crawl_seconds:>7.1f} "
+                      f"{crawler.crawl_stats['parse_ms_per_page']:>8.2f} {rows:>5} {db_seconds:>6.2f} "
+                      f"{rows / db_seconds:>7.0f} {replay.missing:>4} {'yes' if data == expected else 'NO':>4}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def main():
+    """ベンチマークのコマンドライン"""
+    parser = argparse.ArgumentParser(description="映画最適化システムのベンチマーク")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    read_parser = subparsers.add_parser("read-during-import", help="取り込み中の読み取りスループット")
+    read_parser.add_argument("--rows", type=int, default=20000, help="取り込む上映数")
+    read_parser.add_argument("--showtimes", type=int, default=2000, help="既存の上映数")
+    read_parser.add_argument("--readers", type=int, default=4, help="読み取りスレッド数")
+    read_parser.set_defaults(func=bench_read_during_import)
+    
+    import_parser = subparsers.add_parser("import", help="スケジュール取り込みの行/秒")
+    import_parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000], help="取り込む上映数")
+    import_parser.add_argument("--legacy-max", type=int, default=100000, help="従来の取り込みも計測する最大行数")
+    import_parser.add_argument("--showtimes", type=int, default=2000, help="既存の上映数")
+    import_parser.add_argument("--seed", type=int, default=1, help="スクリーン番号割り当ての乱数シード")
+    import_parser.set_defaults(func=bench_import)
+    
+    batch_parser = subparsers.add_parser("batch-load", help="行ごとのコミットとバッチ書き込みの比較")
+    batch_parser.add_argument("--areas", type=int, default=5, help="エリア数")
+    batch_parser.add_argument("--theaters", type=int, default=10, help="1エリアあたりの映画館数")
+    batch_parser.add_argument("--showtimes", type=int, default=200, help="1館あたりの上映数")
+    batch_parser.add_argument("--max-rows", type=int, default=1000, help="バッチのコミット間隔（行）")
+    batch_parser.add_argument("--max-interval-ms", type=float, default=500.0, help="バッチのコミット間隔（ミリ秒）")
+    batch_parser.add_argument("--synchronous", default="FULL", help="PRAGMA synchronous（FULL でコミットごとに fsync）")
+    batch_parser.set_defaults(func=bench_batch_load)
+    
+    health_parser = subparsers.add_parser("health-under-load", help="最適化の同時実行中の /health 応答時間")
+    health_parser.add_argument("--requests", type=int, default=50, help="同時に送る最適化リクエスト数")
+    health_parser.add_argument("--showtimes", type=int, default=2000, help="上映数")
+    health_parser.add_argument("--port", type=int, default=8765, help="テスト用サーバーのポート")
+    health_parser.add_argument("--interval", type=float, default=0.02, help="/health を呼ぶ間隔（秒）")
+    health_parser.add_argument("--idle-seconds", type=float, default=2.0, help="負荷なしで計測する秒数")
+    health_parser.set_defaults(func=bench_health_under_load)
+    
+    optimize_parser = subparsers.add_parser("optimize-throughput", help="最適化プロセス数ごとの処理件数/秒")
+    optimize_parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4], help="最適化プロセス数（0 はスレッドのみ）")
+    optimize_parser.add_argument("--requests", type=int, default=40, help="最適化リクエスト数")
+    optimize_parser.add_argument("--showtimes", type=int, default=3000, help="上映数")
+    optimize_parser.add_argument("--plan-type", default="marathon", help="plan_type")
+    optimize_parser.set_defaults(func=bench_optimize_throughput)
+    
+    crawl_parser = subparsers.add_parser("crawl", help="ローカルの代替サーバーに対するクローリング時間")
+    crawl_parser.add_argument("--connections", type=int, nargs="+", default=[1, 4, 8], help="同時接続数")
+    crawl_parser.add_argument("--rate", type=float, default=2.0, help="ホストごとの速度制限（件/秒）")
+    crawl_parser.add_argument("--burst", type=int, default=4, help="連続で送れるリクエスト数")
+    crawl_parser.add_argument("--movies", type=int, default=8, help="1館あたりの映画数")
+    crawl_parser.add_argument("--latency-ms", type=float, default=100.0, help="代替サーバーの応答遅延（ミリ秒）")
+    crawl_parser.add_argument("--serial", action="store_true", help="従来の逐次クローリング（固定の待ち時間あり）も計測")
+    crawl_parser.set_defaults(func=bench_crawl)
+    
+    cache_parser = subparsers.add_parser("crawl-cache", help="HTTPキャッシュのヒット率と節約した転送量")
+    cache_parser.add_argument("--changed", type=float, default=0.2, help="2回目のクローリングまでに変わるページの割合")
+    cache_parser.add_argument("--rate", type=float, default=50.0, help="ホストごとの速度制限（件/秒）")
+    cache_parser.add_argument("--burst", type=int, default=10, help="連続で送れるリクエスト数")
+    cache_parser.add_argument("--movies", type=int, default=8, help="1館あたりの映画数")
+    cache_parser.add_argument("--latency-ms", type=float, default=20.0, help="代替サーバーの応答遅延（ミリ秒）")
+    cache_parser.add_argument("--seed", type=int, default=1, help="変更するページを選ぶ乱数シード")
+    cache_parser.set_defaults(func=bench_crawl_cache)
+    
+    parse_parser = subparsers.add_parser("parse", help="解析方式ごとのページあたりの解析時間")
+    parse_parser.add_argument("--movies", type=int, default=8, help="1館あたりの映画数")
+    parse_parser.add_argument("--rounds", type=int, default=5, help="繰り返し回数")
+    parse_parser.set_defaults(func=bench_parse)
+    
+    replay_parser = subparsers.add_parser("replay", help="記録したページの再生によるクローリングのページ/秒・解析時間・DB書き込み行/秒")
+    replay_parser.add_argument("--corpus", help="CRAWL_RECORD で記録したコーパス（省略時は代替サーバーのページを記録）")
+    replay_parser.add_argument("--base-url", default="https://eiga.com", help="コーパスを記録したときのベースURL")
+    replay_parser.add_argument("--latency-ms", type=float, nargs="+", default=[0.0, 50.0], help="再生時の応答遅延（ミリ秒）")
+    replay_parser.add_argument("--parsers", nargs="+", help="解析方式（省略時は使えるものすべて）")
+    replay_parser.add_argument("--connections", type=int, default=4, help="同時接続数")
+    replay_parser.add_argument("--rate", type=float, default=1000.0, help="ホストごとの速度制限（件/秒）")
+    replay_parser.add_argument("--burst", type=int, default=100, help="連続で送れるリクエスト数")
+    replay_parser.add_argument("--movies", type=int, default=8, help="コーパスを作る場合の1館あたりの映画数")
+    replay_parser.set_defaults(func=bench_replay)
+    
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -3,73 +3,94 @@
 映画.comから新宿エリア映画館の完全なクローリングシステム
 """
 
+import asyncio
+import hashlib
+import os
 import requests
-from bs4 import BeautifulSoup
 import json
-import re
-from datetime import datetime
 import time
 import sqlite3
+from crawl_engine import CrawlEngine, DEFAULT_MAX_CONNECTIONS, DEFAULT_RATE_PER_HOST, DEFAULT_BURST
 from database_manager import DatabaseManager
-from typing import Dict, List, Optional
+from dataset_publisher import DatasetPublisher
+from http_cache import HTTPCache, HTTPCacheAdapter, DEFAULT_HTTP_CACHE_DIR
+from page_corpus import PageCorpus, ReplayAdapter, DEFAULT_RECORD_CORPUS, DEFAULT_REPLAY_CORPUS, DEFAULT_REPLAY_LATENCY
+from schedule_parser import get_parser, schedule_fragment, duration_label
+from schedule_time import time_to_minutes, end_minutes
+from typing import Callable, Dict, List, Optional
 
 class CompleteEigaCrawler:
-    def __init__(self):
+    def __init__(self, base_url: str = "https://eiga.com", cache_dir: Optional[str] = DEFAULT_HTTP_CACHE_DIR,
+                 parser: Optional[str] = None, db_path: str = "movie_optimization.db"):
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
-        self.base_url = "https://eiga.com"
+        # 変わっていないページは条件付き GET の 304 で本文の再取得を省く（cache_dir が空ならキャッシュしない）
+        self.http_cache = HTTPCache(cache_dir) if cache_dir else None
+        if self.http_cache:
+            adapter = HTTPCacheAdapter(self.http_cache)
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+        self.base_url = base_url  # テスト用のローカルサーバーに向けることもできる
+        self.crawl_stats = {}  # 直近のクローリングの取得件数・経過時間
+        self.parser = get_parser(parser)  # ページの解析方式（schedule_parser を参照）
+        self.db_path = db_path  # 指紋の読み込みと公開先（作成時には開かない）
+        self.page_fingerprints = {}  # URL → (ハッシュ, 解析結果の JSON)（前回公開時のもの）
+        self.changed_fingerprints = {}  # 今回変わったページの指紋（データと一緒に公開する）
+        self.page_changes = {}  # URL → 前回から変わったか（取得に失敗したページは含まない）
+        self.parse_seconds = 0.0  # 今回のページ解析にかかった時間
+        self.replay_adapter = None
         
         # 正しいURL構造で映画館情報を更新
         self.theaters = {
             '新宿ピカデリー': {
-                'url': 'https://eiga.com/theater/13/130201/3017/',
+                'url': f'{self.base_url}/theater/13/130201/3017/',
                 'id': '3017',
                 'area_id': '13/130201/3017'
             },
             'テアトル新宿': {
-                'url': 'https://eiga.com/theater/13/130201/3022/',
+                'url': f'{self.base_url}/theater/13/130201/3022/',
                 'id': '3022',
                 'area_id': '13/130201/3022'
             },
             '新宿武蔵野館': {
-                'url': 'https://eiga.com/theater/13/130201/3026/',
+                'url': f'{self.base_url}/theater/13/130201/3026/',
                 'id': '3026',
                 'area_id': '13/130201/3026'
             },
             'シネマート新宿': {
-                'url': 'https://eiga.com/theater/13/130201/3020/',
+                'url': f'{self.base_url}/theater/13/130201/3020/',
                 'id': '3020',
                 'area_id': '13/130201/3020'
             },
             'kino cinema新宿': {
-                'url': 'https://eiga.com/theater/13/130201/3322/',
+                'url': f'{self.base_url}/theater/13/130201/3322/',
                 'id': '3322',
                 'area_id': '13/130201/3322'
             },
             'Ks cinema': {
-                'url': 'https://eiga.com/theater/13/130201/3018/',
+                'url': f'{self.base_url}/theater/13/130201/3018/',
                 'id': '3018',
                 'area_id': '13/130201/3018'
             },
             '新宿シネマカリテ': {
-                'url': 'https://eiga.com/theater/13/130201/3096/',
+                'url': f'{self.base_url}/theater/13/130201/3096/',
                 'id': '3096',
                 'area_id': '13/130201/3096'
             },
             '新宿バルト9': {
-                'url': 'https://eiga.com/theater/13/130201/3016/',
+                'url': f'{self.base_url}/theater/13/130201/3016/',
                 'id': '3016',
                 'area_id': '13/130201/3016'
             },
             'TOHOシネマズ新宿': {
-                'url': 'https://eiga.com/theater/13/130201/3263/',
+                'url': f'{self.base_url}/theater/13/130201/3263/',
                 'id': '3263',
                 'area_id': '13/130201/3263'
             },
             '109シネマズプレミアム新宿': {
-                'url': 'https://eiga.com/theater/13/130201/3318/',
+                'url': f'{self.base_url}/theater/13/130201/3318/',
                 'id': '3318',
                 'area_id': '13/130201/3318'
             }
@@ -85,142 +106,192 @@ class CompleteEigaCrawler:
         try:
             response = self.session.get(theater_url, timeout=15)
             response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            movies = []
-            
-            # 映画リンクを探す
-            movie_links = soup.find_all('a', href=re.compile(r'/movie/[^/]+/'))
-            
-            for link in movie_links:
-                href = link.get('href')
-                if href:
-                    # 映画IDを抽出
-                    movie_id_match = re.search(r'/movie/([^/]+)/', href)
-                    if movie_id_match:
-                        movie_id = movie_id_match.group(1)
-                        
-                        # 映画タイトルを取得
-                        img_elem = link.find('img')
-                        if img_elem and img_elem.get('alt'):
-                            title = img_elem.get('alt').strip()
-                        else:
-                            title = link.get_text(strip=True)
-                        
-                        if title and len(title) > 1:
-                            movies.append({
-                                'movie_id': movie_id,
-                                'title': title,
-                                'theater_name': theater_name,
-                                'theater_id': self.theaters[theater_name]['id'],
-                                'image_url': img_elem.get('src', '') if img_elem else ''
-                            })
-            
-            # 重複を除去
-            unique_movies = {}
-            for movie in movies:
-                if movie['movie_id'] not in unique_movies:
-                    unique_movies[movie['movie_id']] = movie
-            
-            return list(unique_movies.values())
-            
+            return self.parse_page(theater_url, response.content,
+                                   lambda: self.parse_theater_movies(theater_name, response.content))
+                                   
         except Exception as e:
             print(f"Error getting movies for {theater_name}: {e}")
             return []
     
+    def parse_theater_movies(self, theater_name: str, content: bytes) -> List[Dict]:
+        """映画館ページから上映中映画一覧を抽出"""
+        movies = []
+        for movie_id, title, image_url in self.parser.theater_movies(content):
+            if title and len(title) > 1:
+                movies.append({
+                    'movie_id': movie_id,
+                    'title': title,
+                    'theater_name': theater_name,
+                    'theater_id': self.theaters[theater_name]['id'],
+                    'image_url': image_url
+                })
+        
+        # 重複を除去
+        unique_movies = {}
+        for movie in movies:
+            if movie['movie_id'] not in unique_movies:
+                unique_movies[movie['movie_id']] = movie
+        
+        return list(unique_movies.values())
+    
+    def load_page_fingerprints(self):
+        """公開済みのページの指紋を読み込み、今回の変更記録をクリア（DBがなければ全ページを変更ありとする）"""
+        self.page_fingerprints = {}
+        if os.path.exists(self.db_path):
+            with DatabaseManager(self.db_path, read_only=True) as db:
+                self.page_fingerprints = db.get_page_fingerprints()
+        self.changed_fingerprints = {}
+        self.page_changes = {}
+        self.parse_seconds = 0.0
+    
+    def record_corpus(self, corpus: PageCorpus) -> PageCorpus:
+        """取得した応答をコーパスに記録する（クローリング後に corpus.save() で保存）"""
+        self.session.hooks['response'].append(corpus.record_response)
+        return corpus
+    
+    def replay_corpus(self, corpus: PageCorpus, latency: float = 0.0) -> ReplayAdapter:
+        """ネットワークの代わりにコーパスの応答を latency 秒の遅延付きで返す（HTTPキャッシュは使わない）"""
+        self.replay_adapter = ReplayAdapter(corpus, latency)
+        self.session.mount("http://", self.replay_adapter)
+        self.session.mount("https://", self.replay_adapter)
+        self.http_cache = None
+        return self.replay_adapter
+    
+    def parse_page(self, url: str, content: bytes, parse: Callable):
+        """指紋が前回と同じページは解析せず前回の解析結果を返し、変わったページだけ parse() で解析
+        
+        指紋は解析結果を決める部分（スケジュール部分とページ内の「上映時間：N分」）のハッシュ
+        """
+        content_hash = hashlib.sha256(schedule_fragment(content) + duration_label(content)).hexdigest()
+        known = self.page_fingerprints.get(url)
+        if known is not None and known[0] == content_hash:
+            self.page_changes[url] = False
+            return json.loads(known[1])
+        
+        started = time.perf_counter()
+        parsed = parse()
+        self.parse_seconds += time.perf_counter() - started
+        self.page_changes[url] = True
+        self.changed_fingerprints[url] = (content_hash, json.dumps(parsed, ensure_ascii=False))
+        return parsed
+    
+    def movie_schedule_url(self, movie_id: str, theater_name: str) -> str:
+        """映画館ごとの映画の上映スケジュールページの URL"""
+        return f"{self.base_url}/movie-theater/{movie_id}/{self.theaters[theater_name]['area_id']}/"
+    
     def get_movie_schedule(self, movie_id: str, theater_name: str) -> List[Dict]:
         """特定の映画の上映スケジュールを取得"""
         if theater_name not in self.theaters:
             return []
         
-        movie_url = f"https://eiga.com/movie-theater/{movie_id}/{self.theaters[theater_name]['area_id']}/"
+        movie_url = self.movie_schedule_url(movie_id, theater_name)
         
         try:
             response = self.session.get(movie_url, timeout=15)
             response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # 映画の基本情報を取得
-            title_elem = soup.find('h1') or soup.find('h2')
-            title = title_elem.get_text(strip=True) if title_elem else "Unknown"
-            
-            # 上映時間を取得
-            duration = 120  # デフォルト値
-            duration_patterns = [
-                r'(\\d+)分',
-                r'上映時間[：:]\\s*(\\d+)分'
-            ]
-            
-            for pattern in duration_patterns:
-                duration_match = re.search(pattern, response.text)
-                if duration_match:
-                    duration = int(duration_match.group(1))
-                    break
-            
-            # 上映スケジュールを取得
-            showtimes = []
-            
-            # .weekly-schedule テーブルを探す
-            weekly_schedule = soup.find('table', class_='weekly-schedule')
-            if weekly_schedule:
-                # 日付とタイムスロットを解析
-                for row in weekly_schedule.find_all('tr'):
-                    for cell in row.find_all('td'):
-                        # 日付を探す
-                        date_elem = cell.find('p', class_='date')
-                        if date_elem:
-                            date_text = date_elem.get_text(strip=True)
-                            date_match = re.search(r'(\\d{1,2})/(\\d{1,2})', date_text)
-                            if date_match:
-                                month, day = date_match.groups()
-                                year = datetime.now().year
-                                show_date = f"{year}-{int(month):02d}-{int(day):02d}"
-                                
-                                # 時間スロットを探す
-                                time_elements = cell.find_all(['a', 'span'])
-                                for time_elem in time_elements:
-                                    time_text = time_elem.get_text(strip=True)
-                                    time_match = re.search(r'(\\d{1,2}:\\d{2})', time_text)
-                                    if time_match:
-                                        start_time = time_match.group(1)
-                                        
-                                        # 終了時間を計算
-                                        start_hour, start_min = map(int, start_time.split(':'))
-                                        end_minutes = start_hour * 60 + start_min + duration
-                                        end_hour = end_minutes // 60
-                                        end_min = end_minutes % 60
-                                        end_time = f"{end_hour:02d}:{end_min:02d}"
-                                        
-                                        showtimes.append({
-                                            'date': show_date,
-                                            'start_time': start_time,
-                                            'end_time': end_time,
-                                            'screen': 1,  # デフォルト値
-                                            'price': 2000.0  # デフォルト値
-                                        })
-            
-            return {
-                'title': title,
-                'duration': duration,
-                'showtimes': showtimes
-            }
-            
+            return self.parse_page(movie_url, response.content,
+                                   lambda: self.parse_movie_schedule(response.content))
+                                   
         except Exception as e:
             print(f"Error getting schedule for movie {movie_id}: {e}")
-            return {
-                'title': 'Unknown',
-                'duration': 120,
-                'showtimes': []
-            }
+            return self.empty_schedule()
+    
+    def empty_schedule(self) -> Dict:
+        """スケジュールを取得できなかった映画の既定値"""
+        return {
+            'title': 'Unknown',
+            'duration': 120,
+            'showtimes': []
+        }
+    
+    def parse_movie_schedule(self, content: bytes) -> Dict:
+        """映画の上映スケジュールページからタイトル・上映時間・上映回を抽出"""
+        return self.parser.movie_schedule(content)
     
-    def crawl_all_theaters(self) -> Dict:
-        """全ての新宿エリア映画館をクローリング"""
+    async def fetch_theater_movies(self, engine: CrawlEngine, theater_name: str) -> List[Dict]:
+        """get_theater_movies のクローリングエンジン版"""
+        theater_url = self.theaters[theater_name]['url']
+        try:
+            response = await engine.fetch(theater_url, timeout=15)
+            response.raise_for_status()
+            return self.parse_page(theater_url, response.content,
+                                   lambda: self.parse_theater_movies(theater_name, response.content))
+                                   
+        except Exception as e:
+            print(f"Error getting movies for {theater_name}: {e}")
+            return []
+    
+    async def fetch_movie_schedule(self, engine: CrawlEngine, movie_id: str, theater_name: str) -> Dict:
+        """get_movie_schedule のクローリングエンジン版"""
+        movie_url = self.movie_schedule_url(movie_id, theater_name)
+        try:
+            response = await engine.fetch(movie_url, timeout=15)
+            response.raise_for_status()
+            return self.parse_page(movie_url, response.content,
+                                   lambda: self.parse_movie_schedule(response.content))
+                                   
+        except Exception as e:
+            print(f"Error getting schedule for movie {movie_id}: {e}")
+            return self.empty_schedule()
+    
+    async def crawl_theater(self, engine: CrawlEngine, theater_name: str) -> List:
+        """映画館ページを取得し、その映画のスケジュールページを並行に取得"""
+        movies = await self.fetch_theater_movies(engine, theater_name)
+        schedules = await asyncio.gather(*(self.fetch_movie_schedule(engine, movie['movie_id'], theater_name)
+                                           for movie in movies))
+        return list(zip(movies, schedules))
+    
+    async def crawl_concurrently(self, max_connections: int, rate_per_host: float, burst: int) -> List:
+        """全映画館を並行にクローリングし、映画館の順に (映画, スケジュール) の一覧を返す"""
+        engine = CrawlEngine(self.session, max_connections=max_connections, rate_per_host=rate_per_host, burst=burst)
+        try:
+            results = await asyncio.gather(*(self.crawl_theater(engine, theater_name)
+                                             for theater_name in self.theaters.keys()))
+        finally:
+            engine.close()
+            self.crawl_stats = engine.stats()
+        return results
+    
+    def crawl_serially(self) -> List:
+        """1ページずつ固定の間隔を空けてクローリング（従来の方式）"""
+        started = time.perf_counter()
+        results = []
+        for theater_name in self.theaters.keys():
+            movies = self.get_theater_movies(theater_name)
+            theater_results = []
+            for movie in movies:
+                theater_results.append((movie, self.get_movie_schedule(movie['movie_id'], theater_name)))
+                time.sleep(1)  # リクエスト間隔
+            results.append(theater_results)
+            time.sleep(2)  # 映画館間の間隔
+        self.crawl_stats = {"elapsed_seconds": round(time.perf_counter() - started, 2)}
+        return results
+    
+    def crawl_all_theaters(self, concurrent: bool = True, max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                           rate_per_host: float = DEFAULT_RATE_PER_HOST, burst: int = DEFAULT_BURST) -> Dict:
+        """全ての新宿エリア映画館をクローリング
+        
+        concurrent=True ではホストごとの速度制限（rate_per_host 件/秒、burst 件まで連続）の範囲で
+        映画館・映画のページを並行に取得する。結果と ID の振り方は従来の逐次取得と同じ。
+        前回の公開時から指紋が変わったページは changed_theaters / changed_schedules に記録する
+        """
         print("=== 映画.com 新宿エリア完全クローリング開始 ===")
         
+        self.load_page_fingerprints()
+        if self.http_cache:
+            self.http_cache.reset_stats()
+        if concurrent:
+            results = asyncio.run(self.crawl_concurrently(max_connections, rate_per_host, burst))
+        else:
+            results = self.crawl_serially()
+        
         all_data = {
             'theaters': [],
             'movies': [],
-            'showtimes': []
+            'showtimes': [],
+            'theater_movies': [],  # 映画館ごとに上映中の [theater_id, movie_id]
+            'changed_theaters': [],  # 映画一覧が変わった映画館の theater_id
+            'changed_schedules': []  # スケジュールが変わった [theater_id, movie_id]
         }
         
         theater_id_counter = 1
@@ -228,7 +299,7 @@ class CompleteEigaCrawler:
         showtime_id_counter = 1
         movie_title_to_id = {}
         
-        for theater_name in self.theaters.keys():
+        for theater_name, theater_results in zip(self.theaters.keys(), results):
             print(f"\\n--- {theater_name} ---")
             
             # 映画館情報
@@ -240,98 +311,181 @@ class CompleteEigaCrawler:
                 'eiga_com_id': self.theaters[theater_name]['id']
             }
             all_data['theaters'].append(theater_info)
+            if self.page_changes.get(self.theaters[theater_name]['url']):
+                all_data['changed_theaters'].append(theater_id_counter)
+            print(f"  映画数: {len(theater_results)}")
             
-            try:
-                # 映画館の映画一覧を取得
-                movies = self.get_theater_movies(theater_name)
-                print(f"  映画数: {len(movies)}")
+            for movie, schedule_info in theater_results:
+                # 映画情報を追加
+                if movie['title'] not in movie_title_to_id:
+                    movie_info = {
+                        'movie_id': movie_id_counter,
+                        'title': movie['title'],
+                        'duration': schedule_info['duration'],
+                        'image_url': movie['image_url'],
+                        'eiga_com_id': movie['movie_id']
+                    }
+                    all_data['movies'].append(movie_info)
+                    movie_title_to_id[movie['title']] = movie_id_counter
+                    movie_id_counter += 1
                 
-                for movie in movies:
-                    # 映画の詳細スケジュールを取得
-                    schedule_info = self.get_movie_schedule(movie['movie_id'], theater_name)
-                    
-                    # 映画情報を追加
-                    if movie['title'] not in movie_title_to_id:
-                        movie_info = {
-                            'movie_id': movie_id_counter,
-                            'title': movie['title'],
-                            'duration': schedule_info['duration'],
-                            'image_url': movie['image_url'],
-                            'eiga_com_id': movie['movie_id']
-                        }
-                        all_data['movies'].append(movie_info)
-                        movie_title_to_id[movie['title']] = movie_id_counter
-                        movie_id_counter += 1
-                    
-                    # 上映時間を追加
-                    current_movie_id = movie_title_to_id[movie['title']]
-                    for showtime in schedule_info['showtimes']:
-                        showtime_info = {
-                            'showtime_id': showtime_id_counter,
-                            'movie_id': current_movie_id,
-                            'theater_id': theater_id_counter,
-                            'showtime_date': showtime['date'],
-                            'start_time': showtime['start_time'],
-                            'end_time': showtime['end_time'],
-                            'screen_number': showtime['screen'],
-                            'price': showtime['price']
-                        }
-                        all_data['showtimes'].append(showtime_info)
-                        showtime_id_counter += 1
-                    
-                    print(f"    {movie['title']}: {len(schedule_info['showtimes'])}回上映")
-                    time.sleep(1)  # リクエスト間隔
+                # 上映時間を追加
+                current_movie_id = movie_title_to_id[movie['title']]
+                all_data['theater_movies'].append([theater_id_counter, current_movie_id])
+                if self.page_changes.get(self.movie_schedule_url(movie['movie_id'], theater_name)):
+                    all_data['changed_schedules'].append([theater_id_counter, current_movie_id])
+                for showtime in schedule_info['showtimes']:
+                    showtime_info = {
+                        'showtime_id': showtime_id_counter,
+                        'movie_id': current_movie_id,
+                        'theater_id': theater_id_counter,
+                        'showtime_date': showtime['date'],
+                        'start_time': showtime['start_time'],
+                        'end_time': showtime['end_time'],
+                        'screen_number': showtime['screen'],
+                        'price': showtime['price']
+                    }
+                    all_data['showtimes'].append(showtime_info)
+                    showtime_id_counter += 1
                 
-            except Exception as e:
-                print(f"  Error processing {theater_name}: {e}")
+                print(f"    {movie['title']}: {len(schedule_info['showtimes'])}回上映")
             
             theater_id_counter += 1
-            time.sleep(2)  # 映画館間の間隔
         
+        changed_pages = sum(1 for changed in self.page_changes.values() if changed)
+        self.crawl_stats['pages_parsed'] = changed_pages
+        self.crawl_stats['pages_unchanged'] = len(self.page_changes) - changed_pages
+        self.crawl_stats['parse_ms_per_page'] = round(self.parse_seconds * 1000 / changed_pages, 2) if changed_pages else 0.0
+        print(f"ページの変更: 解析 {changed_pages}件, 変更なしで解析を省略 {len(self.page_changes) - changed_pages}件")
+        if self.http_cache:
+            self.crawl_stats['cache'] = cache_stats = self.http_cache.stats()
+            print(f"HTTPキャッシュ: ヒット率 {cache_stats['hit_rate']}% ({cache_stats['hits']}/{cache_stats['requests']}件), "
+                  f"転送 {cache_stats['bytes_downloaded']}バイト, 節約 {cache_stats['bytes_saved']}バイト")
+        if self.replay_adapter:
+            self.crawl_stats['replay'] = self.replay_adapter.stats()
+        print(f"クローリング時間: {self.crawl_stats['elapsed_seconds']}秒 {self.crawl_stats}")
         return all_data
     
-    def update_database(self, crawled_data: Dict):
-        """データベースを更新"""
+    def update_database(self, crawled_data: Dict) -> Optional[int]:
+        """データベースを更新（ステージングDBで作成・検証してから1トランザクションで公開）
+        
+        ページが変わった映画館・映画の分だけ差分を書き込む。変わったページがなければ何もしない。
+        changed_theaters / changed_schedules のないデータ（古い JSON など）は全ページを変更ありとみなす
+        """
         print("\\n=== データベース更新開始 ===")
         
-        with DatabaseManager() as db:
+        theater_ids = [theater['theater_id'] for theater in crawled_data['theaters']]
+        showtime_groups = {}
+        for showtime in crawled_data['showtimes']:
+            showtime_groups.setdefault((showtime['theater_id'], showtime['movie_id']), []).append(showtime)
+        
+        if 'changed_schedules' in crawled_data:
+            changed_theaters = set(crawled_data['changed_theaters'])
+            changed_schedules = {tuple(key) for key in crawled_data['changed_schedules']}
+        else:
+            changed_theaters = set(theater_ids)
+            changed_schedules = set(showtime_groups)
+        if not changed_theaters and not changed_schedules and not self.changed_fingerprints:
+            print("変更されたページがないため更新をスキップしました")
+            return None
+        
+        publisher = DatasetPublisher(self.db_path)
+        with publisher.staging() as db:
             cursor = db.connection.cursor()
             
-            # 既存の新宿エリアデータを削除
-            cursor.execute('DELETE FROM theaters WHERE area = "shinjuku"')
-            cursor.execute('DELETE FROM theater_distances')
-            
-            # 映画館データを挿入
+            # 映画館データ: 名前で既存の映画館に対応付け、新しい映画館だけ挿入
+            # （クローリング時の theater_id は取得順の番号なので、既存の行の ID としては使わない）
+            theater_names = {}
+            for name, theater_id in cursor.execute('SELECT name, theater_id FROM theaters ORDER BY theater_id'):
+                theater_names.setdefault(name, theater_id)
+            db_theater_ids = {}  # クローリング時の theater_id → DB の theater_id
             for theater in crawled_data['theaters']:
-                cursor.execute('''
-                    INSERT OR REPLACE INTO theaters (theater_id, name, address, area, screen_count)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (theater['theater_id'], theater['name'], theater['address'], theater['area'], 10))
+                theater_id = theater_names.get(theater['name'])
+                if theater_id is None:
+                    cursor.execute('INSERT INTO theaters (name, address, area, screens) VALUES (?, ?, ?, ?)',
+                                   (theater['name'], theater['address'], theater['area'], 10))
+                    theater_id = theater_names[theater['name']] = cursor.lastrowid
+                db_theater_ids[theater['theater_id']] = theater_id
             
             print(f"映画館データ: {len(crawled_data['theaters'])}件")
             
-            # 映画データを挿入
+            # 映画データ: タイトルで既存の映画に対応付け、新しい映画だけ挿入
+            movie_ids = {}
+            for title, movie_id in cursor.execute('SELECT title, movie_id FROM movies ORDER BY movie_id'):
+                movie_ids.setdefault(title, movie_id)
+            db_movie_ids = {}  # クローリング時の movie_id → DB の movie_id
             for movie in crawled_data['movies']:
-                cursor.execute('''
-                    INSERT OR REPLACE INTO movies (movie_id, title, duration, image_url)
-                    VALUES (?, ?, ?, ?)
-                ''', (movie['movie_id'], movie['title'], movie['duration'], movie['image_url']))
+                movie_id = movie_ids.get(movie['title'])
+                if movie_id is None:
+                    cursor.execute('INSERT INTO movies (title, duration, image_url) VALUES (?, ?, ?)',
+                                   (movie['title'], movie['duration'], movie['image_url']))
+                    movie_id = movie_ids[movie['title']] = cursor.lastrowid
+                else:
+                    cursor.execute('''
+                        UPDATE movies SET duration = ?, image_url = ?
+                        WHERE movie_id = ? AND (duration IS NOT ? OR image_url IS NOT ?)
+                    ''', (movie['duration'], movie['image_url'], movie_id, movie['duration'], movie['image_url']))
+                db_movie_ids[movie['movie_id']] = movie_id
             
             print(f"映画データ: {len(crawled_data['movies'])}件")
             
-            # 上映時間データを挿入
-            for showtime in crawled_data['showtimes']:
-                cursor.execute('''
-                    INSERT OR REPLACE INTO showtimes (showtime_id, movie_id, theater_id, showtime_date, start_time, end_time, screen_number, price)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (showtime['showtime_id'], showtime['movie_id'], showtime['theater_id'], 
-                      showtime['showtime_date'], showtime['start_time'], showtime['end_time'], 
-                      showtime['screen_number'], showtime['price']))
+            # 映画一覧が変わった映画館: 上映されなくなった映画の上映を削除
+            deleted = 0
+            theater_movies = crawled_data.get('theater_movies', [list(key) for key in showtime_groups])
+            for theater_id in changed_theaters:
+                listed = [db_movie_ids[movie_id] for group_theater, movie_id in theater_movies if group_theater == theater_id]
+                placeholders = ", ".join("?" for _ in listed)
+                cursor.execute(f'DELETE FROM showtimes WHERE theater_id = ? AND movie_id NOT IN ({placeholders})',
+                               [db_theater_ids[theater_id]] + listed)
+                deleted += cursor.rowcount
+            
+            # スケジュールが変わった映画: 既存の上映との差分だけ書き込む
+            inserted = updated = 0
+            for theater_id, movie_id in changed_schedules:
+                db_theater_id = db_theater_ids[theater_id]
+                db_movie_id = db_movie_ids[movie_id]
+                existing = {}
+                for showtime_id, show_date, start_time, screen_number, end_time, price in cursor.execute('''
+                    SELECT showtime_id, show_date, start_time, screen_number, end_time, price
+                    FROM showtimes WHERE theater_id = ? AND movie_id = ?
+                ''', (db_theater_id, db_movie_id)).fetchall():
+                    existing[(show_date, start_time, screen_number)] = (showtime_id, end_time, price)
+                
+                for showtime in showtime_groups.get((theater_id, movie_id), []):
+                    key = (showtime['showtime_date'], showtime['start_time'], showtime['screen_number'])
+                    current = existing.pop(key, None)
+                    if current is not None:
+                        showtime_id, end_time, price = current
+                        if (end_time, price) == (showtime['end_time'], showtime['price']):
+                            continue
+                        cursor.execute('DELETE FROM showtimes WHERE showtime_id = ?', (showtime_id,))
+                        updated += 1
+                    else:
+                        inserted += 1
+                    # 終了は "25:10" 形式なので上映日0時からの分にそのまま変換できる
+                    start_min = time_to_minutes(showtime['start_time'])
+                    cursor.execute('''
+                        INSERT OR REPLACE INTO showtimes (movie_id, theater_id, show_date, start_time, end_time, start_min, end_min, screen_number, price)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (db_movie_id, db_theater_id, showtime['showtime_date'], showtime['start_time'],
+                          showtime['end_time'], start_min, end_minutes(start_min, showtime['end_time']),
+                          showtime['screen_number'], showtime['price']))
+                
+                # 今回のページにない上映を削除
+                for showtime_id, _, _ in existing.values():
+                    cursor.execute('DELETE FROM showtimes WHERE showtime_id = ?', (showtime_id,))
+                    deleted += 1
             
-            print(f"上映時間データ: {len(crawled_data['showtimes'])}件")
+            print(f"上映時間データ: 追加 {inserted}件, 更新 {updated}件, 削除 {deleted}件"
+                  f"（変更のあったスケジュール {len(changed_schedules)}件）")
             
+            db.save_page_fingerprints(self.changed_fingerprints)
             db.connection.commit()
-            print("✅ データベース更新完了")
+        
+        # 検証してから公開（データセットのバージョンも同じトランザクションで更新）
+        dataset_version = publisher.publish()
+        print(f"✅ データベース更新完了（データバージョン: {dataset_version}）")
+        return dataset_version
     
     def find_nakayama_kyoto(self) -> Optional[Dict]:
         """「中山教頭の人生テスト」の正確な情報を検索"""
@@ -373,6 +527,13 @@ class CompleteEigaCrawler:
 def main():
     crawler = CompleteEigaCrawler()
     
+    # CRAWL_REPLAY で記録済みのコーパスからオフラインで再生、CRAWL_RECORD で取得した応答を記録
+    corpus = None
+    if DEFAULT_REPLAY_CORPUS:
+        crawler.replay_corpus(PageCorpus.load(DEFAULT_REPLAY_CORPUS), DEFAULT_REPLAY_LATENCY)
+    elif DEFAULT_RECORD_CORPUS:
+        corpus = crawler.record_corpus(PageCorpus(DEFAULT_RECORD_CORPUS))
+    
     # 1. 「中山教頭の人生テスト」の正確な情報を検索
     nakayama_info = crawler.find_nakayama_kyoto()
     
@@ -392,6 +553,9 @@ def main():
     print("\\n=== 全映画館クローリング開始 ===")
     crawled_data = crawler.crawl_all_theaters()
     
+    if corpus is not None:
+        corpus.save()
+    
     # 3. データベースを更新
     crawler.update_database(crawled_data)
     
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+SQLite接続プール - プロセス全体で接続を使い回し、同じスレッドには同じ接続を返す
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# プールの既定サイズ（環境変数 DB_POOL_SIZE で変更可能）
+DEFAULT_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+
+# 接続時に適用するストレージ設定
+# WAL にすると読み取りとクローリング取り込みの書き込みが互いにブロックしない
+STORAGE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -16000,  # 負の値は KiB 単位（約16MB）
+    "temp_store": "MEMORY",
+}
+
+# ジャーナルモードはDBファイルの設定なので読み取り専用接続では変更しない
+READ_ONLY_SKIPPED_PRAGMAS = ("journal_mode",)
+
+class ConnectionPool:
+    """1つのDBファイルに対する接続プール
+    
+    - 同じスレッド内の入れ子の取得には同じ接続を返す（参照カウント）
+    - 返却された接続は、次に同じスレッドが取得した時に優先して再利用する
+    - 上限に達している場合は返却を待つ（待ち時間は統計に記録）
+    - own_thread_connection() したスレッドは返却後も接続をプールに戻さず持ち続ける
+    """
+    
+    def __init__(self, db_path: str, max_size: int = DEFAULT_POOL_SIZE, timeout: float = 30.0,
+                 setup: Optional[Callable[[sqlite3.Connection], None]] = None,
+                 read_only: bool = False, pragmas: Dict = None):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.read_only = read_only
+        self.pragmas = STORAGE_PRAGMAS if pragmas is None else pragmas
+        self._setup = setup
+        self._condition = threading.Condition()
+        self._idle: List[sqlite3.Connection] = []
+        self._generation: Dict[int, int] = {}  # id(接続) → 作成時の世代
+        self._current_generation = 0
+        self._local = threading.local()
+        self._owners: Dict[threading.Thread, sqlite3.Connection] = {}  # 接続を専有しているスレッド
+        self.open_connections = 0
+        self.checkouts = 0
+        self.nested_checkouts = 0
+        self.thread_reuses = 0
+        self.waits = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+    
+    def _create(self) -> sqlite3.Connection:
+        """新しい接続を作成（スレッド間で受け渡すので check_same_thread は無効）"""
+        if self.read_only:
+            # mode=ro の URI 接続（書き込みはできない）
+            uri = Path(os.path.abspath(self.db_path)).as_uri() + "?mode=ro"
+            connection = sqlite3.connect(uri, uri=True, timeout=self.timeout, check_same_thread=False)
+        else:
+            connection = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        self._apply_pragmas(connection)
+        if self._setup:
+            self._setup(connection)
+        mode = "read-only" if self.read_only else "read-write"
+        logger.info(f"Pool connection opened: {self.db_path} [{mode}] ({self.open_connections}/{self.max_size})")
+        return connection
+    
+    def _apply_pragmas(self, connection: sqlite3.Connection):
+        """ストレージ設定を適用"""
+        for name, value in self.pragmas.items():
+            if self.read_only and name in READ_ONLY_SKIPPED_PRAGMAS:
+                continue
+            try:
+                connection.execute(f"PRAGMA {name} = {value}")
+            except sqlite3.Error as e:
+                logger.warning(f"PRAGMA {name} = {value} failed: {e}")
+    
+    def acquire(self) -> sqlite3.Connection:
+        """接続を取得（同じスレッドで取得中ならその接続を返す）"""
+        local = self._local
+        if getattr(local, 'depth', 0) > 0:
+            local.depth += 1
+            with self._condition:
+                self.nested_checkouts += 1
+            return local.connection
+        
+        owned = getattr(local, 'owned', None)
+        if owned is not None:
+            with self._condition:
+                if self._generation.get(id(owned)) == self._current_generation:
+                    self.checkouts += 1
+                    self.thread_reuses += 1
+                    local.connection = owned
+                    local.depth = 1
+                    return owned
+                # reset 後の古い接続は閉じて取り直す
+                self._owners.pop(threading.current_thread(), None)
+                self._close(owned)
+                self._condition.notify()
+            local.owned = None
+        
+        preferred = getattr(local, 'last_connection', None)
+        connection = None
+        create = False
+        with self._condition:
+            started = None
+            while True:
+                if self._idle:
+                    # 前回このスレッドが使った接続が空いていればそれを優先
+                    if preferred is not None and preferred in self._idle:
+                        self._idle.remove(preferred)
+                        connection = preferred
+                        self.thread_reuses += 1
+                    else:
+                        connection = self._idle.pop()
+                    break
+                if self.open_connections < self.max_size:
+                    self.open_connections += 1
+                    create = True
+                    break
+                if started is None:
+                    started = time.perf_counter()
+                    self.waits += 1
+                remaining = self.timeout - (time.perf_counter() - started)
+                if remaining <= 0:
+                    raise TimeoutError(f"Connection pool exhausted: {self.db_path} ({self.max_size} connections)")
+                self._condition.wait(remaining)
+            if started is not None:
+                waited = time.perf_counter() - started
+                self.total_wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            self.checkouts += 1
+            generation = self._current_generation
+        
+        if create:
+            try:
+                connection = self._create()
+            except Exception:
+                with self._condition:
+                    self.open_connections -= 1
+                    self._condition.notify()
+                raise
+            with self._condition:
+                self._generation[id(connection)] = generation
+        
+        local.connection = connection
+        local.last_connection = connection
+        local.depth = 1
+        if getattr(local, 'owner', False):
+            local.owned = connection
+            with self._condition:
+                self._owners[threading.current_thread()] = connection
+        return connection
+    
+    def release(self, connection: sqlite3.Connection):
+        """接続を返却（最も外側の返却時のみプールに戻す）"""
+        local = self._local
+        if getattr(local, 'depth', 0) > 1 and local.connection is connection:
+            local.depth -= 1
+            return
+        local.depth = 0
+        local.connection = None
+        
+        # コミットされていない変更は従来の close と同じく破棄する
+        broken = False
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+        except sqlite3.Error as e:
+            logger.warning(f"Discarding pooled connection after rollback failure: {e}")
+            broken = True
+        
+        owner = getattr(local, 'owner', False)
+        with self._condition:
+            if broken or self._generation.get(id(connection)) != self._current_generation:
+                # 壊れた接続・reset 後に返却された古い接続は閉じる
+                self._close(connection)
+                if owner:
+                    self._owners.pop(threading.current_thread(), None)
+                    local.owned = None
+            elif owner:
+                # 専有スレッドは次の取得まで同じ接続を持ち続ける
+                return
+            else:
+                self._idle.append(connection)
+            self._condition.notify()
+    
+    def _close(self, connection: sqlite3.Connection):
+        """接続を閉じて数を減らす（ロック保持中に呼ぶ）"""
+        self._generation.pop(id(connection), None)
+        self.open_connections -= 1
+        try:
+            connection.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to close pooled connection: {e}")
+    
+    def own_thread_connection(self):
+        """現在のスレッドが接続を専有する（DB処理専用スレッドの初期化時に呼ぶ）"""
+        self._local.owner = True
+    
+    def close_orphaned(self):
+        """終了したスレッドが専有していた接続を閉じる"""
+        with self._condition:
+            for thread, connection in list(self._owners.items()):
+                if not thread.is_alive():
+                    del self._owners[thread]
+                    self._close(connection)
+            self._condition.notify_all()
+    
+    def reset(self):
+        """空き接続を閉じ、使用中・専有中の接続も返却時・次の取得時に閉じる（DBファイル差し替え後などに使用）"""
+        with self._condition:
+            self._current_generation += 1
+            while self._idle:
+                self._close(self._idle.pop())
+            self._condition.notify_all()
+    
+    def stats(self) -> Dict:
+        """プールの統計（取得回数・待ち時間・接続数）"""
+        with self._condition:
+            return {
+                "db_path": self.db_path,
+                "read_only": self.read_only,
+                "max_size": self.max_size,
+                "open_connections": self.open_connections,
+                "idle_connections": len(self._idle),
+                "in_use_connections": self.open_connections - len(self._idle),
+                "owned_connections": len(self._owners),
+                "checkouts": self.checkouts,
+                "nested_checkouts": self.nested_checkouts,
+                "thread_reuses": self.thread_reuses,
+                "waits": self.waits,
+                "total_wait_ms": round(self.total_wait_seconds * 1000, 2),
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 2),
+                "avg_wait_ms": round(self.total_wait_seconds * 1000 / self.waits, 2) if self.waits else 0.0
+            }
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_path: str, setup: Optional[Callable[[sqlite3.Connection], None]] = None,
+             read_only: bool = False) -> ConnectionPool:
+    """DBファイル・読み書き種別ごとのプロセス共通プールを取得（なければ作成）"""
+    key = (os.path.abspath(db_path), read_only)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ConnectionPool(db_path, setup=setup, read_only=read_only)
+    return pool
+
+def configure_pool(db_path: str, max_size: int = None, timeout: float = None,
+                   pragmas: Dict = None, read_only: bool = False) -> ConnectionPool:
+    """プールのサイズ・待ち時間の上限・ストレージ設定を変更（ストレージ設定は新しい接続から適用）"""
+    pool = get_pool(db_path, read_only=read_only)
+    with pool._condition:
+        if max_size is not None:
+            pool.max_size = max_size
+        if timeout is not None:
+            pool.timeout = timeout
+        if pragmas is not None:
+            pool.pragmas = pragmas
+        pool._condition.notify_all()
+    return pool
+
+def get_pool_stats() -> List[Dict]:
+    """全プールの統計を取得"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+クローリングエンジン - asyncio でページ取得を並行実行し、ホストごとのトークンバケットで間隔を制御
+
+HTTP は requests.Session をそのまま使い、上限付きのキープアライブ接続プールと
+同数の取得スレッドで実行する（イベントループは取得の待ち合わせと速度制限だけを行う）
+"""
+
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Optional
+from urllib.parse import urlsplit
+import logging
+
+import requests
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 同時接続数・ホストごとの速度制限の既定値（環境変数で変更可能）
+DEFAULT_MAX_CONNECTIONS = int(os.environ.get("CRAWL_MAX_CONNECTIONS", "4"))
+DEFAULT_RATE_PER_HOST = float(os.environ.get("CRAWL_RATE_PER_HOST", "2.0"))  # リクエスト/秒
+DEFAULT_BURST = int(os.environ.get("CRAWL_BURST", "4"))
+
+class TokenBucket:
+    """トークンバケット（rate 件/秒で補充、burst 件まで連続で取得できる）
+    
+    clock・sleep は時刻の取得と待ち合わせ（テストでは実際には待たない時計に差し替える）
+    """
+    
+    def __init__(self, rate: float, burst: int, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], Awaitable] = asyncio.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = float(burst)
+        self.updated = clock()
+        self._lock = asyncio.Lock()
+        self.acquired = 0
+        self.waits = 0
+        self.total_wait_seconds = 0.0
+    
+    def _refill(self):
+        """経過時間分のトークンを補充"""
+        now = self.clock()
+        self.tokens = min(float(self.burst), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    async def acquire(self):
+        """トークンを1つ取得（足りなければ補充まで待つ。待つ順番は到着順）"""
+        async with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                wait = (1 - self.tokens) / self.rate
+                self.waits += 1
+                self.total_wait_seconds += wait
+                await self.sleep(wait)
+                self._refill()
+            self.tokens -= 1
+            self.acquired += 1
+
+class CrawlEngine:
+    """ホストごとの速度制限付きで requests.Session の取得を並行実行する
+    
+    使い方:
+        engine = CrawlEngine(session)
+        response = await engine.fetch(url)   # asyncio.gather で並行に呼ぶ
+        engine.close()
+    """
+    
+    def __init__(self, session: requests.Session, max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                 rate_per_host: float = DEFAULT_RATE_PER_HOST, burst: int = DEFAULT_BURST):
+        self.session = session
+        self.max_connections = max_connections
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        
+        # 取得スレッド数と同じ大きさのキープアライブ接続プール（空きがなければ返却を待つ）
+        # HTTPキャッシュなどマウント済みのアダプターはそのまま使い、プールの大きさだけ変える
+        for prefix in ("http://", "https://"):
+            session.get_adapter(prefix).init_poolmanager(max_connections, max_connections, block=True)
+        
+        self._executor = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix="crawl")
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.bytes_received = 0
+        self.fetch_seconds = 0.0
+        self.started = time.perf_counter()
+    
+    def _bucket(self, url: str) -> TokenBucket:
+        """URL のホストのトークンバケット（なければ作成）"""
+        host = urlsplit(url).netloc
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = TokenBucket(self.rate_per_host, self.burst)
+        return bucket
+    
+    def _get(self, url: str, timeout: float) -> requests.Response:
+        """取得スレッドでページを取得して統計を更新"""
+        started = time.perf_counter()
+        try:
+            response = self.session.get(url, timeout=timeout)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        with self._lock:
+            self.requests += 1
+            self.bytes_received += len(response.content)
+            self.fetch_seconds += time.perf_counter() - started
+        return response
+    
+    async def fetch(self, url: str, timeout: float = 15) -> requests.Response:
+        """空き接続とホストのトークンを待ってからページを取得"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_connections)
+        # 接続の空きを先に待つので、取得スレッドの待ち行列でトークンを無駄にしない
+        async with self._slots:
+            await self._bucket(url).acquire()
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(self._get, url, timeout))
+    
+    def close(self):
+        """取得スレッドを止める"""
+        self._executor.shutdown(wait=True)
+    
+    def stats(self) -> Dict:
+        """取得件数・転送量・速度制限の待ち時間と経過時間の統計"""
+        elapsed = time.perf_counter() - self.started
+        with self._lock:
+            return {
+                "max_connections": self.max_connections,
+                "rate_per_host": self.rate_per_host,
+                "burst": self.burst,
+                "requests": self.requests,
+                "errors": self.errors,
+                "bytes_received": self.bytes_received,
+                "elapsed_seconds": round(elapsed, 2),
+                "requests_per_second": round(self.requests / elapsed, 2) if elapsed else 0.0,
+                "avg_fetch_ms": round(self.fetch_seconds * 1000 / self.requests, 1) if self.requests else 0.0,
+                "rate_limit_waits": sum(bucket.waits for bucket in self._buckets.values()),
+                "rate_limit_wait_seconds": round(sum(bucket.total_wait_seconds for bucket in self._buckets.values()), 2)
+            }
@@ -7,33 +7,226 @@ import sqlite3
 import json
 import os
 import random
-from datetime import datetime, timedelta
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 import logging
+from schedule_time import time_to_minutes, minutes_to_time, end_minutes
+from connection_pool import get_pool
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# クローリング・インポートのたびに進めるデータセット全体のバージョン名
+DATASET_VERSION = 'dataset'
+
+# データの更新を検知するためのバージョン表（theater_distances は行の変更ごとにトリガーで進める）
+DATA_VERSIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS data_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+THEATER_DISTANCES_VERSION_TRIGGERS = tuple(f"""
+    CREATE TRIGGER IF NOT EXISTS bump_theater_distances_version_{event.lower()}
+        AFTER {event} ON theater_distances
+        BEGIN
+            UPDATE data_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE name = 'theater_distances';
+        END
+""" for event in ("INSERT", "UPDATE", "DELETE"))
+
+# 分単位カラムを指定せずに挿入された上映の start_min / end_min を埋めるトリガー
+FILL_SCHEDULE_MINUTES_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS fill_showtimes_minutes
+        AFTER INSERT ON showtimes
+        FOR EACH ROW
+        WHEN NEW.start_min IS NULL
+        BEGIN
+            UPDATE showtimes
+            SET start_min = CAST(substr(NEW.start_time, 1, instr(NEW.start_time, ':') - 1) AS INTEGER) * 60 +
+                            CAST(substr(NEW.start_time, instr(NEW.start_time, ':') + 1) AS INTEGER)
+            WHERE showtime_id = NEW.showtime_id;
+            UPDATE showtimes
+            SET end_min = COALESCE(
+                    CAST(substr(NEW.end_time, 1, instr(NEW.end_time, ':') - 1) AS INTEGER) * 60 +
+                    CAST(substr(NEW.end_time, instr(NEW.end_time, ':') + 1) AS INTEGER),
+                    start_min + COALESCE((SELECT duration FROM movies WHERE movie_id = NEW.movie_id), 120))
+            WHERE showtime_id = NEW.showtime_id;
+            UPDATE showtimes SET end_min = end_min + 1440
+            WHERE showtime_id = NEW.showtime_id AND end_min < start_min;
+        END
+"""
+
+# 検索・最適化用の非正規化テーブル（上映日・開始分の順に格納し、1日分を1回の範囲走査で読む）
+SHOWTIME_FLAT_TABLE = """
+    CREATE TABLE IF NOT EXISTS showtime_flat (
+        show_date DATE NOT NULL,
+        start_min INTEGER NOT NULL,
+        showtime_id INTEGER NOT NULL,
+        end_min INTEGER,
+        theater_id INTEGER NOT NULL,
+        movie_id INTEGER NOT NULL,
+        theater_name TEXT,
+        movie_title TEXT,
+        image_url TEXT,
+        duration INTEGER,
+        start_time TIME,
+        end_time TIME,
+        screen_number INTEGER,
+        price REAL,
+        PRIMARY KEY (show_date, start_min, showtime_id)
+    ) WITHOUT ROWID
+"""
+
+# showtime_flat の1行分を showtimes × theaters × movies から作る SELECT
+SHOWTIME_FLAT_SELECT = """
+    SELECT s.show_date, s.start_min, s.showtime_id, s.end_min, s.theater_id, s.movie_id,
+           t.name, m.title, m.image_url, COALESCE(m.duration, 120),
+           s.start_time, s.end_time, s.screen_number, s.price
+    FROM showtimes s
+    JOIN theaters t ON s.theater_id = t.theater_id
+    JOIN movies m ON s.movie_id = m.movie_id
+    WHERE s.start_min IS NOT NULL
+"""
+
+# クローリングしたページの指紋（スケジュール部分のハッシュ）と前回の解析結果
+PAGE_FINGERPRINTS_TABLE = """
+    CREATE TABLE IF NOT EXISTS page_fingerprints (
+        url TEXT PRIMARY KEY,
+        content_hash TEXT NOT NULL,
+        parsed TEXT NOT NULL,
+        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+# 元テーブルの変更を showtime_flat に反映するトリガー（変更された行の分だけ更新する）
+SHOWTIME_FLAT_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS showtime_flat_insert
+        AFTER INSERT ON showtimes
+        BEGIN
+            DELETE FROM showtime_flat WHERE showtime_id = NEW.showtime_id;
+            -- INSERT OR REPLACE で一意キーが重なって消えた上映（削除トリガーは動かない）も除く
+            DELETE FROM showtime_flat
+            WHERE show_date = NEW.show_date
+              AND start_min = COALESCE(NEW.start_min,
+                    CAST(substr(NEW.start_time, 1, instr(NEW.start_time, ':') - 1) AS INTEGER) * 60 +
+                    CAST(substr(NEW.start_time, instr(NEW.start_time, ':') + 1) AS INTEGER))
+              AND theater_id = NEW.theater_id AND showtime_id != NEW.showtime_id
+              AND NOT EXISTS (SELECT 1 FROM showtimes s WHERE s.showtime_id = showtime_flat.showtime_id);
+            INSERT INTO showtime_flat""" + SHOWTIME_FLAT_SELECT + """ AND s.showtime_id = NEW.showtime_id;
+        END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS showtime_flat_update
+        AFTER UPDATE OF show_date, start_min, end_min, theater_id, movie_id, start_time, end_time,
+                        screen_number, price ON showtimes
+        BEGIN
+            DELETE FROM showtime_flat WHERE showtime_id = OLD.showtime_id;
+            INSERT INTO showtime_flat""" + SHOWTIME_FLAT_SELECT + """ AND s.showtime_id = NEW.showtime_id;
+        END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS showtime_flat_delete
+        AFTER DELETE ON showtimes
+        BEGIN
+            DELETE FROM showtime_flat WHERE showtime_id = OLD.showtime_id;
+        END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS showtime_flat_theater_insert
+        AFTER INSERT ON theaters
+        BEGIN
+            DELETE FROM showtime_flat WHERE theater_id = NEW.theater_id;
+            INSERT INTO showtime_flat""" + SHOWTIME_FLAT_SELECT + """ AND s.theater_id = NEW.theater_id;
+        END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS showtime_flat_theater_update
+        AFTER UPDATE OF name ON theaters
+        BEGIN
+            UPDATE showtime_flat SET theater_name = NEW.name WHERE theater_id = NEW.theater_id;
+        END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS showtime_flat_theater_delete
+        AFTER DELETE ON theaters
+        BEGIN
+            DELETE FROM showtime_flat WHERE theater_id = OLD.theater_id;
+        END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS showtime_flat_movie_insert
+        AFTER INSERT ON movies
+        BEGIN
+            DELETE FROM showtime_flat WHERE movie_id = NEW.movie_id;
+            INSERT INTO showtime_flat""" + SHOWTIME_FLAT_SELECT + """ AND s.movie_id = NEW.movie_id;
+        END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS showtime_flat_movie_update
+        AFTER UPDATE OF title, image_url, duration ON movies
+        BEGIN
+            UPDATE showtime_flat SET movie_title = NEW.title, image_url = NEW.image_url,
+                                     duration = COALESCE(NEW.duration, 120)
+            WHERE movie_id = NEW.movie_id;
+        END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS showtime_flat_movie_delete
+        AFTER DELETE ON movies
+        BEGIN
+            DELETE FROM showtime_flat WHERE movie_id = OLD.movie_id;
+        END
+    """,
+)
+
+@dataclass
+class WriteBatch:
+    """DatabaseManager.batch() の状態と統計"""
+    max_rows: int = 1000
+    max_interval_ms: float = 500.0
+    pending_rows: int = 0
+    written_rows: int = 0
+    commits: int = 0
+    flushed_at: float = field(default_factory=time.monotonic)
+
 class DatabaseManager:
-    def __init__(self, db_path: str = "movie_optimization.db"):
+    # 分単位カラムの移行を済ませたDBのパス（プロセス内で1回だけ確認する）
+    _migrated_paths = set()
+    
+    def __init__(self, db_path: str = "movie_optimization.db", read_only: bool = False):
         self.db_path = db_path
+        self.read_only = read_only  # True の場合は mode=ro の読み取り専用接続を使う
         self.connection = None
-        
+        self._batch: Optional[WriteBatch] = None
+    
     def connect(self):
-        """データベース接続"""
+        """データベース接続（プロセス共通の接続プールから取得）"""
         try:
-            self.connection = sqlite3.connect(self.db_path)
-            self.connection.row_factory = sqlite3.Row
-            logger.info(f"Database connected: {self.db_path}")
+            if self.read_only and self.db_path not in DatabaseManager._migrated_paths:
+                # カラム追加などの移行は書き込み可能な接続で先に済ませる
+                with DatabaseManager(self.db_path):
+                    pass
+            self.connection = get_pool(self.db_path, read_only=self.read_only).acquire()
+            if not self.read_only and self.db_path not in DatabaseManager._migrated_paths:
+                self.migrate()
+            logger.debug(f"Database connected: {self.db_path}")
         except Exception as e:
             logger.error(f"Database connection failed: {e}")
+            self.disconnect()
             raise
     
     def disconnect(self):
-        """データベース切断"""
+        """データベース切断（接続はプールに返却）"""
         if self.connection:
-            self.connection.close()
-            logger.info("Database disconnected")
+            get_pool(self.db_path, read_only=self.read_only).release(self.connection)
+            self.connection = None
+            logger.debug("Database disconnected")
     
     def __enter__(self):
         """コンテキストマネージャー開始"""
@@ -44,6 +237,179 @@ class DatabaseManager:
         """コンテキストマネージャー終了"""
         self.disconnect()
     
+    @contextmanager
+    def batch(self, max_rows: int = 1000, max_interval_ms: float = 500.0):
+        """行ごとのコミットをまとめるバッチ書き込み
+        
+        ブロック内では add_showtime・get_or_create_* などがコミットせず、
+        max_rows 行または max_interval_ms ミリ秒ごとにまとめてコミットする。
+        挿入自体はその場で行うので生成されたIDもそのまま返る。例外時は未コミット分をロールバック
+        """
+        if self._batch is not None:
+            # 入れ子のバッチは外側に合流
+            yield self._batch
+            return
+        
+        self._batch = WriteBatch(max_rows=max_rows, max_interval_ms=max_interval_ms)
+        try:
+            yield self._batch
+            self.flush()
+        except Exception:
+            self.connection.rollback()
+            raise
+        finally:
+            self._batch = None
+    
+    @contextmanager
+    def snapshot(self):
+        """ブロック内の読み取りを1つの読み取りトランザクション（同じ時点のデータ）で行う
+        
+        すでにトランザクション中ならそのトランザクションに合流する
+        """
+        if self.connection.in_transaction:
+            yield self
+            return
+        self.connection.execute("BEGIN")
+        try:
+            yield self
+        finally:
+            self.connection.commit()
+    
+    def flush(self):
+        """保留中の書き込みをコミット"""
+        self.connection.commit()
+        batch = self._batch
+        if batch is not None:
+            batch.written_rows += batch.pending_rows
+            batch.pending_rows = 0
+            batch.commits += 1
+            batch.flushed_at = time.monotonic()
+    
+    def _commit_row(self):
+        """1行書き込んだ後のコミット（バッチ中は件数・経過時間が上限に達した時だけ）"""
+        batch = self._batch
+        if batch is None:
+            self.connection.commit()
+            return
+        batch.pending_rows += 1
+        if (batch.pending_rows >= batch.max_rows or
+                (time.monotonic() - batch.flushed_at) * 1000 >= batch.max_interval_ms):
+            self.flush()
+    
+    def migrate(self):
+        """既存DBのスキーマを移行（プロセス内でDBごとに1回だけ）"""
+        if not self.ensure_schedule_minutes():
+            return  # テーブル未作成（セットアップ前）
+        self.ensure_data_versions()
+        self.ensure_showtime_flat()
+        self.connection.execute(PAGE_FINGERPRINTS_TABLE)
+        self.connection.commit()
+        DatabaseManager._migrated_paths.add(self.db_path)
+    
+    def ensure_schedule_minutes(self) -> bool:
+        """showtimes に start_min / end_min カラムがなければ追加して既存行を埋める（テーブルがなければ False）"""
+        cursor = self.connection.cursor()
+        cursor.execute("PRAGMA table_info(showtimes)")
+        columns = {row[1] for row in cursor.fetchall()}
+        if not columns:
+            return False
+        
+        if 'start_min' not in columns:
+            cursor.execute("ALTER TABLE showtimes ADD COLUMN start_min INTEGER")
+        if 'end_min' not in columns:
+            cursor.execute("ALTER TABLE showtimes ADD COLUMN end_min INTEGER")
+        
+        # "HH:MM" から分を計算（終了が開始より前なら日付をまたいだとみなす）
+        cursor.execute("""
+            UPDATE showtimes
+            SET start_min = CAST(substr(start_time, 1, instr(start_time, ':') - 1) AS INTEGER) * 60 +
+                            CAST(substr(start_time, instr(start_time, ':') + 1) AS INTEGER)
+            WHERE start_min IS NULL
+        """)
+        filled = cursor.rowcount
+        cursor.execute("""
+            UPDATE showtimes
+            SET end_min = CASE
+                WHEN end_time IS NULL THEN
+                    start_min + COALESCE((SELECT duration FROM movies WHERE movies.movie_id = showtimes.movie_id), 120)
+                ELSE CAST(substr(end_time, 1, instr(end_time, ':') - 1) AS INTEGER) * 60 +
+                     CAST(substr(end_time, instr(end_time, ':') + 1) AS INTEGER)
+            END
+            WHERE end_min IS NULL
+        """)
+        # "01:10" のように折り返して保存された終了時刻は翌日扱い
+        cursor.execute("UPDATE showtimes SET end_min = end_min + 1440 WHERE end_min < start_min")
+        if filled:
+            logger.info(f"Filled schedule minutes for {filled} showtimes")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_showtimes_date_start_min ON showtimes(show_date, start_min, end_min)")
+        cursor.execute(FILL_SCHEDULE_MINUTES_TRIGGER)
+        self.connection.commit()
+        return True
+    
+    def ensure_data_versions(self):
+        """data_versions テーブル・初期行と、theater_distances の変更でバージョンを進めるトリガーがなければ作成"""
+        cursor = self.connection.cursor()
+        cursor.execute(DATA_VERSIONS_TABLE)
+        cursor.executemany("INSERT OR IGNORE INTO data_versions (name, version) VALUES (?, 0)",
+                           [('theater_distances',), (DATASET_VERSION,)])
+        for trigger in THEATER_DISTANCES_VERSION_TRIGGERS:
+            cursor.execute(trigger)
+        self.connection.commit()
+    
+    def ensure_showtime_flat(self):
+        """showtime_flat テーブルとトリガーがなければ作成して全件を構築"""
+        cursor = self.connection.cursor()
+        # トリガーがない間（スキーマ作成直後・ステージング）の変更は反映されていないので作り直す
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'showtime_flat_insert'")
+        stale = cursor.fetchone() is None
+        cursor.execute(SHOWTIME_FLAT_TABLE)
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_showtime_flat_id ON showtime_flat(showtime_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_showtime_flat_theater ON showtime_flat(theater_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_showtime_flat_movie ON showtime_flat(movie_id)")
+        self.create_showtime_flat_triggers()
+        if stale:
+            self.rebuild_showtime_flat()
+        self.connection.commit()
+    
+    def create_showtime_flat_triggers(self):
+        """showtime_flat を元テーブルに追従させるトリガーを作成（コミットは呼び出し側）"""
+        cursor = self.connection.cursor()
+        for trigger in SHOWTIME_FLAT_TRIGGERS:
+            cursor.execute(trigger)
+    
+    def drop_showtime_flat_triggers(self):
+        """showtime_flat のトリガーを削除（大量の入れ替え後に rebuild_showtime_flat する場合。コミットは呼び出し側）"""
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'showtime\\_flat\\_%' ESCAPE '\\'")
+        for (name,) in cursor.fetchall():
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+    
+    def rebuild_showtime_flat(self, show_date: str = None) -> int:
+        """showtime_flat を元テーブルから作り直す（日付指定でその日だけ。コミットは呼び出し側）"""
+        cursor = self.connection.cursor()
+        if show_date:
+            cursor.execute("DELETE FROM showtime_flat WHERE show_date = ?", (show_date,))
+            cursor.execute("INSERT INTO showtime_flat" + SHOWTIME_FLAT_SELECT + " AND s.show_date = ?", (show_date,))
+        else:
+            cursor.execute("DELETE FROM showtime_flat")
+            cursor.execute("INSERT INTO showtime_flat" + SHOWTIME_FLAT_SELECT)
+        rows = cursor.rowcount
+        logger.info(f"Rebuilt showtime_flat for {show_date or 'all dates'}: {rows} showtimes")
+        return rows
+    
+    def refresh_showtime_flat_movies(self) -> int:
+        """showtime_flat の映画タイトル・画像・上映時間を movies に合わせる（変わった行だけ更新。コミットは呼び出し側）"""
+        cursor = self.connection.cursor()
+        cursor.execute("""
+            UPDATE showtime_flat
+            SET movie_title = m.title, image_url = m.image_url, duration = COALESCE(m.duration, 120)
+            FROM movies m
+            WHERE showtime_flat.movie_id = m.movie_id
+              AND (showtime_flat.movie_title IS NOT m.title OR showtime_flat.image_url IS NOT m.image_url
+                   OR showtime_flat.duration IS NOT COALESCE(m.duration, 120))
+        """)
+        return cursor.rowcount
+    
     def get_theaters(self) -> List[Dict]:
         """映画館一覧を取得"""
         cursor = self.connection.cursor()
@@ -73,45 +439,65 @@ class DatabaseManager:
         result = cursor.fetchone()
         return dict(result) if result else None
     
-    def get_showtimes(self, date: str = None, theater_id: int = None, movie_id: int = None) -> List[Dict]:
-        """上映スケジュールを取得"""
-        cursor = self.connection.cursor()
-        query = """
-            SELECT s.*, t.name as theater_name, m.title as movie_title, m.image_url
-            FROM showtimes s
-            JOIN theaters t ON s.theater_id = t.theater_id
-            JOIN movies m ON s.movie_id = m.movie_id
-            WHERE 1=1
+    def get_showtimes(self, date: str = None, theater_id: int = None, movie_id: int = None,
+                      start_min_from: int = None, end_min_to: int = None) -> List[Dict]:
+        """上映スケジュールを取得（start_min_from / end_min_to で上映時間帯を分単位で絞り込み）
+        
+        映画館名・タイトル・上映時間を持つ showtime_flat を読むので JOIN はしない
         """
+        cursor = self.connection.cursor()
+        query = "SELECT * FROM showtime_flat WHERE 1=1"
         params = []
         
         if date:
-            query += " AND s.show_date = ?"
+            query += " AND show_date = ?"
             params.append(date)
         
         if theater_id:
-            query += " AND s.theater_id = ?"
+            query += " AND theater_id = ?"
             params.append(theater_id)
         
         if movie_id:
-            query += " AND s.movie_id = ?"
+            query += " AND movie_id = ?"
             params.append(movie_id)
         
-        query += " ORDER BY s.show_date, s.start_time"
+        if start_min_from is not None:
+            query += " AND start_min >= ?"
+            params.append(start_min_from)
+        
+        if end_min_to is not None:
+            query += " AND end_min <= ?"
+            params.append(end_min_to)
+        
+        query += " ORDER BY show_date, start_min, showtime_id"
         
         cursor.execute(query, params)
         return [dict(row) for row in cursor.fetchall()]
     
+    def get_schedule_snapshot(self, date: str) -> List[Dict]:
+        """最適化用の1日分スケジュールを showtime_flat の範囲走査1回で取得（開始・終了は分単位）"""
+        cursor = self.connection.cursor()
+        cursor.execute("""
+            SELECT * FROM showtime_flat
+            WHERE show_date = ?
+            ORDER BY start_min, showtime_id
+        """, (date,))
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def get_showtime_date(self, showtime_id: int) -> Optional[str]:
+        """上映IDから上映日を取得"""
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT show_date FROM showtimes WHERE showtime_id = ?", (showtime_id,))
+        result = cursor.fetchone()
+        return result[0] if result else None
+    
     def get_19h_showtimes(self, date: str = "2025-07-14") -> List[Dict]:
         """19時台の上映スケジュールを取得"""
         cursor = self.connection.cursor()
         cursor.execute("""
-            SELECT s.*, t.name as theater_name, m.title as movie_title
-            FROM showtimes s
-            JOIN theaters t ON s.theater_id = t.theater_id
-            JOIN movies m ON s.movie_id = m.movie_id
-            WHERE s.show_date = ? AND s.start_time >= '19:00' AND s.start_time < '20:00'
-            ORDER BY s.start_time
+            SELECT * FROM showtime_flat
+            WHERE show_date = ? AND start_min >= 1140 AND start_min < 1200
+            ORDER BY start_min, showtime_id
         """, (date,))
         return [dict(row) for row in cursor.fetchall()]
     
@@ -150,6 +536,45 @@ class DatabaseManager:
         result = cursor.fetchone()
         return result[0] if result else None
     
+    def get_data_version(self, name: str) -> Optional[int]:
+        """データバージョンを取得（data_versions テーブルがない場合は None）"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute("SELECT version FROM data_versions WHERE name = ?", (name,))
+        except sqlite3.OperationalError:
+            return None
+        result = cursor.fetchone()
+        return result[0] if result else 0
+    
+    def bump_data_version(self, name: str = DATASET_VERSION) -> int:
+        """データバージョンを1つ進める（コミットは呼び出し側のトランザクションで行う）"""
+        cursor = self.connection.cursor()
+        # 古いDBにはバージョン管理テーブルがないので必要なら作成
+        cursor.execute(DATA_VERSIONS_TABLE)
+        cursor.execute("""
+            INSERT INTO data_versions (name, version) VALUES (?, 1)
+            ON CONFLICT(name) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+        """, (name,))
+        cursor.execute("SELECT version FROM data_versions WHERE name = ?", (name,))
+        return cursor.fetchone()[0]
+    
+    def get_page_fingerprints(self) -> Dict[str, Tuple[str, str]]:
+        """URL → (スケジュール部分のハッシュ, 解析結果の JSON) を取得（セットアップ前のDBでは空）"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute("SELECT url, content_hash, parsed FROM page_fingerprints")
+        except sqlite3.OperationalError:
+            return {}
+        return {url: (content_hash, parsed) for url, content_hash, parsed in cursor.fetchall()}
+    
+    def save_page_fingerprints(self, fingerprints: Dict[str, Tuple[str, str]]):
+        """変わったページの指紋と解析結果を保存（コミットは呼び出し側）"""
+        self.connection.executemany("""
+            INSERT INTO page_fingerprints (url, content_hash, parsed) VALUES (?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                content_hash = excluded.content_hash, parsed = excluded.parsed, changed_at = CURRENT_TIMESTAMP
+        """, [(url, content_hash, parsed) for url, (content_hash, parsed) in fingerprints.items()])
+    
     def insert_or_update_movie(self, title: str, duration: int = 120, rating: str = "G", 
                              genre: List[str] = None, description: str = "") -> int:
         """映画を挿入または更新"""
@@ -185,10 +610,10 @@ class DatabaseManager:
         cursor.execute("SELECT duration FROM movies WHERE movie_id = ?", (movie_id,))
         duration = cursor.fetchone()[0]
         
-        # 終了時間を計算
-        start_datetime = datetime.strptime(f"{show_date} {start_time}", "%Y-%m-%d %H:%M")
-        end_datetime = start_datetime + timedelta(minutes=duration)
-        end_time = end_datetime.strftime("%H:%M")
+        # 終了時間を計算（日付をまたぐ場合は "25:10" のように上映日基準で表記）
+        start_min = time_to_minutes(start_time)
+        end_min = start_min + duration
+        end_time = minutes_to_time(end_min)
         
         # 重複チェック
         cursor.execute("""
@@ -202,15 +627,16 @@ class DatabaseManager:
             # 既存の上映時間を更新
             showtime_id = result[0]
             cursor.execute("""
-                UPDATE showtimes SET movie_id = ?, end_time = ?, price = ?, updated_at = ?
+                UPDATE showtimes SET movie_id = ?, end_time = ?, start_min = ?, end_min = ?, price = ?, updated_at = ?
                 WHERE showtime_id = ?
-            """, (movie_id, end_time, price, datetime.now().isoformat(), showtime_id))
+            """, (movie_id, end_time, start_min, end_min, price, datetime.now().isoformat(), showtime_id))
         else:
             # 新しい上映時間を挿入
             cursor.execute("""
-                INSERT INTO showtimes (theater_id, movie_id, show_date, start_time, end_time, screen_number, price)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (theater_id, movie_id, show_date, start_time, end_time, screen_number, price))
+                INSERT INTO showtimes (theater_id, movie_id, show_date, start_time, end_time, start_min, end_min,
+                                       screen_number, price)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (theater_id, movie_id, show_date, start_time, end_time, start_min, end_min, screen_number, price))
             showtime_id = cursor.lastrowid
         
         return showtime_id
@@ -225,8 +651,8 @@ class DatabaseManager:
         self.connection.commit()
         logger.info(f"Cleared showtimes for date: {date if date else 'all'}")
     
-    def import_schedule_data(self, json_file_path: str) -> Dict:
-        """スケジュールデータをインポート"""
+    def import_schedule_data(self, json_file_path: str, bulk: bool = True) -> Dict:
+        """スケジュールデータをインポート（bulk=False で従来の1行ずつの取り込み）"""
         if not os.path.exists(json_file_path):
             raise FileNotFoundError(f"JSON file not found: {json_file_path}")
         
@@ -234,47 +660,21 @@ class DatabaseManager:
             data = json.load(f)
         
         try:
-            # 既存のデータをクリア
-            self.clear_showtimes(data['metadata']['target_date'])
-            
-            imported_movies = set()
-            imported_showtimes = 0
-            
-            for schedule_item in data['schedule']:
-                # 映画タイトルをクリーニング
-                title = self.clean_movie_title(schedule_item['title'])
-                if title == "不明" or len(title) < 2:
-                    continue
-                
-                # 映画館を取得
-                theater = self.get_theater_by_name(schedule_item['theater_name'])
-                if not theater:
-                    logger.warning(f"Theater not found: {schedule_item['theater_name']}")
-                    continue
-                
-                # 映画を挿入/更新
-                movie_id = self.insert_or_update_movie(title)
-                imported_movies.add(title)
-                
-                # スクリーン番号をランダムに割り当て
-                screen_number = random.randint(1, theater['screens'])
-                
-                # 上映時間を挿入/更新
-                showtime_id = self.insert_or_update_showtime(
-                    theater['theater_id'], movie_id, schedule_item['date'], 
-                    schedule_item['start_time'], screen_number
-                )
-                
-                if showtime_id:
-                    imported_showtimes += 1
+            if bulk:
+                imported_movies, imported_showtimes = self._bulk_import_schedule(data)
+            else:
+                imported_movies, imported_showtimes = self._import_schedule_rows(data)
             
+            # 取り込みと同じトランザクションでデータセットのバージョンを更新
+            dataset_version = self.bump_data_version()
             self.connection.commit()
             
             result = {
-                'imported_movies': len(imported_movies),
+                'imported_movies': imported_movies,
                 'imported_showtimes': imported_showtimes,
                 'source_file': json_file_path,
-                'target_date': data['metadata']['target_date']
+                'target_date': data['metadata']['target_date'],
+                'dataset_version': dataset_version
             }
             
             logger.info(f"Import completed: {result}")
@@ -285,6 +685,158 @@ class DatabaseManager:
             logger.error(f"Import failed: {e}")
             raise
     
+    def _import_schedule_rows(self, data: Dict) -> Tuple[int, int]:
+        """1行ずつ映画館・映画を検索して上映を挿入/更新（従来の取り込み）"""
+        # 既存のデータをクリア
+        self.clear_showtimes(data['metadata']['target_date'])
+        
+        imported_movies = set()
+        imported_showtimes = 0
+        
+        for schedule_item in data['schedule']:
+            # 映画タイトルをクリーニング
+            title = self.clean_movie_title(schedule_item['title'])
+            if title == "不明" or len(title) < 2:
+                continue
+            
+            # 映画館を取得
+            theater = self.get_theater_by_name(schedule_item['theater_name'])
+            if not theater:
+                logger.warning(f"Theater not found: {schedule_item['theater_name']}")
+                continue
+            
+            # 映画を挿入/更新
+            movie_id = self.insert_or_update_movie(title)
+            imported_movies.add(title)
+            
+            # スクリーン番号をランダムに割り当て
+            screen_number = random.randint(1, theater['screens'])
+            
+            # 上映時間を挿入/更新
+            showtime_id = self.insert_or_update_showtime(
+                theater['theater_id'], movie_id, schedule_item['date'], 
+                schedule_item['start_time'], screen_number
+            )
+            
+            if showtime_id:
+                imported_showtimes += 1
+        
+        return len(imported_movies), imported_showtimes
+    
+    def _bulk_import_schedule(self, data: Dict) -> Tuple[int, int]:
+        """映画館・映画を辞書で一度に解決し、上映は executemany で既存の行を更新・新しい行を挿入する
+        
+        対象日の削除から書き込みまでを1トランザクションで行う（コミットは呼び出し側）。
+        結果は上映IDも含めて従来の取り込みと同じ（映画は既定値で更新、上映は一意キーが重なれば後の行で上書き）
+        """
+        cursor = self.connection.cursor()
+        # DROP TRIGGER はトランザクション外だと即座に確定するので、先に BEGIN して失敗時のロールバックで戻せるようにする
+        if not self.connection.in_transaction:
+            cursor.execute("BEGIN")
+        # showtime_flat は行ごとのトリガーで更新せず、最後に対象日の分だけ作り直す
+        self.drop_showtime_flat_triggers()
+        cursor.execute("DELETE FROM showtimes WHERE show_date = ?", (data['metadata']['target_date'],))
+        
+        # 同名があれば従来の検索と同じく最初の行を使う
+        theaters = {}
+        for name, theater_id, screens in cursor.execute("SELECT name, theater_id, screens FROM theaters ORDER BY theater_id"):
+            theaters.setdefault(name, (theater_id, screens))
+        movie_ids = {}
+        for title, movie_id in cursor.execute("SELECT title, movie_id FROM movies ORDER BY movie_id"):
+            movie_ids.setdefault(title, movie_id)
+        
+        rows = []
+        titles = {}  # 出現順を保つ
+        missing_theaters = {}
+        for schedule_item in data['schedule']:
+            title = self.clean_movie_title(schedule_item['title'])
+            if title == "不明" or len(title) < 2:
+                continue
+            
+            theater = theaters.get(schedule_item['theater_name'])
+            if theater is None:
+                missing_theaters[schedule_item['theater_name']] = missing_theaters.get(schedule_item['theater_name'], 0) + 1
+                continue
+            
+            titles[title] = None
+            theater_id, screens = theater
+            rows.append((title, theater_id, schedule_item['date'], schedule_item['start_time'],
+                         random.randint(1, screens)))
+        
+        for name, count in missing_theaters.items():
+            logger.warning(f"Theater not found: {name} ({count} rows)")
+        
+        # 映画: 既存は insert_or_update_movie と同じ既定値で更新し、新しいものはまとめて挿入
+        duration = 120
+        now = datetime.now().isoformat()
+        cursor.executemany("""
+            UPDATE movies SET duration = ?, rating = 'G', genre = '[]', description = '', updated_at = ?
+            WHERE movie_id = ?
+        """, [(duration, now, movie_ids[title]) for title in titles if title in movie_ids])
+        
+        new_titles = [title for title in titles if title not in movie_ids]
+        if new_titles:
+            cursor.execute("SELECT COALESCE(MAX(movie_id), 0) FROM movies")
+            last_movie_id = cursor.fetchone()[0]
+            cursor.executemany("""
+                INSERT INTO movies (title, duration, rating, genre, description, release_date)
+                VALUES (?, ?, 'G', '[]', '', '2025-07-14')
+            """, [(title, duration) for title in new_titles])
+            cursor.execute("SELECT title, movie_id FROM movies WHERE movie_id > ? ORDER BY movie_id", (last_movie_id,))
+            for title, movie_id in cursor.fetchall():
+                movie_ids.setdefault(title, movie_id)
+        
+        # 上映: 一意キーが重なる行は後の行で上書きし、最初に現れた順に並べる
+        showtimes = {}
+        for title, theater_id, show_date, start_time, screen_number in rows:
+            showtimes[(theater_id, show_date, start_time, screen_number)] = movie_ids[title]
+        
+        # 既存の上映は UPDATE、新しい上映だけを INSERT する
+        # （UPSERT は更新になった行でも AUTOINCREMENT の番号を消費し、従来の取り込みと上映IDがずれる）
+        dates = sorted({key[1] for key in showtimes})
+        existing = {}
+        if dates:
+            cursor.execute(f"""
+                SELECT theater_id, show_date, start_time, screen_number, showtime_id FROM showtimes
+                WHERE show_date IN ({', '.join('?' * len(dates))})
+            """, dates)
+            for theater_id, show_date, start_time, screen_number, showtime_id in cursor.fetchall():
+                existing[(theater_id, show_date, start_time, screen_number)] = showtime_id
+        
+        # 終了時刻は Python で計算
+        start_minutes = {}
+        updates = []
+        inserts = []
+        for (theater_id, show_date, start_time, screen_number), movie_id in showtimes.items():
+            start_min = start_minutes.get(start_time)
+            if start_min is None:
+                start_min = start_minutes[start_time] = time_to_minutes(start_time)
+            end_min = start_min + duration
+            showtime_id = existing.get((theater_id, show_date, start_time, screen_number))
+            if showtime_id is not None:
+                updates.append((movie_id, minutes_to_time(end_min), start_min, end_min, 2000.0, showtime_id))
+            else:
+                inserts.append((theater_id, movie_id, show_date, start_time, minutes_to_time(end_min),
+                                start_min, end_min, screen_number, 2000.0))
+        
+        cursor.executemany("""
+            UPDATE showtimes SET movie_id = ?, end_time = ?, start_min = ?, end_min = ?, price = ?,
+                                 updated_at = CURRENT_TIMESTAMP
+            WHERE showtime_id = ?
+        """, updates)
+        cursor.executemany("""
+            INSERT INTO showtimes (theater_id, movie_id, show_date, start_time, end_time, start_min, end_min,
+                                   screen_number, price)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, inserts)
+        
+        for show_date in {data['metadata']['target_date']} | {row[2] for row in rows}:
+            self.rebuild_showtime_flat(show_date)
+        self.refresh_showtime_flat_movies()  # 既存の映画の上映時間は他の日の上映にも反映する
+        self.create_showtime_flat_triggers()
+        
+        return len(titles), len(rows)
+    
     def clean_movie_title(self, title: str) -> str:
         """映画タイトルをクリーニング"""
         import re
@@ -314,7 +866,7 @@ class DatabaseManager:
             stats[table] = cursor.fetchone()[0]
         
         # 19時台の上映数
-        cursor.execute("SELECT COUNT(*) FROM showtimes WHERE start_time >= '19:00' AND start_time < '20:00'")
+        cursor.execute("SELECT COUNT(*) FROM showtimes WHERE start_min >= 1140 AND start_min < 1200")
         stats['showtimes_19h'] = cursor.fetchone()[0]
         
         # 日付別上映数
@@ -340,7 +892,7 @@ class DatabaseManager:
             VALUES (?, ?, ?)
         """, (theater_name, location or "新宿区", prefecture or "東京都"))
         
-        self.connection.commit()
+        self._commit_row()
         return cursor.lastrowid
     
     def get_or_create_movie(self, movie_title: str, duration: int = 120, genre: str = "") -> int:
@@ -360,7 +912,7 @@ class DatabaseManager:
             VALUES (?, ?, ?)
         """, (movie_title, duration, genre))
         
-        self.connection.commit()
+        self._commit_row()
         return cursor.lastrowid
     
     def add_showtime(self, movie_id: int, theater_id: int, date: str, 
@@ -381,14 +933,16 @@ class DatabaseManager:
                 logger.debug(f"Showtime already exists: {existing[0]}")
                 return existing[0]
             
-            # 新規追加
+            # 新規追加（開始・終了は上映日0時からの分でも保持）
+            start_min = time_to_minutes(start_time)
             cursor.execute("""
                 INSERT INTO showtimes (movie_id, theater_id, show_date, start_time, end_time, 
-                                     screen_number, price) 
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (movie_id, theater_id, date, start_time, end_time, screen_number, price))
+                                     start_min, end_min, screen_number, price) 
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (movie_id, theater_id, date, start_time, end_time,
+                  start_min, end_minutes(start_min, end_time), screen_number, price))
             
-            self.connection.commit()
+            self._commit_row()
             return cursor.lastrowid
             
         except Exception as e:
@@ -433,7 +987,7 @@ def main():
             print(f"\n=== 19時台の上映 ({len(showtimes_19h)} 件) ===")
             for showtime in showtimes_19h:
                 print(f"{showtime['start_time']} | {showtime['movie_title']} | {showtime['theater_name']}")
-            
+                
     except Exception as e:
         logger.error(f"Database operation failed: {e}")
         raise
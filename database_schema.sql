@@ -28,6 +28,7 @@ CREATE TABLE movies (
     cast TEXT, -- JSON配列形式
     release_date DATE,
     imdb_rating REAL,
+    image_url TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -40,6 +41,8 @@ CREATE TABLE showtimes (
     show_date DATE NOT NULL,
     start_time TIME NOT NULL,
     end_time TIME,
+    start_min INTEGER, -- 上映日0時からの分（深夜上映は 1440 以上）
+    end_min INTEGER,
     screen_number INTEGER,
     price REAL DEFAULT 2000.0,
     special_format TEXT DEFAULT '通常', -- IMAX, 4DX, Dolby Atmos, etc.
@@ -110,10 +113,52 @@ CREATE TABLE crawling_logs (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- 8. データバージョンテーブル（キャッシュ無効化用）
+CREATE TABLE data_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO data_versions (name, version) VALUES ('theater_distances', 0);
+INSERT INTO data_versions (name, version) VALUES ('dataset', 0);
+
+-- 検索・最適化用の非正規化テーブル（上映日・開始分の順に格納）
+-- 元テーブルへの追従トリガーは DatabaseManager.ensure_showtime_flat が作成する
+CREATE TABLE showtime_flat (
+    show_date DATE NOT NULL,
+    start_min INTEGER NOT NULL,
+    showtime_id INTEGER NOT NULL,
+    end_min INTEGER,
+    theater_id INTEGER NOT NULL,
+    movie_id INTEGER NOT NULL,
+    theater_name TEXT,
+    movie_title TEXT,
+    image_url TEXT,
+    duration INTEGER,
+    start_time TIME,
+    end_time TIME,
+    screen_number INTEGER,
+    price REAL,
+    PRIMARY KEY (show_date, start_min, showtime_id)
+) WITHOUT ROWID;
+
+-- クローリングしたページの指紋（スケジュール部分のハッシュ）と前回の解析結果（JSON）
+CREATE TABLE page_fingerprints (
+    url TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    parsed TEXT NOT NULL,
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- インデックス作成
 CREATE INDEX idx_showtimes_theater_date ON showtimes(theater_id, show_date);
 CREATE INDEX idx_showtimes_movie_date ON showtimes(movie_id, show_date);
 CREATE INDEX idx_showtimes_date_time ON showtimes(show_date, start_time);
+CREATE INDEX idx_showtimes_date_start_min ON showtimes(show_date, start_min, end_min);
+CREATE UNIQUE INDEX idx_showtime_flat_id ON showtime_flat(showtime_id);
+CREATE INDEX idx_showtime_flat_theater ON showtime_flat(theater_id);
+CREATE INDEX idx_showtime_flat_movie ON showtime_flat(movie_id);
 CREATE INDEX idx_theater_distances_from ON theater_distances(from_theater_id);
 CREATE INDEX idx_theater_distances_to ON theater_distances(to_theater_id);
 CREATE INDEX idx_viewing_plans_primary ON viewing_plans(primary_showtime_id);
@@ -146,4 +191,43 @@ CREATE TRIGGER update_theater_distances_timestamp
     FOR EACH ROW
     BEGIN
         UPDATE theater_distances SET updated_at = CURRENT_TIMESTAMP WHERE distance_id = NEW.distance_id;
+    END;
+
+-- 映画館間距離の変更でデータバージョンを更新するトリガー
+CREATE TRIGGER bump_theater_distances_version_insert
+    AFTER INSERT ON theater_distances
+    BEGIN
+        UPDATE data_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE name = 'theater_distances';
+    END;
+
+CREATE TRIGGER bump_theater_distances_version_update
+    AFTER UPDATE ON theater_distances
+    BEGIN
+        UPDATE data_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE name = 'theater_distances';
+    END;
+
+CREATE TRIGGER bump_theater_distances_version_delete
+    AFTER DELETE ON theater_distances
+    BEGIN
+        UPDATE data_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE name = 'theater_distances';
+    END;
+
+-- 分単位カラムを指定せずに挿入された上映の start_min / end_min を埋めるトリガー
+CREATE TRIGGER fill_showtimes_minutes
+    AFTER INSERT ON showtimes
+    FOR EACH ROW
+    WHEN NEW.start_min IS NULL
+    BEGIN
+        UPDATE showtimes
+        SET start_min = CAST(substr(NEW.start_time, 1, instr(NEW.start_time, ':') - 1) AS INTEGER) * 60 +
+                        CAST(substr(NEW.start_time, instr(NEW.start_time, ':') + 1) AS INTEGER)
+        WHERE showtime_id = NEW.showtime_id;
+        UPDATE showtimes
+        SET end_min = COALESCE(
+                CAST(substr(NEW.end_time, 1, instr(NEW.end_time, ':') - 1) AS INTEGER) * 60 +
+                CAST(substr(NEW.end_time, instr(NEW.end_time, ':') + 1) AS INTEGER),
+                start_min + COALESCE((SELECT duration FROM movies WHERE movie_id = NEW.movie_id), 120))
+        WHERE showtime_id = NEW.showtime_id;
+        UPDATE showtimes SET end_min = end_min + 1440
+        WHERE showtime_id = NEW.showtime_id AND end_min < start_min;
     END;
\ No newline at end of file
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+データセット公開 - ステージングDBで作成・検証したデータを1トランザクションで本番DBに反映
+
+クローリング中も API からは公開済みのデータ（またはその次のバージョン）だけが見え、
+映画館が消えた状態や移動時間行列が空の状態は見えない
+"""
+
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+import logging
+
+from database_manager import DatabaseManager, DATASET_VERSION
+from connection_pool import configure_pool, get_pool, STORAGE_PRAGMAS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 公開時にステージングとの差分を反映するテーブルと主キー（プラン履歴などは本番のものを残す）
+# ページの指紋もデータと同時に公開しないと、公開に失敗したページを次回「変更なし」と判定してしまう
+DATASET_TABLES = {
+    "theaters": "theater_id",
+    "movies": "movie_id",
+    "showtimes": "showtime_id",
+    "theater_distances": "distance_id",
+    "page_fingerprints": "url"
+}
+
+# 差分で showtime_flat を作り直す必要がある上映日（変わった上映と、変わった映画館の上映）
+AFFECTED_DATES_SQL = """
+    SELECT show_date FROM (SELECT * FROM main.showtimes EXCEPT SELECT * FROM staging.showtimes)
+    UNION
+    SELECT show_date FROM (SELECT * FROM staging.showtimes EXCEPT SELECT * FROM main.showtimes)
+    UNION
+    SELECT show_date FROM staging.showtimes WHERE theater_id IN (
+        SELECT theater_id FROM (SELECT * FROM staging.theaters EXCEPT SELECT * FROM main.theaters))
+"""
+
+class DatasetPublisher:
+    """ステージングDBの作成・検証・公開
+    
+    使い方:
+        publisher = DatasetPublisher("movie_optimization.db")
+        with publisher.staging() as db:
+            ...  # db.connection に新しいデータを書き込んでコミット
+        version = publisher.publish()
+    """
+    
+    def __init__(self, db_path: str = "movie_optimization.db"):
+        self.db_path = db_path
+        self.staging_path = db_path + ".staging"
+        self.base_version = None  # ステージング作成時の本番のデータバージョン
+        # ステージングは使い捨てなので WAL にせず、fsync も省略する
+        configure_pool(self.staging_path, pragmas={**STORAGE_PRAGMAS, "journal_mode": "DELETE", "synchronous": "OFF"})
+    
+    def create_staging(self) -> str:
+        """本番DBの一貫したコピーをステージングDBとして作成"""
+        self.discard()
+        with DatabaseManager(self.db_path) as db:
+            self.base_version = db.get_data_version(DATASET_VERSION)
+            staging = sqlite3.connect(self.staging_path)
+            try:
+                # バックアップAPIなので書き込み中でも1時点のスナップショットになる
+                db.connection.backup(staging)
+            finally:
+                staging.close()
+        logger.info(f"Staging database created: {self.staging_path} (base version {self.base_version})")
+        return self.staging_path
+    
+    @contextmanager
+    def staging(self):
+        """ステージングDBを作成して DatabaseManager を返す（例外時はステージングを破棄）"""
+        self.create_staging()
+        try:
+            with DatabaseManager(self.staging_path) as db:
+                # showtime_flat は公開時に作り直すので、ステージングへの書き込みではトリガーを動かさない
+                db.drop_showtime_flat_triggers()
+                db.connection.commit()
+                yield db
+        except Exception:
+            self.discard()
+            raise
+        finally:
+            # ステージング用の接続は公開前に閉じておく
+            get_pool(self.staging_path).reset()
+    
+    def validate(self) -> Dict:
+        """ステージングDBを検証（問題があれば ValueError）"""
+        connection = sqlite3.connect(self.staging_path)
+        try:
+            problems: List[str] = []
+            
+            result = connection.execute("PRAGMA quick_check").fetchone()[0]
+            if result != "ok":
+                problems.append(f"quick_check: {result}")
+            
+            counts = {table: connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                      for table in DATASET_TABLES}
+            for table in ("theaters", "movies", "showtimes"):
+                if counts[table] == 0:
+                    problems.append(f"{table} is empty")
+            
+            checks = {
+                "showtimes without theater": """
+                    SELECT COUNT(*) FROM showtimes s
+                    WHERE NOT EXISTS (SELECT 1 FROM theaters t WHERE t.theater_id = s.theater_id)""",
+                "showtimes without movie": """
+                    SELECT COUNT(*) FROM showtimes s
+                    WHERE NOT EXISTS (SELECT 1 FROM movies m WHERE m.movie_id = s.movie_id)""",
+                "showtimes without minutes": """
+                    SELECT COUNT(*) FROM showtimes WHERE start_min IS NULL OR end_min IS NULL""",
+                "distances without theater": """
+                    SELECT COUNT(*) FROM theater_distances d
+                    WHERE NOT EXISTS (SELECT 1 FROM theaters t WHERE t.theater_id = d.from_theater_id)
+                       OR NOT EXISTS (SELECT 1 FROM theaters t WHERE t.theater_id = d.to_theater_id)""",
+            }
+            for name, sql in checks.items():
+                count = connection.execute(sql).fetchone()[0]
+                if count:
+                    problems.append(f"{name}: {count}")
+        finally:
+            connection.close()
+        
+        if problems:
+            raise ValueError(f"Staging dataset is invalid: {'; '.join(problems)}")
+        return counts
+    
+    def publish(self) -> int:
+        """ステージングを検証して本番DBに反映し、新しいデータバージョンを返す
+        
+        本番DBに ATTACH して変わった行と showtime_flat の該当日を1トランザクションで入れ替えるので、
+        読み取り側（WAL）は入れ替え前か後のどちらかのデータだけを見る
+        """
+        if not os.path.exists(self.staging_path):
+            raise FileNotFoundError(f"Staging database not found: {self.staging_path}")
+        try:
+            counts = self.validate()
+            dataset_version = self._swap()
+        finally:
+            # 公開できなかったステージングも作り直しになるので残さない
+            self.discard()
+        
+        logger.info(f"Dataset published: version {dataset_version} {counts}")
+        return dataset_version
+    
+    def _swap(self) -> int:
+        """ステージングを ATTACH して本番との差分の行だけを反映し、データバージョンを更新
+        
+        変わっていない行には触れないので、距離表が変わらなければ移動時間行列のバージョンも上がらない
+        """
+        with DatabaseManager(self.db_path) as db:
+            connection = db.connection
+            connection.execute("ATTACH DATABASE ? AS staging", (self.staging_path,))
+            try:
+                connection.execute("BEGIN IMMEDIATE")
+                try:
+                    # ステージング作成後に別の取り込みが公開されていたら上書きしない
+                    current_version = db.get_data_version(DATASET_VERSION)
+                    if current_version != self.base_version:
+                        raise RuntimeError(f"Dataset changed during staging: version {self.base_version} -> {current_version}")
+                    
+                    # 行ごとのトリガーで showtime_flat を更新せず、反映後に変わった日だけ作り直す
+                    affected_dates = [row[0] for row in connection.execute(AFFECTED_DATES_SQL)]
+                    db.drop_showtime_flat_triggers()
+                    changes = {table: self._apply_changes(connection, table, key)
+                               for table, key in DATASET_TABLES.items()}
+                    for show_date in affected_dates:
+                        db.rebuild_showtime_flat(show_date)
+                    db.refresh_showtime_flat_movies()  # 変わった映画のタイトル・上映時間は他の日の上映にも反映する
+                    db.create_showtime_flat_triggers()
+                    
+                    dataset_version = db.bump_data_version()
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+                    raise
+            finally:
+                connection.execute("DETACH DATABASE staging")
+        logger.info(f"Dataset changes (deleted, inserted): {changes}, showtime_flat rebuilt for {len(affected_dates)} dates")
+        return dataset_version
+    
+    @staticmethod
+    def _apply_changes(connection: sqlite3.Connection, table: str, key: str) -> Tuple[int, int]:
+        """ステージングと異なる本番の行を削除し、本番にないステージングの行を挿入（変わった行は入れ替え）"""
+        deleted = connection.execute(f"""
+            DELETE FROM main.{table} WHERE {key} IN (
+                SELECT {key} FROM (SELECT * FROM main.{table} EXCEPT SELECT * FROM staging.{table}))
+        """).rowcount
+        inserted = connection.execute(f"""
+            INSERT INTO main.{table} SELECT * FROM staging.{table} EXCEPT SELECT * FROM main.{table}
+        """).rowcount
+        return deleted, inserted
+    
+    def discard(self):
+        """ステージングDBを削除"""
+        get_pool(self.staging_path).reset()
+        for path in (self.staging_path, self.staging_path + "-journal", self.staging_path + "-wal",
+                     self.staging_path + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+DB処理用スレッドプール - 非同期エンドポイントからの同期 sqlite3 処理をイベントループの外で実行
+"""
+
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+import logging
+
+from connection_pool import configure_pool, get_pool
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# DB処理スレッド数の既定値（環境変数 DB_EXECUTOR_WORKERS で変更可能）
+DEFAULT_DB_WORKERS = int(os.environ.get("DB_EXECUTOR_WORKERS", "4"))
+
+class DatabaseExecutor:
+    """上限付きのDB処理専用スレッドプール
+    
+    各スレッドは読み書き・読み取り専用それぞれの接続を専有し、スレッド間で接続を受け渡さない。
+    同時に実行されるDB処理はスレッド数までで、それ以上は待ち行列に入る
+    """
+    
+    def __init__(self, db_path: str, max_workers: int = DEFAULT_DB_WORKERS):
+        self.db_path = db_path
+        self.max_workers = max_workers
+        
+        # 専有される接続の分だけプールを広げる（実行スレッド以外の利用分として1つ残す）
+        for read_only in (False, True):
+            if get_pool(db_path, read_only=read_only).max_size < max_workers + 1:
+                configure_pool(db_path, max_size=max_workers + 1, read_only=read_only)
+        
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db-worker",
+                                            initializer=self._init_worker)
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.running = 0
+        self.max_running = 0
+    
+    def _init_worker(self):
+        """スレッド開始時に接続の専有を設定"""
+        for read_only in (False, True):
+            get_pool(self.db_path, read_only=read_only).own_thread_connection()
+    
+    def _call(self, func: Callable, *args, **kwargs) -> Any:
+        """スレッド上で処理を実行して統計を更新"""
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+        return result
+    
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """同期関数をDB処理スレッドで実行し、結果を待つ"""
+        with self._lock:
+            self.submitted += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._call, func, *args, **kwargs))
+    
+    def shutdown(self):
+        """実行中の処理を待ってスレッドを止め、専有していた接続を閉じる"""
+        self._executor.shutdown(wait=True)
+        for read_only in (False, True):
+            get_pool(self.db_path, read_only=read_only).close_orphaned()
+        logger.info(f"Database executor stopped: {self.db_path}")
+    
+    def stats(self) -> Dict:
+        """実行数・待ち数の統計"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "running": self.running,
+                "queued": self.submitted - self.completed - self.running,
+                "max_running": self.max_running
+            }
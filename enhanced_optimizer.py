@@ -3,21 +3,27 @@
 改良版映画最適化システム - より実用的なプラン生成
 """
 
-import sqlite3
 import json
-from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
+import heapq
 import logging
-from dataclasses import dataclass, asdict
-from database_manager import DatabaseManager
-import random
+import sys
+from dataclasses import dataclass, fields
+import numpy as np
+from database_manager import DatabaseManager, DATASET_VERSION
+from schedule_index import ScheduleIndexStore
+from travel_matrix import TravelMatrix, TravelMatrixCache
+from pairing_engine import PairingEngine
+from marathon_planner import MarathonPlanner
+from plan_scoring import PlanScorer, ScoringWeights
+from schedule_time import time_to_minutes, minutes_to_time, window_minutes
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-@dataclass
+@dataclass(slots=True)
 class MovieShowtime:
-    """上映情報クラス"""
+    """上映情報クラス（インスタンス辞書を持たない。文字列は sys.intern で共有）"""
     showtime_id: int
     theater_id: int
     movie_id: int
@@ -29,10 +35,12 @@ class MovieShowtime:
     screen_number: int
     price: float
     duration: int = 120
+    start_min: int = None  # 上映日0時からの分（深夜上映は 1440 以上）
+    end_min: int = None
 
-@dataclass
+@dataclass(slots=True)
 class ViewingPlan:
-    """視聴プランクラス"""
+    """視聴プランクラス（上映は日別索引の MovieShowtime を参照するだけでコピーしない）"""
     plan_id: str
     primary_showtime: MovieShowtime
     before_showtime: Optional[MovieShowtime] = None
@@ -43,84 +51,155 @@ class ViewingPlan:
     optimization_score: float = 0.0
     plan_type: str = "single"
     travel_details: List[Dict] = None
+    showtimes: List[MovieShowtime] = None  # マラソンプランの鑑賞順の上映一覧
     
     def __post_init__(self):
         if self.travel_details is None:
             self.travel_details = []
+        if self.showtimes is None:
+            self.showtimes = []
+
+# 上映情報をシリアライズする時のフィールド名（asdict の再帰コピーを避ける）
+SHOWTIME_FIELDS = tuple(f.name for f in fields(MovieShowtime))
+
+def showtime_to_record(showtime: MovieShowtime) -> Dict:
+    """上映情報をJSON保存用の辞書に変換"""
+    return {name: getattr(showtime, name) for name in SHOWTIME_FIELDS}
+
+# plan_type ごとに生成するプランの種類（指定されていない種類は生成しない）
+PLAN_TYPE_FAMILIES = {
+    "all": ("single", "before", "after", "before_after"),
+    "single": ("single",),
+    "before": ("before",),
+    "before_only": ("before",),
+    "after": ("after",),
+    "after_only": ("after",),
+    "before_after": ("before_after",),
+    "marathon": ("marathon",),
+}
+DEFAULT_FAMILIES = PLAN_TYPE_FAMILIES["all"]
+
+@dataclass
+class PlanConstraints:
+    """候補生成の段階で適用する探索制約"""
+    buffer_time: int = 15
+    max_travel_time: Optional[int] = None
+    max_total_duration: Optional[int] = None
+    
+    def allows(self, total_duration: int, travel_time: int = None, gap_minutes: int = None) -> bool:
+        """総所要時間と（乗り継ぎがある場合）移動時間・上映間の空き時間が制約を満たすか"""
+        if self.max_total_duration is not None and total_duration > self.max_total_duration:
+            return False
+        if travel_time is None:
+            return True
+        if self.max_travel_time is not None and travel_time > self.max_travel_time:
+            return False
+        return travel_time + self.buffer_time <= gap_minutes
 
 class EnhancedOptimizer:
-    def __init__(self, db_path: str = "movie_optimization.db"):
+    def __init__(self, db_path: str = "movie_optimization.db", scoring_weights: ScoringWeights = None):
         self.db_path = db_path
-        
+        self.schedule_indexes = ScheduleIndexStore(self.load_versioned_schedule)
+        self.travel_matrices = TravelMatrixCache(db_path)
+        self.scorer = PlanScorer(scoring_weights)
+    
     def parse_time_to_minutes(self, time_str: str) -> int:
-        """時間文字列を分に変換"""
+        """時間文字列を分に変換（"24:00" や "25:10" は1440分以上）"""
         try:
-            time_obj = datetime.strptime(time_str, "%H:%M")
-            return time_obj.hour * 60 + time_obj.minute
+            return time_to_minutes(time_str)
         except ValueError:
             return 0
     
+    def parse_time_window(self, time_from: str, time_to: str) -> Tuple[int, int]:
+        """検索時間枠を分に変換（終了が開始より前なら翌日とみなす）"""
+        try:
+            return window_minutes(time_from, time_to)
+        except ValueError:
+            return self.parse_time_to_minutes(time_from), self.parse_time_to_minutes(time_to)
+    
     def minutes_to_time(self, minutes: int) -> str:
         """分を時間文字列に変換"""
-        hours = minutes // 60
-        mins = minutes % 60
-        return f"{hours:02d}:{mins:02d}"
+        return minutes_to_time(minutes)
     
     def get_available_showtimes(self, date: str = "2025-07-14") -> List[MovieShowtime]:
         """利用可能な上映時間を取得"""
-        with DatabaseManager(self.db_path) as db:
-            showtimes_data = db.get_showtimes(date=date)
-            
-            showtimes = []
-            for data in showtimes_data:
-                # 映画の長さを取得
-                movie = db.get_movies()
-                movie_duration = 120  # デフォルト
-                for m in movie:
-                    if m['movie_id'] == data['movie_id']:
-                        movie_duration = m['duration']
-                        break
-                
-                showtime = MovieShowtime(
-                    showtime_id=data['showtime_id'],
-                    theater_id=data['theater_id'],
-                    movie_id=data['movie_id'],
-                    theater_name=data['theater_name'],
-                    movie_title=data['movie_title'],
-                    show_date=data['show_date'],
-                    start_time=data['start_time'],
-                    end_time=data['end_time'],
-                    screen_number=data['screen_number'],
-                    price=data['price'],
-                    duration=movie_duration
-                )
-                showtimes.append(showtime)
-            
-            return showtimes
+        return [showtime for showtime, _, _ in self.load_schedule(date)]
+    
+    def load_schedule(self, date: str) -> List[Tuple[MovieShowtime, int, int]]:
+        """スケジュールスナップショットを (上映情報, 開始分, 終了分) のリストで取得"""
+        return self.load_versioned_schedule(date)[1]
+    
+    def load_versioned_schedule(self, date: str) -> Tuple[Optional[int], List[Tuple[MovieShowtime, int, int]]]:
+        """データセットバージョンとスケジュールスナップショットを同じ読み取りトランザクションで取得"""
+        # 2つの読み取りの間に公開されたデータに古いバージョンを付けないよう、同じ時点のデータを読む
+        with DatabaseManager(self.db_path) as db, db.snapshot():
+            version = db.get_data_version(DATASET_VERSION)
+            snapshot = db.get_schedule_snapshot(date)
+        return version, self.schedule_from_snapshot(snapshot)
+    
+    def schedule_from_snapshot(self, snapshot: List[Dict]) -> List[Tuple[MovieShowtime, int, int]]:
+        """get_schedule_snapshot の行を (上映情報, 開始分, 終了分) のリストに変換"""
+        # 映画館名・タイトル・日付・時刻は繰り返し現れるので intern して1つの文字列を共有する
+        intern = sys.intern
+        schedule = []
+        for data in snapshot:
+            showtime = MovieShowtime(
+                showtime_id=data['showtime_id'],
+                theater_id=data['theater_id'],
+                movie_id=data['movie_id'],
+                theater_name=intern(data['theater_name']),
+                movie_title=intern(data['movie_title']),
+                show_date=intern(data['show_date']),
+                start_time=intern(data['start_time']),
+                end_time=intern(data['end_time']),
+                screen_number=data['screen_number'],
+                price=data['price'],
+                duration=data['duration'],
+                start_min=data['start_min'],
+                end_min=data['end_min']
+            )
+            schedule.append((showtime, data['start_min'], data['end_min']))
+        
+        return schedule
     
-    def create_demo_plans(self, target_showtime: MovieShowtime, time_from: str = "09:00", time_to: str = "24:00") -> List[ViewingPlan]:
-        """デモ用の実用的なプランを生成"""
+    def create_demo_plans(self, target_showtime: MovieShowtime, time_from: str = "09:00", time_to: str = "24:00",
+                          travel_matrix: TravelMatrix = None, families: Tuple[str, ...] = DEFAULT_FAMILIES,
+                          constraints: PlanConstraints = None) -> List[ViewingPlan]:
+        """デモ用の実用的なプランを生成（families で指定された種類のみ）"""
+        travel_matrix = travel_matrix or self.travel_matrices.get()
+        constraints = constraints or PlanConstraints()
+        buffer_time = constraints.buffer_time
         plans = []
         
+        target_start = target_showtime.start_min
+        target_end = target_showtime.end_min
+        if target_start is None or target_end is None:
+            target_start, target_end = self.parse_time_window(target_showtime.start_time, target_showtime.end_time)
+        time_from_minutes, time_to_minutes = self.parse_time_window(time_from, time_to)
+        
+        # 前映画は2時間30分前〜30分前、後映画は30分後から2時間（メイン映画との間隔は30分）
+        before_start = target_start - 150
+        before_end = target_start - 30
+        after_start = target_end + 30
+        after_end = after_start + 120
+        before_fits = before_start >= time_from_minutes
+        after_fits = after_end <= time_to_minutes
+        
         # 1. 単発プラン
-        single_plan = ViewingPlan(
-            plan_id=f"single_{target_showtime.showtime_id}",
-            primary_showtime=target_showtime,
-            total_duration_minutes=target_showtime.duration,
-            total_travel_minutes=0,
-            total_movie_minutes=target_showtime.duration,
-            optimization_score=85.0,
-            plan_type="single"
-        )
-        plans.append(single_plan)
+        if "single" in families and constraints.allows(target_showtime.duration):
+            single_plan = ViewingPlan(
+                plan_id=f"single_{target_showtime.showtime_id}",
+                primary_showtime=target_showtime,
+                total_duration_minutes=target_showtime.duration,
+                total_travel_minutes=0,
+                total_movie_minutes=target_showtime.duration,
+                plan_type="single"
+            )
+            plans.append(single_plan)
         
         # 2. 現実的な2本立てプラン（前+メイン）
         # 前映画の開始時間が制限時間内に収まるかチェック
-        before_start = self.parse_time_to_minutes(target_showtime.start_time) - 150  # 2時間30分前
-        before_end = self.parse_time_to_minutes(target_showtime.start_time) - 30    # 30分前
-        time_from_minutes = self.parse_time_to_minutes(time_from)
-        
-        if before_start >= time_from_minutes:
+        if "before" in families and before_fits:
             # 前の映画を仮想的に作成
             
             before_showtime = MovieShowtime(
@@ -134,40 +213,37 @@ class EnhancedOptimizer:
                 end_time=self.minutes_to_time(before_end),
                 screen_number=1,
                 price=2000.0,
-                duration=120
+                duration=120,
+                start_min=before_start,
+                end_min=before_end
             )
             
             # 移動時間を計算
-            with DatabaseManager(self.db_path) as db:
-                travel_time = db.get_travel_time(before_showtime.theater_id, target_showtime.theater_id) or 10
-            
-            total_duration = self.parse_time_to_minutes(target_showtime.end_time) - self.parse_time_to_minutes(before_showtime.start_time)
-            
-            before_plan = ViewingPlan(
-                plan_id=f"before_{target_showtime.showtime_id}",
-                primary_showtime=target_showtime,
-                before_showtime=before_showtime,
-                total_duration_minutes=total_duration,
-                total_travel_minutes=travel_time + 15,
-                total_movie_minutes=before_showtime.duration + target_showtime.duration,
-                optimization_score=78.5,
-                plan_type="before_only",
-                travel_details=[{
-                    "from": before_showtime.theater_name,
-                    "to": target_showtime.theater_name,
-                    "travel_time": travel_time,
-                    "buffer_time": 15
-                }]
-            )
-            plans.append(before_plan)
+            travel_time = travel_matrix.get(before_showtime.theater_id, target_showtime.theater_id) or 10
+            
+            total_duration = target_end - before_start
+            
+            if constraints.allows(total_duration, travel_time, target_start - before_end):
+                before_plan = ViewingPlan(
+                    plan_id=f"before_{target_showtime.showtime_id}",
+                    primary_showtime=target_showtime,
+                    before_showtime=before_showtime,
+                    total_duration_minutes=total_duration,
+                    total_travel_minutes=travel_time + buffer_time,
+                    total_movie_minutes=before_showtime.duration + target_showtime.duration,
+                    plan_type="before_only",
+                    travel_details=[{
+                        "from": before_showtime.theater_name,
+                        "to": target_showtime.theater_name,
+                        "travel_time": travel_time,
+                        "buffer_time": buffer_time
+                    }]
+                )
+                plans.append(before_plan)
         
         # 3. 現実的な2本立てプラン（メイン+後）
         # 後映画の終了時間が制限時間内に収まるかチェック
-        after_start = self.parse_time_to_minutes(target_showtime.end_time) + 30  # 30分後
-        after_end = after_start + 120  # 2時間後
-        time_to_minutes = self.parse_time_to_minutes(time_to)
-        
-        if after_end <= time_to_minutes:
+        if "after" in families and after_fits:
             # 後の映画を仮想的に作成
             
             after_showtime = MovieShowtime(
@@ -181,40 +257,39 @@ class EnhancedOptimizer:
                 end_time=self.minutes_to_time(after_end),
                 screen_number=1,
                 price=2000.0,
-                duration=120
+                duration=120,
+                start_min=after_start,
+                end_min=after_end
             )
             
             # 移動時間を計算
-            with DatabaseManager(self.db_path) as db:
-                travel_time = db.get_travel_time(target_showtime.theater_id, after_showtime.theater_id) or 5
-            
-            total_duration = self.parse_time_to_minutes(after_showtime.end_time) - self.parse_time_to_minutes(target_showtime.start_time)
-            
-            after_plan = ViewingPlan(
-                plan_id=f"after_{target_showtime.showtime_id}",
-                primary_showtime=target_showtime,
-                after_showtime=after_showtime,
-                total_duration_minutes=total_duration,
-                total_travel_minutes=travel_time + 15,
-                total_movie_minutes=target_showtime.duration + after_showtime.duration,
-                optimization_score=82.3,
-                plan_type="after_only",
-                travel_details=[{
-                    "from": target_showtime.theater_name,
-                    "to": after_showtime.theater_name,
-                    "travel_time": travel_time,
-                    "buffer_time": 15
-                }]
-            )
-            plans.append(after_plan)
+            travel_time = travel_matrix.get(target_showtime.theater_id, after_showtime.theater_id) or 5
+            
+            total_duration = after_end - target_start
+            
+            if constraints.allows(total_duration, travel_time, after_start - target_end):
+                after_plan = ViewingPlan(
+                    plan_id=f"after_{target_showtime.showtime_id}",
+                    primary_showtime=target_showtime,
+                    after_showtime=after_showtime,
+                    total_duration_minutes=total_duration,
+                    total_travel_minutes=travel_time + buffer_time,
+                    total_movie_minutes=target_showtime.duration + after_showtime.duration,
+                    plan_type="after_only",
+                    travel_details=[{
+                        "from": target_showtime.theater_name,
+                        "to": after_showtime.theater_name,
+                        "travel_time": travel_time,
+                        "buffer_time": buffer_time
+                    }]
+                )
+                plans.append(after_plan)
         
         # 4. 3本立てプラン（可能な場合）
-        # 3本立てに十分な時間があるかチェック（最低6時間必要）
-        if (time_to_minutes - time_from_minutes) >= 360:
+        # 3本立てに十分な時間があり（最低6時間必要）、前後の映画が時間枠に収まるかチェック
+        if ("before_after" in families and (time_to_minutes - time_from_minutes) >= 360
+                and before_fits and after_fits):
             # 前映画
-            before_start = self.parse_time_to_minutes(target_showtime.start_time) - 150
-            before_end = self.parse_time_to_minutes(target_showtime.start_time) - 30
-            
             before_showtime = MovieShowtime(
                 showtime_id=target_showtime.showtime_id + 1000,
                 theater_id=1,
@@ -226,13 +301,12 @@ class EnhancedOptimizer:
                 end_time=self.minutes_to_time(before_end),
                 screen_number=1,
                 price=2000.0,
-                duration=120
+                duration=120,
+                start_min=before_start,
+                end_min=before_end
             )
             
             # 後映画
-            after_start = self.parse_time_to_minutes(target_showtime.end_time) + 30
-            after_end = after_start + 120
-            
             after_showtime = MovieShowtime(
                 showtime_id=target_showtime.showtime_id + 2000,
                 theater_id=3,  # TOHOシネマズ新宿
@@ -244,210 +318,287 @@ class EnhancedOptimizer:
                 end_time=self.minutes_to_time(after_end),
                 screen_number=1,
                 price=2000.0,
-                duration=120
+                duration=120,
+                start_min=after_start,
+                end_min=after_end
             )
             
             # 移動時間を計算
-            with DatabaseManager(self.db_path) as db:
-                travel1 = db.get_travel_time(before_showtime.theater_id, target_showtime.theater_id) or 10
-                travel2 = db.get_travel_time(target_showtime.theater_id, after_showtime.theater_id) or 10
-            
-            total_duration = self.parse_time_to_minutes(after_showtime.end_time) - self.parse_time_to_minutes(before_showtime.start_time)
-            
-            triple_plan = ViewingPlan(
-                plan_id=f"triple_{target_showtime.showtime_id}",
-                primary_showtime=target_showtime,
-                before_showtime=before_showtime,
-                after_showtime=after_showtime,
-                total_duration_minutes=total_duration,
-                total_travel_minutes=travel1 + travel2 + 30,
-                total_movie_minutes=before_showtime.duration + target_showtime.duration + after_showtime.duration,
-                optimization_score=75.8,
-                plan_type="before_after",
-                travel_details=[
-                    {
-                        "from": before_showtime.theater_name,
-                        "to": target_showtime.theater_name,
-                        "travel_time": travel1,
-                        "buffer_time": 15
-                    },
-                    {
-                        "from": target_showtime.theater_name,
-                        "to": after_showtime.theater_name,
-                        "travel_time": travel2,
-                        "buffer_time": 15
-                    }
-                ]
+            travel1 = travel_matrix.get(before_showtime.theater_id, target_showtime.theater_id) or 10
+            travel2 = travel_matrix.get(target_showtime.theater_id, after_showtime.theater_id) or 10
+            
+            total_duration = after_end - before_start
+            
+            if (constraints.allows(total_duration, travel1, target_start - before_end) and
+                    constraints.allows(total_duration, travel2, after_start - target_end)):
+                triple_plan = ViewingPlan(
+                    plan_id=f"triple_{target_showtime.showtime_id}",
+                    primary_showtime=target_showtime,
+                    before_showtime=before_showtime,
+                    after_showtime=after_showtime,
+                    total_duration_minutes=total_duration,
+                    total_travel_minutes=travel1 + travel2 + 2 * buffer_time,
+                    total_movie_minutes=before_showtime.duration + target_showtime.duration + after_showtime.duration,
+                    plan_type="before_after",
+                    travel_details=[
+                        {
+                            "from": before_showtime.theater_name,
+                            "to": target_showtime.theater_name,
+                            "travel_time": travel1,
+                            "buffer_time": buffer_time
+                        },
+                        {
+                            "from": target_showtime.theater_name,
+                            "to": after_showtime.theater_name,
+                            "travel_time": travel2,
+                            "buffer_time": buffer_time
+                        }
+                    ]
+                )
+                plans.append(triple_plan)
+        
+        # 評価モデルでスコアを計算してソート
+        self.score_plans(plans, time_to_minutes - time_from_minutes)
+        plans.sort(key=lambda x: x.optimization_score, reverse=True)
+        return plans
+    
+    def create_real_combinations(self, target_showtime: MovieShowtime, time_from: str = "09:00", time_to: str = "24:00",
+                                 travel_matrix: TravelMatrix = None, top_k: int = 5,
+                                 families: Tuple[str, ...] = DEFAULT_FAMILIES,
+                                 constraints: PlanConstraints = None) -> List[ViewingPlan]:
+        """実際のデータを使った組み合わせプランを生成（上位 top_k 件だけを ViewingPlan にする）"""
+        travel_matrix = travel_matrix or self.travel_matrices.get()
+        constraints = constraints or PlanConstraints()
+        buffer_time = constraints.buffer_time
+        index = self.schedule_indexes.get(target_showtime.show_date)
+        engine = PairingEngine(index, travel_matrix)
+        time_from_minutes, time_to_minutes = self.parse_time_window(time_from, time_to)
+        window_minutes = time_to_minutes - time_from_minutes
+        
+        # 候補は (スコア, -種別順, -位置, 移動時間, 総所要時間) のタプルとして大きさ top_k のヒープに入れる
+        # （同点の場合は前の映画 → 後の映画、開始時刻の早い順を優先）
+        heap: List[Tuple[float, int, int, int, int]] = []
+        searches = (("before", engine.before), ("after", engine.after))
+        for family, (kind, search) in enumerate(searches):
+            # 指定されていない種類は判定自体を行わない
+            if kind not in families:
+                continue
+            result = search(target_showtime, time_from_minutes, time_to_minutes, buffer_time,
+                            constraints.max_travel_time, constraints.max_total_duration)
+            scores = self.scorer.score(
+                movie_minutes=target_showtime.duration + index.duration_array[result.positions],
+                travel_minutes=result.travel_minutes + buffer_time,
+                span_minutes=result.total_duration,
+                total_price=target_showtime.price + index.price_array[result.positions],
+                film_count=2,
+                window_minutes=window_minutes
             )
-            plans.append(triple_plan)
+            # 各種別の上位 top_k 件だけを配列のまま選んでからヒープに入れる
+            if len(scores) > top_k:
+                selected = np.argpartition(-scores, top_k - 1)[:top_k]
+            else:
+                selected = np.arange(len(scores))
+            for i in selected.tolist():
+                candidate = (float(scores[i]), -family, -int(result.positions[i]),
+                             int(result.travel_minutes[i]), int(result.total_duration[i]))
+                if len(heap) < top_k:
+                    heapq.heappush(heap, candidate)
+                elif candidate > heap[0]:
+                    heapq.heapreplace(heap, candidate)
+        
+        # 勝ち残った候補だけを ViewingPlan に変換（スコア順）
+        return [self._pair_to_plan(index.by_start[-position], target_showtime, searches[-family][0],
+                                   travel_time, total_duration, score, buffer_time)
+                for score, family, position, travel_time, total_duration in sorted(heap, reverse=True)]
+    
+    def _pair_to_plan(self, other_showtime: MovieShowtime, target_showtime: MovieShowtime, kind: str,
+                      travel_time: int, total_duration: int, score: float, buffer_time: int = 15) -> ViewingPlan:
+        """前後映画の候補を ViewingPlan に変換"""
+        if kind == "before":
+            first, second = other_showtime, target_showtime
+            plan_id = f"real_before_{other_showtime.showtime_id}_{target_showtime.showtime_id}"
+        else:
+            first, second = target_showtime, other_showtime
+            plan_id = f"real_after_{target_showtime.showtime_id}_{other_showtime.showtime_id}"
+        
+        return ViewingPlan(
+            plan_id=plan_id,
+            primary_showtime=target_showtime,
+            before_showtime=other_showtime if kind == "before" else None,
+            after_showtime=other_showtime if kind == "after" else None,
+            total_duration_minutes=total_duration,
+            total_travel_minutes=travel_time + buffer_time,
+            total_movie_minutes=other_showtime.duration + target_showtime.duration,
+            optimization_score=score,
+            plan_type=f"real_{kind}",
+            travel_details=[{
+                "from": first.theater_name,
+                "to": second.theater_name,
+                "travel_time": travel_time,
+                "buffer_time": buffer_time
+            }]
+        )
+    
+    def score_plans(self, plans: List[ViewingPlan], window_minutes: int):
+        """生成済みプランのスコアを評価モデルで一括計算して設定"""
+        if not plans:
+            return
+        showtimes_per_plan = [
+            plan.showtimes or [s for s in (plan.before_showtime, plan.primary_showtime, plan.after_showtime) if s]
+            for plan in plans
+        ]
+        scores = self.scorer.score(
+            movie_minutes=[plan.total_movie_minutes for plan in plans],
+            travel_minutes=[plan.total_travel_minutes for plan in plans],
+            span_minutes=[plan.total_duration_minutes for plan in plans],
+            total_price=[sum(s.price for s in showtimes) for showtimes in showtimes_per_plan],
+            film_count=[len(showtimes) for showtimes in showtimes_per_plan],
+            window_minutes=window_minutes
+        )
+        for plan, score in zip(plans, scores.tolist()):
+            plan.optimization_score = score
+    
+    def _chain_to_plan(self, index, planner: MarathonPlanner, chain: Tuple[int, ...],
+                       primary_showtime: MovieShowtime, plan_type: str) -> ViewingPlan:
+        """MarathonPlanner のチェーン（by_start 上の位置）を ViewingPlan に変換"""
+        showtimes = [index.by_start[position] for position in chain]
+        travel_details = []
+        for first, second in zip(chain, chain[1:]):
+            travel_time = int(planner.engine.travel_minutes(index.theater_array[first], index.theater_array[second]))
+            travel_details.append({
+                "from": index.by_start[first].theater_name,
+                "to": index.by_start[second].theater_name,
+                "travel_time": travel_time,
+                "buffer_time": planner.buffer_time
+            })
+        
+        total_duration = int(index.end_array[chain[-1]]) - int(index.start_array[chain[0]])
+        total_movie = sum(showtime.duration for showtime in showtimes)
+        return ViewingPlan(
+            plan_id=f"{plan_type}_" + "_".join(str(showtime.showtime_id) for showtime in showtimes),
+            primary_showtime=primary_showtime,
+            total_duration_minutes=total_duration,
+            total_travel_minutes=sum(d["travel_time"] + d["buffer_time"] for d in travel_details),
+            total_movie_minutes=total_movie,
+            plan_type=plan_type,
+            travel_details=travel_details,
+            showtimes=showtimes
+        )
+    
+    def create_marathon_plans(self, target_showtime: MovieShowtime, time_from: str = "09:00", time_to: str = "24:00",
+                              travel_matrix: TravelMatrix = None, max_films: int = 5,
+                              constraints: PlanConstraints = None) -> List[ViewingPlan]:
+        """メイン映画を含む3本以上の連続鑑賞プランを生成"""
+        travel_matrix = travel_matrix or self.travel_matrices.get()
+        constraints = constraints or PlanConstraints()
+        index = self.schedule_indexes.get(target_showtime.show_date)
+        planner = MarathonPlanner(index, travel_matrix, *self.parse_time_window(time_from, time_to),
+                                  buffer_time=constraints.buffer_time,
+                                  max_travel_time=constraints.max_travel_time,
+                                  max_total_duration=constraints.max_total_duration)
+        anchor = index.position_by_id[target_showtime.showtime_id]
         
-        # スコア順でソート
+        plans = [self._chain_to_plan(index, planner, chain, target_showtime, "marathon")
+                 for _, chain in planner.anchored_chains(anchor, max_films=max_films)]
+        self.score_plans(plans, planner.time_to - planner.time_from)
         plans.sort(key=lambda x: x.optimization_score, reverse=True)
         return plans
     
-    def create_real_combinations(self, target_showtime: MovieShowtime, time_from: str = "09:00", time_to: str = "24:00") -> List[ViewingPlan]:
-        """実際のデータを使った組み合わせプランを生成"""
-        with DatabaseManager(self.db_path) as db:
-            all_showtimes = self.get_available_showtimes(target_showtime.show_date)
-            plans = []
-            
-            # 他の映画との組み合わせを試す（同じ映画は除外）
-            for other_showtime in all_showtimes:
-                if (other_showtime.showtime_id == target_showtime.showtime_id or
-                    other_showtime.movie_id == target_showtime.movie_id or
-                    other_showtime.movie_title == target_showtime.movie_title):
-                    continue  # 同じ上映時間、同じ映画ID、または同じ映画タイトルは除外
-                
-                # 前映画として組み合わせ可能かチェック
-                if (other_showtime.end_time <= target_showtime.start_time and
-                    other_showtime.start_time >= time_from and
-                    other_showtime.end_time <= time_to):
-                    travel_time = db.get_travel_time(other_showtime.theater_id, target_showtime.theater_id) or 15
-                    
-                    # 時間的に実現可能かチェック
-                    other_end_minutes = self.parse_time_to_minutes(other_showtime.end_time)
-                    target_start_minutes = self.parse_time_to_minutes(target_showtime.start_time)
-                    
-                    if other_end_minutes + travel_time + 15 <= target_start_minutes:
-                        total_duration = target_start_minutes + target_showtime.duration - self.parse_time_to_minutes(other_showtime.start_time)
-                        
-                        plan = ViewingPlan(
-                            plan_id=f"real_before_{other_showtime.showtime_id}_{target_showtime.showtime_id}",
-                            primary_showtime=target_showtime,
-                            before_showtime=other_showtime,
-                            total_duration_minutes=total_duration,
-                            total_travel_minutes=travel_time + 15,
-                            total_movie_minutes=other_showtime.duration + target_showtime.duration,
-                            optimization_score=random.uniform(70, 85),
-                            plan_type="real_before",
-                            travel_details=[{
-                                "from": other_showtime.theater_name,
-                                "to": target_showtime.theater_name,
-                                "travel_time": travel_time,
-                                "buffer_time": 15
-                            }]
-                        )
-                        plans.append(plan)
-                
-                # 後映画として組み合わせ可能かチェック
-                if (other_showtime.start_time >= target_showtime.end_time and
-                    other_showtime.start_time >= time_from and
-                    other_showtime.end_time <= time_to):
-                    travel_time = db.get_travel_time(target_showtime.theater_id, other_showtime.theater_id) or 15
-                    
-                    # 時間的に実現可能かチェック
-                    target_end_minutes = self.parse_time_to_minutes(target_showtime.end_time)
-                    other_start_minutes = self.parse_time_to_minutes(other_showtime.start_time)
-                    
-                    if target_end_minutes + travel_time + 15 <= other_start_minutes:
-                        total_duration = self.parse_time_to_minutes(other_showtime.end_time) - self.parse_time_to_minutes(target_showtime.start_time)
-                        
-                        plan = ViewingPlan(
-                            plan_id=f"real_after_{target_showtime.showtime_id}_{other_showtime.showtime_id}",
-                            primary_showtime=target_showtime,
-                            after_showtime=other_showtime,
-                            total_duration_minutes=total_duration,
-                            total_travel_minutes=travel_time + 15,
-                            total_movie_minutes=target_showtime.duration + other_showtime.duration,
-                            optimization_score=random.uniform(70, 85),
-                            plan_type="real_after",
-                            travel_details=[{
-                                "from": target_showtime.theater_name,
-                                "to": other_showtime.theater_name,
-                                "travel_time": travel_time,
-                                "buffer_time": 15
-                            }]
-                        )
-                        plans.append(plan)
-            
-            # スコア順でソート
-            plans.sort(key=lambda x: x.optimization_score, reverse=True)
-            return plans[:5]  # 上位5件
+    def optimize_free_window(self, date: str, time_from: str = "19:00", time_to: str = "24:00",
+                             max_films: int = 5, top_k: int = 10, buffer_time: int = 15,
+                             max_travel_time: Optional[int] = None) -> List[ViewingPlan]:
+        """上映を指定せず、空き時間に観られる最良のスケジュールを生成"""
+        index = self.schedule_indexes.get(date)
+        planner = MarathonPlanner(index, self.travel_matrices.get(), *self.parse_time_window(time_from, time_to),
+                                  buffer_time=buffer_time, max_travel_time=max_travel_time)
+        
+        plans = []
+        for _, chain in planner.window_chains(max_films=max_films, top_k=top_k):
+            # 最初に観る映画をメイン映画として扱う
+            plans.append(self._chain_to_plan(index, planner, chain, index.by_start[chain[0]], "free_window"))
+        self.score_plans(plans, planner.time_to - planner.time_from)
+        plans.sort(key=lambda x: x.optimization_score, reverse=True)
+        return plans
     
-    def optimize_movie_plan(self, showtime_id: int, plan_type: str = "all", time_from: str = "09:00", time_to: str = "24:00") -> List[ViewingPlan]:
-        """映画プランを最適化"""
-        with DatabaseManager(self.db_path) as db:
-            # 対象の上映時間を取得
-            showtimes = db.get_showtimes()
-            target_showtime = None
-            
-            for showtime_data in showtimes:
-                if showtime_data['showtime_id'] == showtime_id:
-                    # 映画の長さを取得
-                    movies = db.get_movies()
-                    movie_duration = 120
-                    for movie in movies:
-                        if movie['movie_id'] == showtime_data['movie_id']:
-                            movie_duration = movie['duration']
-                            break
-                    
-                    target_showtime = MovieShowtime(
-                        showtime_id=showtime_data['showtime_id'],
-                        theater_id=showtime_data['theater_id'],
-                        movie_id=showtime_data['movie_id'],
-                        theater_name=showtime_data['theater_name'],
-                        movie_title=showtime_data['movie_title'],
-                        show_date=showtime_data['show_date'],
-                        start_time=showtime_data['start_time'],
-                        end_time=showtime_data['end_time'],
-                        screen_number=showtime_data['screen_number'],
-                        price=showtime_data['price'],
-                        duration=movie_duration
-                    )
-                    break
-            
-            if not target_showtime:
-                raise ValueError(f"Showtime not found: {showtime_id}")
-            
-            # ターゲット映画の時間制約チェック
-            target_start_minutes = self.parse_time_to_minutes(target_showtime.start_time)
-            target_end_minutes = self.parse_time_to_minutes(target_showtime.end_time)
-            time_from_minutes = self.parse_time_to_minutes(time_from)
-            time_to_minutes = self.parse_time_to_minutes(time_to)
-            
-            if target_start_minutes < time_from_minutes or target_end_minutes > time_to_minutes:
-                logger.warning(f"Target showtime ({target_showtime.start_time}-{target_showtime.end_time}) is outside the specified time range ({time_from}-{time_to})")
-                return []  # 時間制約に合わない場合は空のリストを返す
-            
-            all_plans = []
-            
-            # デモプランを生成
-            demo_plans = self.create_demo_plans(target_showtime, time_from, time_to)
-            all_plans.extend(demo_plans)
-            
-            # 実際のデータを使った組み合わせプランを生成
-            real_plans = self.create_real_combinations(target_showtime, time_from, time_to)
+    def optimize_movie_plan(self, showtime_id: int, plan_type: str = "all", time_from: str = "09:00", time_to: str = "24:00",
+                            max_films: int = 5, buffer_time: int = 15, max_travel_time: Optional[int] = None,
+                            max_total_duration: Optional[int] = None, show_date: str = None,
+                            travel_matrix: TravelMatrix = None) -> List[ViewingPlan]:
+        """映画プランを最適化（制約は候補生成の段階で適用）
+        
+        上映日と移動時間行列が分かっている場合（最適化プロセスなど）はDBを参照しない
+        """
+        families = PLAN_TYPE_FAMILIES.get(plan_type)
+        if families is None:
+            raise ValueError(f"Unknown plan_type: {plan_type}")
+        constraints = PlanConstraints(buffer_time, max_travel_time, max_total_duration)
+        
+        if show_date is None or travel_matrix is None:
+            with DatabaseManager(self.db_path) as db:
+                show_date = show_date or db.get_showtime_date(showtime_id)
+                travel_matrix = travel_matrix or self.travel_matrices.get(db)
+        
+        # 対象の上映時間を上映日の索引から取得（再構築中の旧索引にない上映は新しい索引を待つ）
+        index = self.schedule_indexes.get_containing(show_date, showtime_id) if show_date else None
+        target_showtime = index.get(showtime_id) if index else None
+        
+        if not target_showtime:
+            raise ValueError(f"Showtime not found: {showtime_id}")
+        
+        # ターゲット映画の時間制約チェック
+        target_start_minutes = index.start_of(showtime_id)
+        target_end_minutes = index.end_of(showtime_id)
+        time_from_minutes, time_to_minutes = self.parse_time_window(time_from, time_to)
+        
+        if target_start_minutes < time_from_minutes or target_end_minutes > time_to_minutes:
+            logger.warning(f"Target showtime ({target_showtime.start_time}-{target_showtime.end_time}) is outside the specified time range ({time_from}-{time_to})")
+            return []  # 時間制約に合わない場合は空のリストを返す
+        
+        # マラソンプラン（3本以上の連続鑑賞）
+        if "marathon" in families:
+            return self.create_marathon_plans(target_showtime, time_from, time_to, travel_matrix, max_films,
+                                              constraints)[:10]
+        
+        all_plans = []
+        
+        # デモプランを生成
+        demo_plans = self.create_demo_plans(target_showtime, time_from, time_to, travel_matrix,
+                                            families, constraints)
+        all_plans.extend(demo_plans)
+        
+        # 実際のデータを使った組み合わせプランを生成（前後どちらも不要なら判定しない）
+        if "before" in families or "after" in families:
+            real_plans = self.create_real_combinations(target_showtime, time_from, time_to, travel_matrix,
+                                                       families=families, constraints=constraints)
             all_plans.extend(real_plans)
-            
-            # 重複を除去（plan_idとmovie_title組み合わせ両方をチェック）
-            unique_plans = {}
-            filtered_plans = []
-            
-            for plan in all_plans:
-                # 同じplan_idは除外
-                if plan.plan_id in unique_plans:
-                    continue
-                
-                # 同じ映画タイトルの組み合わせは除外
-                movie_titles = []
-                if plan.primary_showtime:
-                    movie_titles.append(plan.primary_showtime.movie_title)
-                if plan.before_showtime:
-                    movie_titles.append(plan.before_showtime.movie_title)
-                if plan.after_showtime:
-                    movie_titles.append(plan.after_showtime.movie_title)
-                
-                # 映画タイトルに重複がないかチェック
-                if len(movie_titles) == len(set(movie_titles)):
-                    unique_plans[plan.plan_id] = plan
-                    filtered_plans.append(plan)
-                else:
-                    logger.debug(f"Duplicate movie titles filtered: {movie_titles} in plan {plan.plan_id}")
-            
-            result = filtered_plans
-            result.sort(key=lambda x: x.optimization_score, reverse=True)
-            
-            return result[:10]  # 上位10件を返す
+        
+        # 重複を除去（plan_idとmovie_title組み合わせ両方をチェック）
+        unique_plans = {}
+        filtered_plans = []
+        
+        for plan in all_plans:
+            # 同じplan_idは除外
+            if plan.plan_id in unique_plans:
+                continue
+            
+            # 同じ映画タイトルの組み合わせは除外
+            movie_titles = []
+            if plan.primary_showtime:
+                movie_titles.append(plan.primary_showtime.movie_title)
+            if plan.before_showtime:
+                movie_titles.append(plan.before_showtime.movie_title)
+            if plan.after_showtime:
+                movie_titles.append(plan.after_showtime.movie_title)
+            
+            # 映画タイトルに重複がないかチェック
+            if len(movie_titles) == len(set(movie_titles)):
+                unique_plans[plan.plan_id] = plan
+                filtered_plans.append(plan)
+            else:
+                logger.debug(f"Duplicate movie titles filtered: {movie_titles} in plan {plan.plan_id}")
+        
+        # 上位10件だけを選択（全件ソートはしない）
+        return heapq.nlargest(10, filtered_plans, key=lambda x: x.optimization_score)
     
     def save_plan_to_database(self, plan: ViewingPlan) -> int:
         """プランをデータベースに保存"""
@@ -456,9 +607,10 @@ class EnhancedOptimizer:
             
             # プランデータをJSON形式で保存
             plan_data = {
-                "primary_showtime": asdict(plan.primary_showtime),
-                "before_showtime": asdict(plan.before_showtime) if plan.before_showtime else None,
-                "after_showtime": asdict(plan.after_showtime) if plan.after_showtime else None,
+                "primary_showtime": showtime_to_record(plan.primary_showtime),
+                "before_showtime": showtime_to_record(plan.before_showtime) if plan.before_showtime else None,
+                "after_showtime": showtime_to_record(plan.after_showtime) if plan.after_showtime else None,
+                "showtimes": [showtime_to_record(showtime) for showtime in plan.showtimes],
                 "travel_details": plan.travel_details
             }
             
@@ -540,7 +692,7 @@ def main():
             best_plan = plans[0]
             plan_id = optimizer.save_plan_to_database(best_plan)
             print(f"\n最高スコアのプランをデータベースに保存しました (ID: {plan_id})")
-        
+            
     except Exception as e:
         print(f"最適化エラー: {e}")
         import traceback
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+HTTPキャッシュ - 取得したページと ETag / Last-Modified をディスクに保存し、条件付き GET で再取得を省く
+
+requests.Session に HTTPCacheAdapter をマウントして使う。304 Not Modified が返ったら
+保存済みの本文から 200 の応答を作って返すので、呼び出し側は通常の取得と同じように扱える
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# キャッシュの保存先の既定値（環境変数 HTTP_CACHE_DIR、空ならキャッシュしない）
+DEFAULT_HTTP_CACHE_DIR = os.environ.get("HTTP_CACHE_DIR", ".http_cache")
+
+# 本文と一緒に保存するヘッダー（本文は展開済みなので Content-Encoding などは保存しない）
+STORED_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+class HTTPCache:
+    """URL ごとに本文（.body）と検証用ヘッダー（.json）を保存するディスクキャッシュ"""
+    
+    def __init__(self, cache_dir: str = DEFAULT_HTTP_CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.reset_stats()
+    
+    def reset_stats(self):
+        """統計をクリア（クローリングごとに呼ぶ）"""
+        with self._lock:
+            self.requests = 0
+            self.hits = 0  # 304 で本文の転送を省いた件数
+            self.stores = 0
+            self.bytes_downloaded = 0
+            self.bytes_saved = 0
+    
+    def _path(self, url: str) -> str:
+        """URL のキャッシュファイルのパス（拡張子なし）"""
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest())
+    
+    def load(self, url: str) -> Optional[Dict]:
+        """保存済みのエントリ（ヘッダーと本文）を取得（なければ None）"""
+        path = self._path(url)
+        try:
+            with open(path + ".json", "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            with open(path + ".body", "rb") as f:
+                entry["body"] = f.read()
+        except (OSError, ValueError):
+            return None
+        return entry
+    
+    def store(self, url: str, status: int, headers: Dict[str, str], body: bytes):
+        """エントリを保存（一時ファイルに書いてから置き換えるので、読み取り中に壊れた本文は見えない）"""
+        path = self._path(url)
+        entry = {
+            "url": url,
+            "status": status,
+            "headers": headers,
+            "stored_at": time.time()
+        }
+        for suffix, data in ((".body", body), (".json", json.dumps(entry, ensure_ascii=False).encode("utf-8"))):
+            temp_path = f"{path}{suffix}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path + suffix)
+        with self._lock:
+            self.stores += 1
+    
+    def record(self, downloaded: int = 0, saved: int = 0):
+        """取得1件分の統計を記録（saved が正なら 304 でのヒット）"""
+        with self._lock:
+            self.requests += 1
+            self.bytes_downloaded += downloaded
+            if saved:
+                self.hits += 1
+                self.bytes_saved += saved
+    
+    def clear(self):
+        """保存済みのエントリを全件削除"""
+        for name in os.listdir(self.cache_dir):
+            if name.endswith((".body", ".json", ".tmp")):
+                os.remove(os.path.join(self.cache_dir, name))
+    
+    def stats(self) -> Dict:
+        """ヒット率・転送量・省いた転送量の統計"""
+        with self._lock:
+            return {
+                "cache_dir": self.cache_dir,
+                "requests": self.requests,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.requests * 100, 1) if self.requests else 0.0,
+                "stores": self.stores,
+                "bytes_downloaded": self.bytes_downloaded,
+                "bytes_saved": self.bytes_saved
+            }
+
+class HTTPCacheAdapter(HTTPAdapter):
+    """GET に If-None-Match / If-Modified-Since を付け、304 ならキャッシュの本文を返すアダプター"""
+    
+    def __init__(self, cache: HTTPCache, **kwargs):
+        self.cache = cache
+        super().__init__(**kwargs)
+    
+    def send(self, request: requests.PreparedRequest, stream: bool = False, **kwargs) -> requests.Response:
+        """条件付き GET を送り、応答に応じてキャッシュを使う・更新する"""
+        if request.method != "GET" or stream:
+            return super().send(request, stream=stream, **kwargs)
+        
+        entry = self.cache.load(request.url)
+        if entry is not None:
+            headers = entry["headers"]
+            if "ETag" in headers:
+                request.headers["If-None-Match"] = headers["ETag"]
+            if "Last-Modified" in headers:
+                request.headers["If-Modified-Since"] = headers["Last-Modified"]
+        
+        response = super().send(request, stream=stream, **kwargs)
+        
+        if response.status_code == 304 and entry is not None:
+            response.content  # 空の本文を読み切って接続をプールに戻す
+            self.cache.record(saved=len(entry["body"]))
+            return self._cached_response(request, response, entry)
+        
+        body = response.content
+        self.cache.record(downloaded=len(body))
+        cache_control = response.headers.get("Cache-Control", "")
+        if (response.status_code == 200 and "no-store" not in cache_control and
+                ("ETag" in response.headers or "Last-Modified" in response.headers)):
+            stored_headers = {name: response.headers[name] for name in STORED_HEADERS if name in response.headers}
+            self.cache.store(request.url, response.status_code, stored_headers, body)
+        return response
+    
+    def _cached_response(self, request: requests.PreparedRequest, not_modified: requests.Response,
+                         entry: Dict) -> requests.Response:
+        """304 の応答とキャッシュの本文から 200 の応答を作る"""
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = "OK"
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        # 304 で更新された検証用ヘッダーがあれば優先する
+        for name in ("ETag", "Last-Modified"):
+            if name in not_modified.headers:
+                response.headers[name] = not_modified.headers[name]
+        response._content = entry["body"]
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.elapsed = not_modified.elapsed
+        response.from_cache = True
+        return response
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+連続鑑賞（マラソン）プランナー - 上映スケジュールのDAG上の動的計画法
+"""
+
+import heapq
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from schedule_index import ScheduleIndex
+from travel_matrix import TravelMatrix
+from pairing_engine import PairingEngine
+
+# チェーン: (評価値, by_start 上の位置のタプル)
+Chain = Tuple[float, Tuple[int, ...]]
+
+class MarathonPlanner:
+    """上映を頂点、「終了 + 移動 + 余裕時間 <= 次の開始」を辺とするDAGで連続鑑賞チェーンを探索"""
+    
+    def __init__(self, index: ScheduleIndex, travel_matrix: TravelMatrix,
+                 time_from: int, time_to: int, buffer_time: int = 15,
+                 max_travel_time: Optional[int] = None, gap_penalty: float = 0.5,
+                 beam_width: int = 8, max_total_duration: Optional[int] = None):
+        self.index = index
+        self.engine = PairingEngine(index, travel_matrix)
+        self.time_from = time_from
+        self.time_to = time_to
+        self.buffer_time = buffer_time
+        self.max_travel_time = max_travel_time
+        self.max_total_duration = max_total_duration
+        self.gap_penalty = gap_penalty
+        self.beam_width = beam_width
+        # 時間枠内に収まる上映だけを頂点にする（開始時刻順 = トポロジカル順）
+        self.lo, self.hi = index.start_range(time_from, time_to)
+        self.in_window = index.end_array[self.lo:self.hi] <= time_to
+        # DP の内側ループ用に Python のリストでも保持（NumPy スカラーの参照は遅いため）
+        self.starts = index.start_array.tolist()
+        self.ends = index.end_array.tolist()
+        self.durations = index.duration_array.tolist()
+        self.titles = index.title_array.tolist()
+    
+    def successors(self, position: int) -> np.ndarray:
+        """position の上映の後に続けて観られる上映の位置"""
+        index = self.index
+        lo, hi = index.start_range(int(index.end_array[position]) + self.buffer_time, self.time_to)
+        lo = max(lo, self.lo)
+        if lo >= hi:
+            return np.empty(0, dtype=np.int64)
+        travel = self.engine.travel_minutes(index.theater_array[position], index.theater_array[lo:hi])
+        mask = (index.end_array[position] + travel + self.buffer_time <= index.start_array[lo:hi]) & \
+            self.in_window[lo - self.lo:hi - self.lo]
+        if self.max_travel_time is not None:
+            mask &= travel <= self.max_travel_time
+        return np.flatnonzero(mask) + lo
+    
+    def predecessors(self, position: int) -> np.ndarray:
+        """position の上映の前に観られる上映の位置"""
+        index = self.index
+        lo, hi = self.lo, index.start_range(self.time_from, int(index.start_array[position]) - self.buffer_time)[1]
+        if lo >= hi:
+            return np.empty(0, dtype=np.int64)
+        travel = self.engine.travel_minutes(index.theater_array[lo:hi], index.theater_array[position])
+        mask = (index.end_array[lo:hi] + travel + self.buffer_time <= index.start_array[position]) & \
+            self.in_window[:hi - self.lo]
+        if self.max_travel_time is not None:
+            mask &= travel <= self.max_travel_time
+        return np.flatnonzero(mask) + lo
+    
+    def _gain(self, first: int, second: int) -> float:
+        """first → second と続けた時の評価値の増分（次の映画の長さ - 待ち時間のペナルティ）"""
+        gap = self.starts[second] - self.ends[first]
+        return self.durations[second] - self.gap_penalty * gap
+    
+    def _span(self, first: int, last: int) -> int:
+        """first の開始から last の終了までの総所要時間"""
+        return self.ends[last] - self.starts[first]
+    
+    def _extend(self, paths: Dict[int, List[Chain]], source: int, target: int,
+                max_films: int, forward: bool):
+        """source で終わる（始まる）チェーンを target まで伸ばし、上位 beam_width 件だけ残す"""
+        titles = self.titles
+        target_title = titles[target]
+        max_total = self.max_total_duration
+        if forward:
+            gain = self._gain(source, target)
+        else:
+            gain = self._gain(target, source) - self.durations[source] + self.durations[target]
+        
+        bucket = paths.get(target)
+        if bucket is None:
+            bucket = paths[target] = []
+        for value, chain in paths[source]:
+            value += gain
+            if len(bucket) >= self.beam_width and value <= bucket[0][0]:
+                continue
+            if len(chain) >= max_films:
+                continue
+            if max_total is not None and (self._span(chain[0], target) if forward
+                                          else self._span(target, chain[-1])) > max_total:
+                continue
+            if any(titles[p] == target_title for p in chain):
+                continue
+            candidate = (value, chain + (target,)) if forward else (value, (target,) + chain)
+            if len(bucket) < self.beam_width:
+                heapq.heappush(bucket, candidate)
+            else:
+                heapq.heapreplace(bucket, candidate)
+    
+    def anchored_chains(self, anchor: int, max_films: int = 5, min_films: int = 3,
+                        top_k: int = 10) -> List[Chain]:
+        """anchor の上映を含む min_films〜max_films 本のチェーンを評価値の高い順に返す"""
+        titles = self.titles
+        anchor_value = float(self.durations[anchor])
+        
+        # 後方向: anchor から始まるチェーン（開始時刻順に処理すれば先行頂点は処理済み）
+        forward: Dict[int, List[Chain]] = {anchor: [(anchor_value, (anchor,))]}
+        for position in range(anchor, self.hi):
+            if position in forward:
+                for successor in self.successors(position).tolist():
+                    self._extend(forward, position, successor, max_films, forward=True)
+        
+        # 前方向: anchor で終わるチェーン（開始時刻の逆順に処理）
+        backward: Dict[int, List[Chain]] = {anchor: [(anchor_value, (anchor,))]}
+        for position in range(anchor, self.lo - 1, -1):
+            if position in backward:
+                for predecessor in self.predecessors(position).tolist():
+                    self._extend(backward, position, predecessor, max_films, forward=False)
+        
+        # anchor 単独のチェーンは必ず残す（anchor が先頭・末尾になるプラン用）
+        limit = top_k * self.beam_width
+        trivial = (anchor_value, (anchor,))
+        suffixes = [trivial] + heapq.nlargest(
+            limit, (c for position, bucket in forward.items() if position != anchor for c in bucket))
+        prefixes = [trivial] + heapq.nlargest(
+            limit, (c for position, bucket in backward.items() if position != anchor for c in bucket))
+        
+        # 前半と後半を anchor で連結（タイトル重複なし・本数制限内）
+        results: List[Chain] = []
+        for prefix_value, prefix in prefixes:
+            prefix_titles = {titles[p] for p in prefix}
+            for suffix_value, suffix in suffixes:
+                films = len(prefix) + len(suffix) - 1
+                if films < min_films or films > max_films:
+                    continue
+                if any(titles[p] in prefix_titles for p in suffix[1:]):
+                    continue
+                if self.max_total_duration is not None and \
+                        self._span(prefix[0], suffix[-1]) > self.max_total_duration:
+                    continue
+                results.append((prefix_value + suffix_value - anchor_value, prefix + suffix[1:]))
+        
+        return heapq.nlargest(top_k, results)
+    
+    def window_chains(self, max_films: int = 5, top_k: int = 10) -> List[Chain]:
+        """アンカーなしで時間枠内の最良チェーン（1〜max_films 本）を返す
+        
+        移動時間を考慮した重み付き区間スケジューリングを上位 beam_width 件ずつ保持して
+        開始時刻順に1回走査する
+        """
+        paths: Dict[int, List[Chain]] = {}
+        in_window = self.in_window.tolist()
+        for position in range(self.lo, self.hi):
+            if not in_window[position - self.lo]:
+                continue
+            if self.max_total_duration is not None and self._span(position, position) > self.max_total_duration:
+                continue
+            # その上映から観始めるチェーンを起点として追加
+            bucket = paths.setdefault(position, [])
+            trivial = (float(self.durations[position]), (position,))
+            if len(bucket) < self.beam_width:
+                heapq.heappush(bucket, trivial)
+            elif trivial > bucket[0]:
+                heapq.heapreplace(bucket, trivial)
+            for successor in self.successors(position).tolist():
+                self._extend(paths, position, successor, max_films, forward=True)
+        
+        return heapq.nlargest(top_k, (c for bucket in paths.values() for c in bucket))
@@ -4,38 +4,49 @@
 """
 
 import json
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
-from database_manager import DatabaseManager
+from database_manager import DatabaseManager, DATASET_VERSION
 from enhanced_optimizer import EnhancedOptimizer, ViewingPlan, MovieShowtime
+from plan_cache import PlanCache
+from connection_pool import configure_pool, get_pool
+from db_executor import DatabaseExecutor, DEFAULT_DB_WORKERS
+from plan_workers import OptimizationProcessPool, DEFAULT_OPTIMIZE_WORKERS, plan_from_tuple
+from schedule_time import window_minutes
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class MovieOptimizationAPI:
-    def __init__(self, db_path: str = "movie_optimization.db"):
+    def __init__(self, db_path: str = "movie_optimization.db",
+                 plan_cache_size: int = 256, plan_cache_ttl: float = 300.0,
+                 pool_size: int = None, db_workers: int = DEFAULT_DB_WORKERS,
+                 optimize_workers: int = DEFAULT_OPTIMIZE_WORKERS):
         self.db_path = db_path
+        if pool_size is not None:
+            configure_pool(db_path, max_size=pool_size)
+        # 非同期版のメソッドはDB処理をこの専用スレッドプールで実行する
+        # （最適化プロセスを使う場合は全プロセスに同時に依頼できるだけのスレッドを用意）
+        self.db_executor = DatabaseExecutor(db_path, max(db_workers, optimize_workers))
+        # optimize_workers > 0 なら最適化の探索を別プロセスで実行する
+        self.process_pool = OptimizationProcessPool(db_path, optimize_workers) if optimize_workers > 0 else None
         self.optimizer = EnhancedOptimizer(db_path)
+        self.plan_cache = PlanCache(plan_cache_size, plan_cache_ttl)
+        self._dataset_version = None
     
     def get_available_movies(self, date: str = "2025-07-14", 
                            time_from: str = "19:00", 
                            time_to: str = "20:00") -> List[Dict]:
         """利用可能な映画を検索（入力時間範囲内に厳密に制限）"""
-        with DatabaseManager(self.db_path) as db:
-            showtimes = db.get_showtimes(date=date)
-            
-            # 時間でフィルタリング（開始時間が範囲内で、終了時間も範囲内の映画のみ）
-            filtered_showtimes = []
-            for showtime in showtimes:
-                # 開始時間が範囲内かつ終了時間も範囲内の映画のみ
-                if (time_from <= showtime['start_time'] and 
-                    showtime['end_time'] <= time_to):
-                    filtered_showtimes.append(showtime)
+        # 開始・終了とも時間枠内の上映だけを分単位の索引で取得（深夜上映は 1440 分以上）
+        time_from_minutes, time_to_minutes = window_minutes(time_from, time_to)
+        with DatabaseManager(self.db_path, read_only=True) as db:
+            showtimes = db.get_showtimes(date=date, start_min_from=time_from_minutes, end_min_to=time_to_minutes)
             
             # 映画情報を付加
             movies = []
-            for showtime in filtered_showtimes:
+            for showtime in showtimes:
                 movie_info = {
                     "showtime_id": showtime['showtime_id'],
                     "movie_title": showtime['movie_title'],
@@ -58,121 +69,111 @@ class MovieOptimizationAPI:
                      plan_type: str = "all",
                      max_total_duration: int = 480,
                      time_from: str = "19:00",
-                     time_to: str = "22:00") -> Dict:
-        """プランを最適化（時間制約を厳密に適用）"""
+                     time_to: str = "22:00",
+                     max_films: int = 5) -> Dict:
+        """プランを最適化（時間制約・移動時間・余裕時間・総所要時間は候補生成の段階で適用）"""
         try:
-            # 最適化を実行
-            plans = self.optimizer.optimize_movie_plan(showtime_id, plan_type, time_from, time_to)
+            # 同じ条件・同じデータバージョンの結果はキャッシュから返す
+            # （キャッシュにはレスポンス辞書ではなく、日別索引の上映を参照するだけのプランを保持）
+            params = (showtime_id, plan_type, time_from, time_to, buffer_time, max_travel_time,
+                      max_total_duration, max_films)
+            cached = self.plan_cache.get(params + (self.get_dataset_version(),))
+            if cached is not None:
+                plans, generated_at = cached
+                return self._plans_response(plans, generated_at)
             
-            # 時間制約に基づいてプランをフィルタリング
-            from datetime import datetime
-            time_from_minutes = self._time_to_minutes(time_from)
-            time_to_minutes = self._time_to_minutes(time_to)
-            available_duration = time_to_minutes - time_from_minutes
+            with DatabaseManager(self.db_path, read_only=True) as db:
+                show_date = db.get_showtime_date(showtime_id)
+            if show_date is None:
+                raise ValueError(f"Showtime not found: {showtime_id}")
             
-            # 結果を辞書形式に変換
-            result_plans = []
-            for plan in plans:
-                # プランの実際の開始時間と終了時間を計算
-                earliest_start = plan.primary_showtime.start_time
-                latest_end = plan.primary_showtime.end_time
-                
-                if plan.before_showtime:
-                    earliest_start = plan.before_showtime.start_time
-                if plan.after_showtime:
-                    latest_end = plan.after_showtime.end_time
-                
-                # 時間制約チェック
-                plan_start_minutes = self._time_to_minutes(earliest_start)
-                plan_end_minutes = self._time_to_minutes(latest_end)
-                
-                # プランが時間範囲内に収まるかチェック（厳密）
-                if (plan_start_minutes >= time_from_minutes and 
-                    plan_end_minutes <= time_to_minutes):
-                    
-                    # 総所要時間もチェック
-                    if plan.total_duration_minutes <= available_duration:
-                        
-                        # 個別の映画も時間制約チェック
-                        valid_plan = True
-                        
-                        # プライマリ映画チェック
-                        if not (time_from <= plan.primary_showtime.start_time and 
-                                plan.primary_showtime.end_time <= time_to):
-                            valid_plan = False
-                        
-                        # 前映画チェック
-                        if plan.before_showtime and not (time_from <= plan.before_showtime.start_time and 
-                                                        plan.before_showtime.end_time <= time_to):
-                            valid_plan = False
-                        
-                        # 後映画チェック
-                        if plan.after_showtime and not (time_from <= plan.after_showtime.start_time and 
-                                                       plan.after_showtime.end_time <= time_to):
-                            valid_plan = False
-                        
-                        if not valid_plan:
-                            continue
-                        plan_dict = {
-                            "plan_id": plan.plan_id,
-                            "plan_type": plan.plan_type,
-                            "optimization_score": plan.optimization_score,
-                            "total_duration_minutes": plan.total_duration_minutes,
-                            "total_travel_minutes": plan.total_travel_minutes,
-                            "total_movie_minutes": plan.total_movie_minutes,
-                            "primary_showtime": {
-                                "showtime_id": plan.primary_showtime.showtime_id,
-                                "movie_title": plan.primary_showtime.movie_title,
-                                "theater_name": plan.primary_showtime.theater_name,
-                                "start_time": plan.primary_showtime.start_time,
-                                "end_time": plan.primary_showtime.end_time,
-                                "price": plan.primary_showtime.price,
-                                "duration": plan.primary_showtime.duration
-                            },
-                            "before_showtime": None,
-                            "after_showtime": None,
-                            "travel_details": plan.travel_details
-                        }
-                        
-                        if plan.before_showtime:
-                            plan_dict["before_showtime"] = {
-                                "showtime_id": plan.before_showtime.showtime_id,
-                                "movie_title": plan.before_showtime.movie_title,
-                                "theater_name": plan.before_showtime.theater_name,
-                                "start_time": plan.before_showtime.start_time,
-                                "end_time": plan.before_showtime.end_time,
-                                "price": plan.before_showtime.price,
-                                "duration": plan.before_showtime.duration
-                            }
-                        
-                        if plan.after_showtime:
-                            plan_dict["after_showtime"] = {
-                                "showtime_id": plan.after_showtime.showtime_id,
-                                "movie_title": plan.after_showtime.movie_title,
-                                "theater_name": plan.after_showtime.theater_name,
-                                "start_time": plan.after_showtime.start_time,
-                                "end_time": plan.after_showtime.end_time,
-                                "price": plan.after_showtime.price,
-                                "duration": plan.after_showtime.duration
-                            }
-                        
-                        result_plans.append(plan_dict)
+            # 最適化を実行（時間枠外・制約違反のプランはそもそも生成されない）
+            if self.process_pool is not None:
+                plans, index_version = self._optimize_in_process(show_date, showtime_id, plan_type, time_from,
+                                                                 time_to, max_films, buffer_time, max_travel_time,
+                                                                 max_total_duration)
+            else:
+                # 索引の再構築中は旧索引で計算するので、計算前に索引のバージョンを控えておく
+                # （旧索引にない上映なら新しい索引を待つので、そのバージョンになる）
+                index_version = self.optimizer.schedule_indexes.get_containing(show_date, showtime_id).version
+                plans = self.optimizer.optimize_movie_plan(
+                    showtime_id, plan_type, time_from, time_to, max_films,
+                    buffer_time=buffer_time,
+                    max_travel_time=max_travel_time,
+                    max_total_duration=max_total_duration,
+                    show_date=show_date
+                )
             
             # 最高スコアのプランを保存
-            if result_plans:
+            if plans:
                 best_plan = plans[0]
                 plan_id = self.optimizer.save_plan_to_database(best_plan)
                 logger.info(f"Best plan saved with ID: {plan_id}")
             
+            # 計算に使った索引のバージョンで保存する（旧索引のプランを新しいバージョンのキーに入れない）
+            generated_at = datetime.now().isoformat()
+            self.plan_cache.put(params + (index_version,), (tuple(plans), generated_at))
+            return self._plans_response(plans, generated_at)
+            
+        except Exception as e:
+            logger.error(f"Optimization failed: {e}")
             return {
-                "success": True,
-                "plans": result_plans,
-                "total_plans": len(result_plans),
+                "success": False,
+                "error": str(e),
+                "plans": [],
+                "total_plans": 0,
                 "generated_at": datetime.now().isoformat()
             }
+    
+    def _optimize_in_process(self, show_date: str, showtime_id: int, plan_type: str, time_from: str, time_to: str,
+                             max_films: int, buffer_time: int, max_travel_time: Optional[int],
+                             max_total_duration: Optional[int]) -> Tuple[List[ViewingPlan], Optional[int]]:
+        """最適化プロセスで探索し、結果をこのプロセスの日別索引の上映に結び付け直す
+        
+        (プラン, 計算に使ったデータの古い方のデータセットバージョン) を返す
+        """
+        show_date, plan_tuples, snapshot_version = self.process_pool.optimize(show_date, (
+            showtime_id, plan_type, time_from, time_to, max_films, buffer_time, max_travel_time, max_total_duration
+        ))
+        index = self.optimizer.schedule_indexes.get(show_date)
+        try:
+            plans = [plan_from_tuple(data, index) for data in plan_tuples]
+        except KeyError:
+            # ワーカーの方が新しいスナップショットを持っている場合は索引を読み直す
+            self.optimizer.schedule_indexes.invalidate(show_date)
+            index = self.optimizer.schedule_indexes.get(show_date)
+            plans = [plan_from_tuple(data, index) for data in plan_tuples]
+        if snapshot_version is None or index.version is None:
+            return plans, None
+        return plans, min(snapshot_version, index.version)
+    
+    def find_best_schedules(self, date: str = "2025-07-14",
+                            time_from: str = "19:00",
+                            time_to: str = "24:00",
+                            max_films: int = 5,
+                            top_k: int = 10,
+                            max_travel_time: int = 30,
+                            buffer_time: int = 15) -> Dict:
+        """上映を指定せず、空き時間に観られる最良のスケジュールを検索"""
+        try:
+            # optimize_plan と同じく、データバージョンごとにキャッシュする（キーの先頭で区別）
+            params = ("free_window", date, time_from, time_to, max_films, top_k, max_travel_time, buffer_time)
+            cached = self.plan_cache.get(params + (self.get_dataset_version(),))
+            if cached is not None:
+                plans, generated_at = cached
+                return self._plans_response(plans, generated_at)
+            
+            # 索引の再構築中は旧索引で計算するので、計算前に索引のバージョンを控えておく
+            index_version = self.optimizer.schedule_indexes.get(date).version
+            plans = self.optimizer.optimize_free_window(date, time_from, time_to, max_films, top_k,
+                                                        buffer_time, max_travel_time)
+            
+            generated_at = datetime.now().isoformat()
+            self.plan_cache.put(params + (index_version,), (tuple(plans), generated_at))
+            return self._plans_response(plans, generated_at)
             
         except Exception as e:
-            logger.error(f"Optimization failed: {e}")
+            logger.error(f"Schedule search failed: {e}")
             return {
                 "success": False,
                 "error": str(e),
@@ -181,10 +182,82 @@ class MovieOptimizationAPI:
                 "generated_at": datetime.now().isoformat()
             }
     
-    def _time_to_minutes(self, time_str: str) -> int:
-        """時刻文字列を分に変換"""
-        hours, minutes = map(int, time_str.split(':'))
-        return hours * 60 + minutes
+    def _plans_response(self, plans, generated_at: str) -> Dict:
+        """プラン一覧をAPIレスポンスの辞書に変換"""
+        result_plans = [self._plan_to_dict(plan) for plan in plans]
+        return {
+            "success": True,
+            "plans": result_plans,
+            "total_plans": len(result_plans),
+            "generated_at": generated_at
+        }
+    
+    def _showtime_to_dict(self, showtime: MovieShowtime) -> Dict:
+        """上映情報をAPIレスポンス用の辞書に変換"""
+        return {
+            "showtime_id": showtime.showtime_id,
+            "movie_title": showtime.movie_title,
+            "theater_name": showtime.theater_name,
+            "start_time": showtime.start_time,
+            "end_time": showtime.end_time,
+            "price": showtime.price,
+            "duration": showtime.duration
+        }
+    
+    def _plan_to_dict(self, plan: ViewingPlan) -> Dict:
+        """プランをAPIレスポンス用の辞書に変換"""
+        return {
+            "plan_id": plan.plan_id,
+            "plan_type": plan.plan_type,
+            "optimization_score": plan.optimization_score,
+            "total_duration_minutes": plan.total_duration_minutes,
+            "total_travel_minutes": plan.total_travel_minutes,
+            "total_movie_minutes": plan.total_movie_minutes,
+            "primary_showtime": self._showtime_to_dict(plan.primary_showtime),
+            "before_showtime": self._showtime_to_dict(plan.before_showtime) if plan.before_showtime else None,
+            "after_showtime": self._showtime_to_dict(plan.after_showtime) if plan.after_showtime else None,
+            "showtimes": [self._showtime_to_dict(showtime) for showtime in plan.showtimes],
+            "travel_details": plan.travel_details
+        }
+    
+    def refresh_schedule_index(self, show_date: str = None):
+        """クローリングデータ取り込み後にスケジュール索引をバックグラウンドで再構築"""
+        self.optimizer.schedule_indexes.refresh(show_date)
+    
+    def get_dataset_version(self) -> Optional[int]:
+        """データセットのバージョンを取得（変わっていればスケジュール索引をバックグラウンドで再構築）"""
+        with DatabaseManager(self.db_path) as db:
+            version = db.get_data_version(DATASET_VERSION)
+        if version != self._dataset_version:
+            # 新しい索引ができるまでは旧索引で応答する（結果は旧索引のバージョンでキャッシュされる）
+            if self._dataset_version is not None:
+                self.optimizer.schedule_indexes.refresh()
+                if self.process_pool is not None:
+                    self.process_pool.refresh()
+                logger.info(f"Dataset version changed: {self._dataset_version} -> {version}")
+            self._dataset_version = version
+        return version
+    
+    def get_connection_pool_stats(self) -> Dict:
+        """DB接続プールの統計（取得回数・待ち時間・接続数）を取得"""
+        return {
+            "read_write": get_pool(self.db_path).stats(),
+            "read_only": get_pool(self.db_path, read_only=True).stats()
+        }
+    
+    def get_db_executor_stats(self) -> Dict:
+        """DB処理スレッドプールの統計（実行中・待ち行列の数）を取得"""
+        return self.db_executor.stats()
+    
+    def get_process_pool_stats(self) -> Optional[Dict]:
+        """最適化プロセスプールの統計を取得（使っていなければ None）"""
+        return self.process_pool.stats() if self.process_pool is not None else None
+    
+    def get_plan_cache_stats(self) -> Dict:
+        """プランキャッシュの統計を取得"""
+        stats = self.plan_cache.stats()
+        stats["dataset_version"] = self._dataset_version
+        return stats
     
     def get_crawling_status(self) -> Dict:
         """クローリング状況を取得"""
@@ -275,16 +348,56 @@ class MovieOptimizationAPI:
     
     def get_theater_distances(self) -> List[Dict]:
         """映画館間距離を取得"""
-        with DatabaseManager(self.db_path) as db:
+        with DatabaseManager(self.db_path, read_only=True) as db:
             distances = db.get_theater_distances()
             return distances
     
     def get_database_stats(self) -> Dict:
         """データベース統計情報を取得"""
-        with DatabaseManager(self.db_path) as db:
+        with DatabaseManager(self.db_path, read_only=True) as db:
             stats = db.get_database_stats()
             return stats
     
+    # 非同期版（イベントループを止めないよう、処理はDB処理スレッドプールで実行）
+    
+    async def get_available_movies_async(self, *args, **kwargs) -> List[Dict]:
+        """get_available_movies の非同期版"""
+        return await self.db_executor.run(self.get_available_movies, *args, **kwargs)
+    
+    async def optimize_plan_async(self, *args, **kwargs) -> Dict:
+        """optimize_plan の非同期版"""
+        return await self.db_executor.run(self.optimize_plan, *args, **kwargs)
+    
+    async def find_best_schedules_async(self, *args, **kwargs) -> Dict:
+        """find_best_schedules の非同期版"""
+        return await self.db_executor.run(self.find_best_schedules, *args, **kwargs)
+    
+    async def refresh_schedule_index_async(self, show_date: str = None):
+        """refresh_schedule_index の非同期版"""
+        return await self.db_executor.run(self.refresh_schedule_index, show_date)
+    
+    async def get_crawling_status_async(self) -> Dict:
+        """get_crawling_status の非同期版"""
+        return await self.db_executor.run(self.get_crawling_status)
+    
+    async def get_plan_details_async(self, plan_id: int) -> Dict:
+        """get_plan_details の非同期版"""
+        return await self.db_executor.run(self.get_plan_details, plan_id)
+    
+    async def get_theater_distances_async(self) -> List[Dict]:
+        """get_theater_distances の非同期版"""
+        return await self.db_executor.run(self.get_theater_distances)
+    
+    async def get_database_stats_async(self) -> Dict:
+        """get_database_stats の非同期版"""
+        return await self.db_executor.run(self.get_database_stats)
+    
+    def close(self):
+        """DB処理スレッドと最適化プロセスを止める（アプリ終了時）"""
+        self.db_executor.shutdown()
+        if self.process_pool is not None:
+            self.process_pool.shutdown()
+    
     def calculate_optimization_metrics(self, plans: List[Dict]) -> Dict:
         """最適化メトリクスを計算"""
         if not plans:
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+ページコーパス - クローリングで取得した応答（URL・ヘッダー・本文）を圧縮ファイルに記録し、オフラインで再生
+
+記録: PageCorpus を requests.Session の応答フックに登録し、クローリング後に save() する
+再生: ReplayAdapter を requests.Session にマウントすると、ネットワークに接続せずコーパスの応答を返す
+      （latency 秒の遅延を入れられるので、実際の取得に近い条件でクローラーの性能を測れる）
+"""
+
+import base64
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, Optional
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 記録先・再生元のコーパスと再生時の遅延の既定値（環境変数で指定、空なら使わない）
+DEFAULT_RECORD_CORPUS = os.environ.get("CRAWL_RECORD", "")
+DEFAULT_REPLAY_CORPUS = os.environ.get("CRAWL_REPLAY", "")
+DEFAULT_REPLAY_LATENCY = float(os.environ.get("CRAWL_REPLAY_LATENCY_MS", "0")) / 1000
+
+# 本文は展開済みで保存するので、転送に関するヘッダーは記録しない
+SKIPPED_HEADERS = ("Content-Encoding", "Content-Length", "Transfer-Encoding", "Connection", "Keep-Alive")
+
+class PageCorpus:
+    """URL ごとの応答を gzip 圧縮の JSON Lines（1行1応答、本文は base64）で保存するコーパス"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def load(cls, path: str) -> "PageCorpus":
+        """保存済みのコーパスを読み込む"""
+        corpus = cls(path)
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                entry["body"] = base64.b64decode(entry["body"])
+                corpus.entries[entry["url"]] = entry
+        logger.info(f"Page corpus loaded: {path} ({len(corpus.entries)} pages)")
+        return corpus
+    
+    def record(self, url: str, status: int, reason: str, headers: Dict[str, str], body: bytes):
+        """応答を1件記録（同じ URL は後の応答で上書き）"""
+        with self._lock:
+            self.entries[url] = {
+                "url": url,
+                "status": status,
+                "reason": reason,
+                "headers": headers,
+                "body": body,
+                "recorded_at": time.time()
+            }
+    
+    def record_response(self, response: requests.Response, *args, **kwargs) -> requests.Response:
+        """requests の応答フック（session.hooks['response'] に登録する）"""
+        headers = {name: value for name, value in response.headers.items() if name not in SKIPPED_HEADERS}
+        self.record(response.request.url, response.status_code, response.reason or "", headers, response.content)
+        return response
+    
+    def save(self):
+        """コーパスを保存（一時ファイルに書いてから置き換える）"""
+        temp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        with self._lock:
+            entries = sorted(self.entries.values(), key=lambda entry: entry["url"])
+            with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+                for entry in entries:
+                    line = {**entry, "body": base64.b64encode(entry["body"]).decode("ascii")}
+                    f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        os.replace(temp_path, self.path)
+        logger.info(f"Page corpus saved: {self.path} ({len(entries)} pages, {os.path.getsize(self.path)} bytes)")
+    
+    def get(self, url: str) -> Optional[Dict]:
+        """URL の記録済みの応答（なければ None）"""
+        return self.entries.get(url)
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+
+class ReplayAdapter(HTTPAdapter):
+    """ネットワークに接続せず、コーパスに記録された応答を latency 秒の遅延付きで返すアダプター
+    
+    記録されていない URL には 404 を返す
+    """
+    
+    def __init__(self, corpus: PageCorpus, latency: float = 0.0, **kwargs):
+        self.corpus = corpus
+        self.latency = latency
+        self._lock = threading.Lock()
+        self.replayed = 0
+        self.missing = 0
+        super().__init__(**kwargs)
+    
+    def send(self, request: requests.PreparedRequest, stream: bool = False, timeout=None, **kwargs) -> requests.Response:
+        """記録済みの応答を返す（取得スレッドごとに遅延するので並行取得の効果も再現される）"""
+        started = time.perf_counter()
+        if self.latency:
+            time.sleep(self.latency)
+        entry = self.corpus.get(request.url)
+        with self._lock:
+            if entry is None:
+                self.missing += 1
+            else:
+                self.replayed += 1
+        if entry is None:
+            logger.warning(f"Page not recorded: {request.url}")
+            entry = {"status": 404, "reason": "Not Recorded", "headers": {}, "body": b""}
+        
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry["reason"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response._content = entry["body"]
+        response._content_consumed = True
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.elapsed = timedelta(seconds=time.perf_counter() - started)
+        return response
+    
+    def stats(self) -> Dict:
+        """再生した件数と記録のなかった件数"""
+        with self._lock:
+            return {
+                "pages": len(self.corpus),
+                "replayed": self.replayed,
+                "missing": self.missing,
+                "latency_ms": round(self.latency * 1000, 1)
+            }
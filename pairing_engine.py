@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+前後映画の組み合わせ判定エンジン - NumPy による一括判定
+"""
+
+from typing import NamedTuple, Optional, Tuple
+import numpy as np
+from schedule_index import ScheduleIndex
+from travel_matrix import TravelMatrix
+
+class PairingResult(NamedTuple):
+    """実現可能な候補（by_start 上の位置）とその移動時間・総所要時間"""
+    positions: np.ndarray
+    travel_minutes: np.ndarray
+    total_duration: np.ndarray
+
+class PairingEngine:
+    """1日分の列配列に対して、メイン映画の前後に組み合わせ可能な上映を一括判定"""
+    
+    def __init__(self, index: ScheduleIndex, travel_matrix: TravelMatrix,
+                 default_travel: int = 15, mode: str = 'walking'):
+        self.index = index
+        self.default_travel = default_travel
+        self.size = travel_matrix.size
+        # array.array のバッファをそのまま NxN 行列として参照（コピーなし）
+        self.matrix = np.frombuffer(travel_matrix.minutes[mode], dtype=np.intc).reshape(self.size, self.size)
+    
+    def travel_minutes(self, from_ids, to_ids) -> np.ndarray:
+        """映画館ID配列間の移動時間（未登録・0分は既定値で補完）"""
+        from_ids, to_ids = np.broadcast_arrays(np.asarray(from_ids), np.asarray(to_ids))
+        known = (from_ids >= 0) & (from_ids < self.size) & (to_ids >= 0) & (to_ids < self.size)
+        travel = np.full(from_ids.shape, -1, dtype=np.int32)
+        travel[known] = self.matrix[from_ids[known], to_ids[known]]
+        return np.where(travel > 0, travel, self.default_travel).astype(np.int32)
+    
+    def _target(self, target_showtime) -> Tuple[int, int, int]:
+        """メイン映画の開始分・終了分・タイトルコードを取得"""
+        index = self.index
+        position = index.position_by_id.get(target_showtime.showtime_id)
+        if position is None:
+            raise KeyError(f"Showtime not in schedule index: {target_showtime.showtime_id}")
+        return (int(index.start_array[position]), int(index.end_array[position]),
+                int(index.title_array[position]))
+    
+    def before(self, target_showtime, time_from: int, time_to: int, buffer_time: int = 15,
+               max_travel_time: Optional[int] = None,
+               max_total_duration: Optional[int] = None) -> PairingResult:
+        """メイン映画の前に観られる上映を判定"""
+        index = self.index
+        target_start, target_end, target_title = self._target(target_showtime)
+        if max_total_duration is not None:
+            # 総所要時間の上限から前映画の開始時刻の下限を決めて範囲自体を狭める
+            time_from = max(time_from, target_end - max_total_duration)
+        lo, hi = index.start_range(time_from, target_start - buffer_time)
+        
+        starts = index.start_array[lo:hi]
+        ends = index.end_array[lo:hi]
+        travel = self.travel_minutes(index.theater_array[lo:hi], target_showtime.theater_id)
+        
+        mask = ((ends <= time_to) &
+                (ends + travel + buffer_time <= target_start) &
+                (index.movie_array[lo:hi] != target_showtime.movie_id) &
+                (index.title_array[lo:hi] != target_title))
+        total_duration = target_end - starts
+        if max_travel_time is not None:
+            mask &= travel <= max_travel_time
+        if max_total_duration is not None:
+            mask &= total_duration <= max_total_duration
+        
+        return PairingResult(
+            positions=np.flatnonzero(mask) + lo,
+            travel_minutes=travel[mask],
+            total_duration=total_duration[mask]
+        )
+    
+    def after(self, target_showtime, time_from: int, time_to: int, buffer_time: int = 15,
+              max_travel_time: Optional[int] = None,
+              max_total_duration: Optional[int] = None) -> PairingResult:
+        """メイン映画の後に観られる上映を判定"""
+        index = self.index
+        target_start, target_end, target_title = self._target(target_showtime)
+        if max_total_duration is not None:
+            # 後映画の終了（≧開始）が上限内に収まる範囲だけを対象にする
+            time_to = min(time_to, target_start + max_total_duration)
+        lo, hi = index.start_range(max(target_end + buffer_time, time_from), time_to)
+        
+        starts = index.start_array[lo:hi]
+        ends = index.end_array[lo:hi]
+        travel = self.travel_minutes(target_showtime.theater_id, index.theater_array[lo:hi])
+        
+        mask = ((ends <= time_to) &
+                (target_end + travel + buffer_time <= starts) &
+                (index.movie_array[lo:hi] != target_showtime.movie_id) &
+                (index.title_array[lo:hi] != target_title))
+        total_duration = ends - target_start
+        if max_travel_time is not None:
+            mask &= travel <= max_travel_time
+        if max_total_duration is not None:
+            mask &= total_duration <= max_total_duration
+        
+        return PairingResult(
+            positions=np.flatnonzero(mask) + lo,
+            travel_minutes=travel[mask],
+            total_duration=total_duration[mask]
+        )
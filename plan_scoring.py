@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+プラン評価モデル - 重み付きスコアをNumPyで一括計算
+"""
+
+from dataclasses import dataclass
+import numpy as np
+
+@dataclass
+class ScoringWeights:
+    """スコアの重み（合計で正規化するので比率だけが意味を持つ）"""
+    movie_minutes: float = 0.35   # 時間枠のうち映画を観ている割合
+    travel_minutes: float = 0.2   # 移動時間の少なさ
+    idle_minutes: float = 0.15    # 待ち時間の少なさ
+    price: float = 0.1            # 1本あたりの料金の安さ
+    window_fill: float = 0.2      # プラン全体が時間枠を埋める割合
+    reference_price: float = 2000.0  # 1本あたりの基準料金
+
+class PlanScorer:
+    """候補プランの列配列を受け取り、0〜100 のスコアを一括で返す（同じ入力なら常に同じ結果）"""
+    
+    def __init__(self, weights: ScoringWeights = None):
+        self.weights = weights or ScoringWeights()
+    
+    def score(self, movie_minutes, travel_minutes, span_minutes, total_price, film_count,
+              window_minutes) -> np.ndarray:
+        """各引数は候補ごとの配列（スカラーはブロードキャスト）
+        
+        travel_minutes は余裕時間を含む移動時間、span_minutes は最初の開始から最後の終了まで
+        """
+        w = self.weights
+        movie = np.asarray(movie_minutes, dtype=np.float64)
+        travel = np.asarray(travel_minutes, dtype=np.float64)
+        span = np.maximum(np.asarray(span_minutes, dtype=np.float64), 1.0)
+        price = np.asarray(total_price, dtype=np.float64)
+        films = np.asarray(film_count, dtype=np.float64)
+        window = max(float(window_minutes), 1.0)
+        
+        idle = np.maximum(span - movie - travel, 0.0)
+        price_per_film = np.divide(price, films, out=np.zeros(np.broadcast(price, films).shape), where=films > 0)
+        price_score = np.divide(w.reference_price, price_per_film,
+                                out=np.ones_like(price_per_film), where=price_per_film > 0)
+        
+        total = (w.movie_minutes * np.clip(movie / window, 0.0, 1.0) +
+                 w.travel_minutes * np.clip(1.0 - travel / span, 0.0, 1.0) +
+                 w.idle_minutes * np.clip(1.0 - idle / span, 0.0, 1.0) +
+                 w.price * np.clip(price_score, 0.0, 1.0) +
+                 w.window_fill * np.clip(span / window, 0.0, 1.0))
+        weight_sum = (w.movie_minutes + w.travel_minutes + w.idle_minutes + w.price + w.window_fill) or 1.0
+        return np.round(100.0 * total / weight_sum, 2)
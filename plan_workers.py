@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+最適化プロセスプール - CPU負荷の高いプラン探索を別プロセスで実行
+
+ワーカーは起動時に上映日のスケジュールスナップショットと移動時間行列を受け取り、
+リクエストごとにはパラメータのタプルと、上映IDだけで表したプランのタプルだけをやり取りする
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from database_manager import DatabaseManager, DATASET_VERSION
+from enhanced_optimizer import EnhancedOptimizer, MovieShowtime, ViewingPlan, SHOWTIME_FIELDS
+from schedule_index import ScheduleIndex, ScheduleIndexStore
+from travel_matrix import TravelMatrix
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 最適化プロセス数の既定値（環境変数 OPTIMIZE_WORKERS、0 ならプロセスを使わない）
+DEFAULT_OPTIMIZE_WORKERS = int(os.environ.get("OPTIMIZE_WORKERS", "0"))
+
+# (showtime_id, plan_type, time_from, time_to, max_films, buffer_time, max_travel_time, max_total_duration)
+OptimizeRequest = Tuple[int, str, str, str, int, int, Optional[int], Optional[int]]
+
+def showtime_ref(showtime: Optional[MovieShowtime], index: ScheduleIndex):
+    """索引にある上映はIDだけ、デモプランの仮想上映などはフィールドのタプルで表す"""
+    if showtime is None:
+        return None
+    if index.get(showtime.showtime_id) is showtime:
+        return showtime.showtime_id
+    return tuple(getattr(showtime, name) for name in SHOWTIME_FIELDS)
+
+def plan_to_tuple(plan: ViewingPlan, index: ScheduleIndex) -> Tuple:
+    """プランを上映IDのタプルに変換（プロセス間の受け渡し用）"""
+    return (
+        plan.plan_id,
+        plan.plan_type,
+        showtime_ref(plan.primary_showtime, index),
+        showtime_ref(plan.before_showtime, index),
+        showtime_ref(plan.after_showtime, index),
+        tuple(showtime_ref(showtime, index) for showtime in plan.showtimes),
+        plan.total_duration_minutes,
+        plan.total_travel_minutes,
+        plan.total_movie_minutes,
+        plan.optimization_score,
+        plan.travel_details
+    )
+
+def plan_from_tuple(data: Tuple, index: ScheduleIndex) -> ViewingPlan:
+    """plan_to_tuple の結果を、呼び出し側の日別索引の上映を参照するプランに戻す"""
+    (plan_id, plan_type, primary_ref, before_ref, after_ref, showtime_refs,
+     total_duration, total_travel, total_movie, score, travel_details) = data
+    
+    def lookup(ref):
+        if ref is None:
+            return None
+        if isinstance(ref, tuple):
+            return MovieShowtime(*ref)
+        showtime = index.get(ref)
+        if showtime is None:
+            raise KeyError(f"Showtime not in schedule index: {ref}")
+        return showtime
+    
+    return ViewingPlan(
+        plan_id=plan_id,
+        primary_showtime=lookup(primary_ref),
+        before_showtime=lookup(before_ref),
+        after_showtime=lookup(after_ref),
+        total_duration_minutes=total_duration,
+        total_travel_minutes=total_travel,
+        total_movie_minutes=total_movie,
+        optimization_score=score,
+        plan_type=plan_type,
+        travel_details=travel_details,
+        showtimes=[lookup(ref) for ref in showtime_refs]
+    )
+
+# ワーカープロセス内の状態
+_worker_optimizer: Optional[EnhancedOptimizer] = None
+_worker_travel_matrix: Optional[TravelMatrix] = None
+_worker_showtime_dates: Dict[int, str] = {}
+
+def _init_worker(db_path: str, snapshots: Dict[str, List[Dict]], travel_matrix: TravelMatrix,
+                 snapshot_version: Optional[int] = None):
+    """ワーカー起動時にスナップショットから日別索引を構築"""
+    global _worker_optimizer, _worker_travel_matrix, _worker_showtime_dates
+    optimizer = EnhancedOptimizer(db_path)
+    
+    def load(show_date: str):
+        # 受け取っていない日付だけDBから読む
+        snapshot = snapshots.get(show_date)
+        if snapshot is None:
+            return optimizer.load_versioned_schedule(show_date)
+        return snapshot_version, optimizer.schedule_from_snapshot(snapshot)
+    
+    optimizer.schedule_indexes = ScheduleIndexStore(load)
+    for show_date, snapshot in snapshots.items():
+        optimizer.schedule_indexes.get(show_date)
+        for row in snapshot:
+            _worker_showtime_dates[row['showtime_id']] = show_date
+    snapshots.clear()
+    
+    _worker_optimizer = optimizer
+    _worker_travel_matrix = travel_matrix
+
+def _optimize_in_worker(request: OptimizeRequest) -> Tuple[str, List[Tuple], Optional[int]]:
+    """ワーカーで最適化を実行し、(上映日, プランのタプル一覧, 使った索引のデータセットバージョン) を返す"""
+    showtime_id, plan_type, time_from, time_to, max_films, buffer_time, max_travel_time, max_total_duration = request
+    show_date = _worker_showtime_dates.get(showtime_id)
+    if show_date is None:
+        # スナップショットにない上映はDBから上映日を調べる
+        with DatabaseManager(_worker_optimizer.db_path, read_only=True) as db:
+            show_date = db.get_showtime_date(showtime_id)
+        if show_date is None:
+            raise ValueError(f"Showtime not found: {showtime_id}")
+    
+    plans = _worker_optimizer.optimize_movie_plan(
+        showtime_id, plan_type, time_from, time_to, max_films,
+        buffer_time=buffer_time,
+        max_travel_time=max_travel_time,
+        max_total_duration=max_total_duration,
+        show_date=show_date,
+        travel_matrix=_worker_travel_matrix
+    )
+    index = _worker_optimizer.schedule_indexes.get(show_date)
+    return show_date, [plan_to_tuple(plan, index) for plan in plans], index.version
+
+class OptimizationProcessPool:
+    """スナップショットを読み込み済みのワーカーで最適化を実行するプロセスプール
+    
+    データバージョンが変わったら refresh() で次の最適化から新しいスナップショットのワーカーに切り替える
+    """
+    
+    def __init__(self, db_path: str, max_workers: int = DEFAULT_OPTIMIZE_WORKERS):
+        self.db_path = db_path
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._dates = set()
+        self._lock = threading.Lock()
+        self.dispatched = 0
+        self.restarts = 0
+        self.snapshot_version = None
+    
+    def _start(self, show_dates) -> ProcessPoolExecutor:
+        """最新のスナップショットと移動時間行列でワーカーを起動（ロック保持中に呼ぶ）"""
+        with DatabaseManager(self.db_path, read_only=True) as db, db.snapshot():
+            version = db.get_data_version(DATASET_VERSION)
+            snapshots = {show_date: db.get_schedule_snapshot(show_date) for show_date in show_dates}
+            travel_matrix = TravelMatrix(db.get_theater_distances(), db.get_data_version('theater_distances'))
+        
+        # 親プロセスのDB接続やスレッドを引き継がないよう spawn で起動する
+        executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.db_path, snapshots, travel_matrix, version)
+        )
+        self._dates = set(show_dates)
+        self.snapshot_version = version
+        self.restarts += 1
+        logger.info(f"Optimization workers started: {self.max_workers} processes, "
+                    f"dates {sorted(self._dates)} (dataset version {version})")
+        return executor
+    
+    def optimize(self, show_date: str, request: OptimizeRequest) -> Tuple[str, List[Tuple], Optional[int]]:
+        """最適化をワーカーで実行（初めての上映日ならその日のスナップショットを読み込んで起動し直す）
+        
+        ワーカーが異常終了したプールは作り直し、1回だけ実行し直す
+        """
+        try:
+            return self._dispatch(show_date, request)
+        except BrokenProcessPool as e:
+            logger.warning(f"Optimization workers crashed, restarting: {e}")
+            return self._dispatch(show_date, request)
+    
+    def _dispatch(self, show_date: str, request: OptimizeRequest) -> Tuple[str, List[Tuple], Optional[int]]:
+        """最適化を1回投入して結果を待つ（異常終了したプールは破棄して BrokenProcessPool を送出）"""
+        with self._lock:
+            if self._executor is None or show_date not in self._dates:
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                self._executor = self._start(self._dates | {show_date})
+            # refresh や別の日付での再起動に停止される前に、ロックを持ったまま投入する
+            executor = self._executor
+            try:
+                future = executor.submit(_optimize_in_worker, request)
+            except BrokenProcessPool:
+                self._discard_broken(executor)
+                raise
+            self.dispatched += 1
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            with self._lock:
+                self._discard_broken(executor)
+            raise
+    
+    def _discard_broken(self, executor: ProcessPoolExecutor):
+        """異常終了したプールを破棄（ロック保持中に呼ぶ。次の投入で最新のスナップショットから起動し直す）"""
+        if self._executor is executor:
+            executor.shutdown(wait=False)
+            self._executor = None
+    
+    def refresh(self):
+        """データ更新後に呼ぶ（実行中の最適化は旧ワーカーで完了させ、次回から新しいワーカーを使う）"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+    
+    def shutdown(self):
+        """ワーカーを停止"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+    
+    def stats(self) -> Dict:
+        """ワーカー数・実行数・再起動回数の統計"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "running": self._executor is not None,
+                "dates": sorted(self._dates),
+                "snapshot_version": self.snapshot_version,
+                "dispatched": self.dispatched,
+                "restarts": self.restarts
+            }
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+上映スケジュールインデックス - 日付単位のインメモリ索引
+"""
+
+import bisect
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class ScheduleIndex:
+    """1日分の上映スケジュールを開始・終了時刻順に保持する索引"""
+    
+    def __init__(self, show_date: str, schedule: List[Tuple[object, int, int]], version: Optional[int] = None):
+        self.show_date = show_date
+        self.version = version  # 読み込んだスナップショットのデータセットバージョン
+        
+        # schedule は (上映情報, 開始分, 終了分) のリスト。開始時刻順に並べた列配列として保持する
+        schedule = sorted(schedule, key=lambda row: (row[1], row[0].showtime_id))
+        self.by_start = [showtime for showtime, _, _ in schedule]
+        self.start_keys = [start for _, start, _ in schedule]
+        self.by_id: Dict[int, object] = {s.showtime_id: s for s in self.by_start}
+        self.position_by_id = {s.showtime_id: position for position, s in enumerate(self.by_start)}
+        
+        # 開始時刻順に並べた列配列（ベクトル化した実現可能性判定用）
+        title_codes: Dict[str, int] = {}
+        self.start_array = np.array(self.start_keys, dtype=np.int32)
+        self.end_array = np.array([end for _, _, end in schedule], dtype=np.int32)
+        self.theater_array = np.array([s.theater_id for s in self.by_start], dtype=np.int32)
+        self.movie_array = np.array([s.movie_id for s in self.by_start], dtype=np.int32)
+        self.duration_array = np.array([s.duration for s in self.by_start], dtype=np.int32)
+        self.price_array = np.array([s.price or 0.0 for s in self.by_start], dtype=np.float64)
+        self.title_array = np.array([title_codes.setdefault(s.movie_title, len(title_codes)) for s in self.by_start],
+                                    dtype=np.int32)
+        self.titles = list(title_codes)  # タイトルコード → タイトル
+        
+        # 終了時刻順の並び（by_start 上の位置の配列）
+        self.end_order = np.argsort(self.end_array, kind='stable')
+        self.end_keys = self.end_array[self.end_order]
+    
+    def __len__(self) -> int:
+        return len(self.by_id)
+    
+    def get(self, showtime_id: int) -> Optional[object]:
+        """上映IDで上映情報を取得"""
+        return self.by_id.get(showtime_id)
+    
+    def start_range(self, start_from: int, start_to: int) -> Tuple[int, int]:
+        """開始時刻が [start_from, start_to] の上映の by_start 上の位置範囲を返す"""
+        lo = bisect.bisect_left(self.start_keys, start_from)
+        hi = bisect.bisect_right(self.start_keys, start_to)
+        return lo, hi
+    
+    def starting_between(self, start_from: int, start_to: int) -> List:
+        """開始時刻が [start_from, start_to] の上映を開始時刻順に返す"""
+        lo, hi = self.start_range(start_from, start_to)
+        return self.by_start[lo:hi]
+    
+    def start_of(self, showtime_id: int) -> int:
+        """上映の開始分"""
+        return int(self.start_array[self.position_by_id[showtime_id]])
+    
+    def end_of(self, showtime_id: int) -> int:
+        """上映の終了分"""
+        return int(self.end_array[self.position_by_id[showtime_id]])
+    
+    def ending_between(self, end_from: int, end_to: int) -> List:
+        """終了時刻が [end_from, end_to] の上映を終了時刻順に返す"""
+        lo = int(np.searchsorted(self.end_keys, end_from, side='left'))
+        hi = int(np.searchsorted(self.end_keys, end_to, side='right'))
+        return [self.by_start[position] for position in self.end_order[lo:hi].tolist()]
+
+class ScheduleIndexStore:
+    """日付ごとの ScheduleIndex を保持し、再構築時はアトミックに差し替える
+    
+    loader(show_date) は (データセットバージョン, (上映情報, 開始分, 終了分) のリスト) を返す
+    """
+    
+    def __init__(self, loader: Callable[[str], Tuple[Optional[int], List[Tuple[object, int, int]]]]):
+        self._loader = loader
+        self._indexes: Dict[str, ScheduleIndex] = {}
+        self._lock = threading.Lock()
+        self._refreshing: Dict[str, threading.Thread] = {}
+        self._pending = set()  # 再構築中にさらに更新された日付（終わったらもう一度作り直す）
+    
+    def get(self, show_date: str) -> ScheduleIndex:
+        """索引を取得（未構築の日付のみ同期的に構築）"""
+        index = self._indexes.get(show_date)
+        if index is None:
+            index = self._build(show_date)
+        return index
+    
+    def get_containing(self, show_date: str, showtime_id: int) -> ScheduleIndex:
+        """上映を含む索引を取得（DBにある上映が旧索引になければ、再構築を待つか同期的に読み直す）
+        
+        データセットのバージョンが変わった直後は再構築が終わるまで旧索引を返すので、
+        新しいバージョンにしかない上映は旧索引では見つからない
+        """
+        index = self.get(show_date)
+        if index.get(showtime_id) is None:
+            self.wait(show_date)
+            index = self.get(show_date)
+            if index.get(showtime_id) is None:
+                index = self._build(show_date)
+        return index
+    
+    def _build(self, show_date: str) -> ScheduleIndex:
+        """索引を構築して差し替え"""
+        version, schedule = self._loader(show_date)
+        index = ScheduleIndex(show_date, schedule, version)
+        # 参照の付け替えのみで公開するので、処理中のリクエストは旧索引をそのまま使える
+        with self._lock:
+            self._indexes[show_date] = index
+        logger.info(f"Schedule index built: {show_date} ({len(index)} showtimes, version {version})")
+        return index
+    
+    def refresh(self, show_date: str = None) -> List[threading.Thread]:
+        """新しいクローリングデータ取り込み後に索引をバックグラウンドで再構築"""
+        with self._lock:
+            dates = [show_date] if show_date else list(self._indexes.keys())
+            threads = []
+            for date in dates:
+                running = self._refreshing.get(date)
+                if running is not None:
+                    # 実行中の再構築は更新前のデータを読んでいるかもしれないので、終わったら作り直させる
+                    self._pending.add(date)
+                    threads.append(running)
+                    continue
+                thread = threading.Thread(target=self._refresh_worker, args=(date,),
+                                          name=f"schedule-index-{date}", daemon=True)
+                self._refreshing[date] = thread
+                threads.append(thread)
+                thread.start()
+        return threads
+    
+    def _refresh_worker(self, show_date: str):
+        """再構築ワーカー（失敗時は旧索引を使い続ける）"""
+        while True:
+            try:
+                self._build(show_date)
+            except Exception as e:
+                logger.error(f"Schedule index refresh failed for {show_date}: {e}")
+            with self._lock:
+                if show_date not in self._pending:
+                    del self._refreshing[show_date]
+                    return
+                self._pending.discard(show_date)
+    
+    def wait(self, show_date: str = None):
+        """実行中の再構築が終わるまで待つ（日付指定でその日だけ。再構築中にさらに更新された日付の作り直しも含む）"""
+        while True:
+            with self._lock:
+                threads = [thread for date, thread in self._refreshing.items() if show_date in (None, date)]
+            if not threads:
+                return
+            for thread in threads:
+                thread.join()
+    
+    def invalidate(self, show_date: str = None):
+        """索引を破棄（次回アクセス時に再構築）"""
+        with self._lock:
+            if show_date:
+                self._indexes.pop(show_date, None)
+            else:
+                self._indexes.clear()
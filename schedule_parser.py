@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+映画.com ページの解析 - 映画館ページの映画一覧と、映画ごとの上映スケジュール表を抽出
+
+解析方式は切り替えられる（結果はどれも同じ）:
+    soup     - ページ全体を BeautifulSoup(html.parser) で解析（従来の方式）
+    strainer - スケジュール部分だけを SoupStrainer で必要なタグに絞って解析
+    lxml     - スケジュール部分だけを lxml で解析（lxml がインストールされている場合）
+"""
+
+import os
+import re
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml.html
+except ImportError:  # lxml は任意
+    lxml = None
+
+# 解析方式の既定値（環境変数 SCHEDULE_PARSER、未指定なら使える中で最速のもの）
+DEFAULT_PARSER = os.environ.get("SCHEDULE_PARSER", "")
+
+MOVIE_LINK_PATTERN = re.compile(r'/movie/([^/]+)/')
+DURATION_LABEL_PATTERN = re.compile(r'上映時間[：:]\s*(\d+)分')
+DURATION_PATTERN = re.compile(r'(\d+)分')
+DATE_PATTERN = re.compile(r'(\d{1,2})/(\d{1,2})')
+TIME_PATTERN = re.compile(r'(\d{1,2}:\d{2})')
+SCHEDULE_TABLE_PATTERN = re.compile(rb'<table[^>]*weekly-schedule')
+
+# 映画.com のページは UTF-8（lxml はバイト列の文字コードを推測しないよう明示する）
+LXML_PARSER = lxml.html.HTMLParser(encoding='utf-8') if lxml is not None else None
+
+# (eiga.com の映画ID, タイトル, 画像URL)
+MovieLink = Tuple[str, str, str]
+
+def schedule_fragment(content: bytes) -> bytes:
+    """映画タイトルの見出しから上映スケジュール表の終わりまで（解析結果はこの部分と duration_label で決まる）
+    
+    スケジュール表のないページ（映画館ページなど）は本文全体を返す
+    """
+    table = SCHEDULE_TABLE_PATTERN.search(content)
+    if table is None:
+        return content
+    end = content.find(b'</table>', table.start())
+    start = content.find(b'<h1')
+    if start < 0 or start > table.start():
+        start = 0
+    return content[start:end + len(b'</table>') if end >= 0 else len(content)]
+
+def duration_label(content: bytes) -> bytes:
+    """ページ全体から「上映時間：N分」を探す（なければ空。作品情報はスケジュール部分の外にあることもある）"""
+    label_match = DURATION_LABEL_PATTERN.search(content.decode('utf-8', errors='replace'))
+    return label_match.group(0).encode('utf-8') if label_match else b''
+
+def find_duration(content: bytes, fragment: bytes) -> int:
+    """上映時間（分）を探す
+    
+    「上映時間：N分」はページ全体から探す。なければスケジュール部分の「N分」を使う
+    （ヘッダーやナビゲーションの「徒歩5分」などを上映時間と取り違えないよう、ページ全体からは探さない）。
+    どちらもなければ 120
+    """
+    duration_match = (DURATION_LABEL_PATTERN.search(content.decode('utf-8', errors='replace'))
+                      or DURATION_PATTERN.search(fragment.decode('utf-8', errors='replace')))
+    return int(duration_match.group(1)) if duration_match else 120
+
+def cell_showtimes(date_text: str, slot_texts: List[str], duration: int) -> List[Dict]:
+    """スケジュール表の1日分のセル（日付と時刻の文字列）を上映回に変換"""
+    date_match = DATE_PATTERN.search(date_text)
+    if not date_match:
+        return []
+    month, day = date_match.groups()
+    year = datetime.now().year
+    show_date = f"{year}-{int(month):02d}-{int(day):02d}"
+    
+    showtimes = []
+    for time_text in slot_texts:
+        time_match = TIME_PATTERN.search(time_text)
+        if time_match:
+            start_time = time_match.group(1)
+            
+            # 終了時間を計算（日付をまたぐ場合は "25:10" 形式）
+            start_hour, start_min = map(int, start_time.split(':'))
+            end_minutes = start_hour * 60 + start_min + duration
+            end_time = f"{end_minutes // 60:02d}:{end_minutes % 60:02d}"
+            
+            showtimes.append({
+                'date': show_date,
+                'start_time': start_time,
+                'end_time': end_time,
+                'screen': 1,  # デフォルト値
+                'price': 2000.0  # デフォルト値
+            })
+    return showtimes
+
+class SoupParser:
+    """ページ全体を BeautifulSoup(html.parser) で解析（従来の方式、他の方式の基準）"""
+    name = "soup"
+    
+    def _soup(self, content: bytes, strainer: SoupStrainer = None) -> BeautifulSoup:
+        return BeautifulSoup(content, 'html.parser')
+    
+    def theater_movies(self, content: bytes) -> List[MovieLink]:
+        """映画館ページから映画へのリンクをページ内の順に抽出"""
+        soup = self._soup(content, SoupStrainer('a', href=MOVIE_LINK_PATTERN))
+        links = []
+        for link in soup.find_all('a', href=MOVIE_LINK_PATTERN):
+            movie_id_match = MOVIE_LINK_PATTERN.search(link.get('href'))
+            if movie_id_match:
+                img_elem = link.find('img')
+                if img_elem and img_elem.get('alt'):
+                    title = img_elem.get('alt').strip()
+                else:
+                    title = link.get_text(strip=True)
+                links.append((movie_id_match.group(1), title, img_elem.get('src', '') if img_elem else ''))
+        return links
+    
+    def movie_schedule(self, content: bytes) -> Dict:
+        """映画の上映スケジュールページからタイトル・上映時間・上映回を抽出"""
+        fragment = schedule_fragment(content)
+        soup = self._soup(self._schedule_markup(content, fragment), SoupStrainer(_is_schedule_tag))
+        
+        title_elem = soup.find('h1') or soup.find('h2')
+        title = title_elem.get_text(strip=True) if title_elem else "Unknown"
+        duration = find_duration(content, fragment)
+        
+        showtimes = []
+        weekly_schedule = soup.find('table', class_='weekly-schedule')
+        if weekly_schedule:
+            for row in weekly_schedule.find_all('tr'):
+                for cell in row.find_all('td'):
+                    date_elem = cell.find('p', class_='date')
+                    if date_elem:
+                        slot_texts = [elem.get_text(strip=True) for elem in cell.find_all(['a', 'span'])]
+                        showtimes.extend(cell_showtimes(date_elem.get_text(strip=True), slot_texts, duration))
+        
+        return {
+            'title': title,
+            'duration': duration,
+            'showtimes': showtimes
+        }
+    
+    def _schedule_markup(self, content: bytes, fragment: bytes) -> bytes:
+        """スケジュールページのうち解析する部分（従来の方式はページ全体）"""
+        return content
+
+def _is_schedule_tag(name: str, attrs: Dict) -> bool:
+    """スケジュールの解析に使うタグ（見出しとスケジュール表）"""
+    if name in ('h1', 'h2'):
+        return True
+    if name != 'table':
+        return False
+    classes = attrs.get('class') or ''
+    if isinstance(classes, str):
+        classes = classes.split()
+    return 'weekly-schedule' in classes
+
+class StrainerParser(SoupParser):
+    """スケジュール部分だけを、SoupStrainer で必要なタグに絞って BeautifulSoup で解析"""
+    name = "strainer"
+    
+    def _soup(self, content: bytes, strainer: SoupStrainer = None) -> BeautifulSoup:
+        return BeautifulSoup(content, 'html.parser', parse_only=strainer)
+    
+    def _schedule_markup(self, content: bytes, fragment: bytes) -> bytes:
+        return fragment
+
+class LxmlParser:
+    """スケジュール部分だけを lxml で解析"""
+    name = "lxml"
+    
+    @staticmethod
+    def _text(element) -> str:
+        """BeautifulSoup の get_text(strip=True) と同じく、各テキストを strip して連結"""
+        return "".join(text.strip() for text in element.xpath('.//text()'))
+    
+    @staticmethod
+    def _has_class(class_name: str) -> str:
+        return f'contains(concat(" ", normalize-space(@class), " "), " {class_name} ")'
+    
+    def theater_movies(self, content: bytes) -> List[MovieLink]:
+        """映画館ページから映画へのリンクをページ内の順に抽出"""
+        document = lxml.html.document_fromstring(content, parser=LXML_PARSER)
+        links = []
+        for link in document.iter('a'):
+            movie_id_match = MOVIE_LINK_PATTERN.search(link.get('href') or '')
+            if movie_id_match:
+                images = link.xpath('.//img')
+                img_elem = images[0] if images else None
+                if img_elem is not None and img_elem.get('alt'):
+                    title = img_elem.get('alt').strip()
+                else:
+                    title = self._text(link)
+                links.append((movie_id_match.group(1), title, img_elem.get('src', '') if img_elem is not None else ''))
+        return links
+    
+    def movie_schedule(self, content: bytes) -> Dict:
+        """映画の上映スケジュールページからタイトル・上映時間・上映回を抽出"""
+        fragment = schedule_fragment(content)
+        document = lxml.html.document_fromstring(fragment, parser=LXML_PARSER)
+        
+        title_elems = document.xpath('(//h1)[1]') or document.xpath('(//h2)[1]')
+        title = self._text(title_elems[0]) if title_elems else "Unknown"
+        duration = find_duration(content, fragment)
+        
+        showtimes = []
+        tables = document.xpath(f'(//table[{self._has_class("weekly-schedule")}])[1]')
+        if tables:
+            for row in tables[0].iter('tr'):
+                for cell in row.iter('td'):
+                    date_elems = cell.xpath(f'.//p[{self._has_class("date")}]')
+                    if date_elems:
+                        slot_texts = [self._text(elem) for elem in cell.iter('a', 'span')]
+                        showtimes.extend(cell_showtimes(self._text(date_elems[0]), slot_texts, duration))
+        
+        return {
+            'title': title,
+            'duration': duration,
+            'showtimes': showtimes
+        }
+
+PARSERS = {parser.name: parser for parser in (SoupParser, StrainerParser, LxmlParser)}
+
+def available_parsers() -> List[str]:
+    """この環境で使える解析方式"""
+    return [name for name in PARSERS if name != "lxml" or lxml is not None]
+
+def get_parser(name: Optional[str] = None):
+    """解析方式を取得（未指定なら lxml、なければ strainer）"""
+    name = name or DEFAULT_PARSER or ("lxml" if lxml is not None else "strainer")
+    if name not in available_parsers():
+        raise ValueError(f"Parser not available: {name} (available: {available_parsers()})")
+    return PARSERS[name]()
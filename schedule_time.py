@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+時刻ユーティリティ - "HH:MM" と上映日0時からの通算分の相互変換
+"""
+
+from typing import Tuple
+
+# 1日の分数（日付をまたぐ上映は 1440 以上の分で表す）
+MINUTES_PER_DAY = 1440
+
+def time_to_minutes(time_str: str) -> int:
+    """"HH:MM" を上映日0時からの分に変換（"25:10" のような深夜表記もそのまま扱う）"""
+    hours, _, minutes = time_str.strip().partition(':')
+    return int(hours) * 60 + int(minutes)
+
+def minutes_to_time(minutes: int) -> str:
+    """分を "HH:MM" に変換（24時以降は "25:10" のように表記）"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def end_minutes(start_min: int, end_time: str) -> int:
+    """終了時刻を分に変換（開始より前なら日付をまたいだとみなして1日分足す）"""
+    end_min = time_to_minutes(end_time)
+    return end_min + MINUTES_PER_DAY if end_min < start_min else end_min
+
+def window_minutes(time_from: str, time_to: str) -> Tuple[int, int]:
+    """検索時間枠を分に変換（19:00〜02:00 のように終了が開始より前なら翌日とみなす）"""
+    start_min = time_to_minutes(time_from)
+    return start_min, end_minutes(start_min, time_to)
@@ -0,0 +1,62 @@
+"""
+テスト共通 - 一時ディレクトリにセットアップ済みのDBを作成するフィクスチャ
+"""
+
+import os
+import random
+import sys
+from typing import Callable, Dict, List
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from setup_database import DatabaseSetup
+from database_manager import DatabaseManager
+from connection_pool import get_pool
+
+def setup_schema(db_path: str):
+    """setup_database.py と同じスキーマ・映画館・距離のDBを作成（DatabaseManager は使わない）"""
+    # スキーマファイルはリポジトリ直下から読むので作業ディレクトリを合わせる
+    cwd = os.getcwd()
+    os.chdir(REPO_ROOT)
+    try:
+        DatabaseSetup(db_path).setup_complete_database()
+    finally:
+        os.chdir(cwd)
+
+def build_database(db_path: str, showtimes_by_date: Dict[str, int] = None, movies: int = 20, seed: int = 1):
+    """映画館・距離はセットアップ済みのDBに、映画と日付ごとの上映を乱数で投入"""
+    setup_schema(db_path)
+    rng = random.Random(seed)
+    with DatabaseManager(db_path) as db:
+        theater_ids = [t['theater_id'] for t in db.get_theaters()]
+        movie_ids = [db.insert_or_update_movie(f"テスト映画{i}", duration=rng.randint(85, 160))
+                     for i in range(movies)]
+        for show_date, count in (showtimes_by_date or {}).items():
+            for _ in range(count):
+                start = rng.randint(9 * 60, 23 * 60)
+                db.insert_or_update_showtime(rng.choice(theater_ids), rng.choice(movie_ids), show_date,
+                                             f"{start // 60:02d}:{start % 60:02d}", rng.randint(1, 12))
+        db.connection.commit()
+
+@pytest.fixture
+def make_database(tmp_path) -> Callable[..., str]:
+    """build_database で一時DBを作成してパスを返す関数"""
+    def make(name: str = "movie_optimization.db", **kwargs) -> str:
+        db_path = str(tmp_path / name)
+        build_database(db_path, **kwargs)
+        return db_path
+    return make
+
+@pytest.fixture
+def traced_statements() -> Callable[[str], List[str]]:
+    """DBの接続プールで実行されるSQL文を記録するリストを返す関数（DBを作成する前に呼ぶ）"""
+    def trace(db_path: str) -> List[str]:
+        statements: List[str] = []
+        for read_only in (False, True):
+            get_pool(db_path, setup=lambda connection: connection.set_trace_callback(statements.append),
+                     read_only=read_only)
+        return statements
+    return trace
@@ -0,0 +1,67 @@
+"""
+API サーバー - 最適化リクエストが集中しても /health がすぐに応答することの確認（アプリをプロセス内で実行）
+"""
+
+import asyncio
+import importlib
+import time
+
+import pytest
+
+from conftest import REPO_ROOT
+from optimization_api import MovieOptimizationAPI
+
+httpx = pytest.importorskip("httpx")
+
+SHOW_DATE = "2025-07-14"
+OPTIMIZE_SECONDS = 0.5  # 最適化1件あたりの処理時間（イベントループ上で実行されるとこの間 /health も止まる）
+CONCURRENT_OPTIMIZE = 8
+HEALTH_LIMIT = 0.2
+
+@pytest.fixture
+def app(make_database, monkeypatch):
+    db_path = make_database(showtimes_by_date={SHOW_DATE: 300})
+    # app は読み込み時に作業ディレクトリの static/ をマウントする
+    monkeypatch.chdir(REPO_ROOT)
+    app_module = importlib.import_module("app")
+    api = MovieOptimizationAPI(db_path, db_workers=CONCURRENT_OPTIMIZE, optimize_workers=0)
+    
+    # 同期の最適化処理に時間がかかる状況を作る（DB処理スレッドで実行されていればイベントループは止まらない）
+    optimize_plan = api.optimize_plan
+    def slow_optimize_plan(*args, **kwargs):
+        time.sleep(OPTIMIZE_SECONDS)
+        return optimize_plan(*args, **kwargs)
+    monkeypatch.setattr(api, "optimize_plan", slow_optimize_plan)
+    monkeypatch.setattr(app_module, "optimization_api", api)
+    yield app_module.app, api
+    api.close()
+
+def test_health_stays_responsive_under_optimize_load(app):
+    asgi_app, api = app
+    showtime_ids = [movie['showtime_id'] for movie in api.get_available_movies(SHOW_DATE, "09:00", "24:00")]
+    
+    async def scenario():
+        transport = httpx.ASGITransport(app=asgi_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            started = time.perf_counter()
+            optimizing = [asyncio.ensure_future(client.post("/api/optimize", json={
+                "showtime_id": showtime_id, "time_from": "09:00", "time_to": "24:00"
+            })) for showtime_id in showtime_ids[:CONCURRENT_OPTIMIZE]]
+            
+            health_latencies = []
+            while not all(task.done() for task in optimizing):
+                health_started = time.perf_counter()
+                response = await client.get("/health")
+                health_latencies.append(time.perf_counter() - health_started)
+                assert response.status_code == 200 and response.json()["status"] == "healthy"
+                await asyncio.sleep(0.02)
+            results = [task.result() for task in optimizing]
+            return results, health_latencies, time.perf_counter() - started
+    
+    results, health_latencies, elapsed = asyncio.run(scenario())
+    assert all(response.status_code == 200 and response.json()["success"] for response in results)
+    # 最適化はスレッドで並行に実行され、その間も /health は最適化を待たずに応答する
+    assert elapsed < OPTIMIZE_SECONDS * CONCURRENT_OPTIMIZE / 2
+    assert len(health_latencies) >= 5
+    assert max(health_latencies) < HEALTH_LIMIT
+    assert api.db_executor.stats()["max_running"] > 1
@@ -0,0 +1,77 @@
+"""
+クローリングエンジン - ホストごとのトークンバケットが取得の頻度を rate 件/秒（最初は burst 件まで）に抑えることの確認
+
+実際には待たず、sleep した分だけ進む時計をトークンバケットに渡して時刻を数える
+"""
+
+import asyncio
+from typing import List
+
+import pytest
+
+from crawl_engine import TokenBucket
+
+class FakeClock:
+    """sleep すると待たずにその秒数だけ進む時計"""
+    
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+        self.sleeps: List[float] = []
+    
+    def __call__(self) -> float:
+        return self.now
+    
+    async def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+        await asyncio.sleep(0)
+
+async def acquire_all(bucket: TokenBucket, clock: FakeClock, count: int) -> List[float]:
+    """count 件を同時に取得し、それぞれトークンを得た時刻を返す"""
+    times = []
+    
+    async def take():
+        await bucket.acquire()
+        times.append(clock.now)
+    await asyncio.gather(*(take() for _ in range(count)))
+    return times
+
+def max_in_window(times: List[float], seconds: float) -> int:
+    """長さ seconds の時間内に取得した最大件数"""
+    return max(sum(start <= t <= start + seconds + 1e-9 for t in times) for start in times)
+
+def test_bucket_caps_request_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, burst=4, clock=clock, sleep=clock.sleep)
+    started = clock.now
+    times = asyncio.run(acquire_all(bucket, clock, 20))
+    
+    # 最初の burst 件はすぐに、以降は 1/rate 秒ごとに1件
+    assert [t - started for t in times] == pytest.approx([0.0] * 4 + [0.5 * i for i in range(1, 17)])
+    assert clock.now - started == pytest.approx((20 - 4) / 2.0)
+    for seconds in (0.0, 1.0, 2.5, 8.0):
+        assert max_in_window(times, seconds) <= 4 + 2.0 * seconds
+    assert (bucket.acquired, bucket.waits) == (20, 16)
+    assert bucket.total_wait_seconds == pytest.approx(sum(clock.sleeps)) and clock.sleeps == pytest.approx([0.5] * 16)
+
+def test_idle_bucket_refills_only_up_to_burst():
+    clock = FakeClock()
+    
+    async def scenario():
+        bucket = TokenBucket(rate=2.0, burst=4, clock=clock, sleep=clock.sleep)
+        await acquire_all(bucket, clock, 4)
+        
+        # 長く空いても貯まるのは burst 件まで
+        clock.now += 60.0
+        started = clock.now
+        after_idle = [t - started for t in await acquire_all(bucket, clock, 7)]
+        
+        # 途中まで補充された分は待ち時間から差し引く
+        clock.now += 0.25
+        started = clock.now
+        partial = [t - started for t in await acquire_all(bucket, clock, 1)]
+        return after_idle, partial
+    
+    after_idle, partial = asyncio.run(scenario())
+    assert after_idle == pytest.approx([0.0] * 4 + [0.5, 1.0, 1.5])
+    assert partial == pytest.approx([0.25])
@@ -0,0 +1,65 @@
+"""
+クローラーのDB更新 - クローリング結果の映画館が名前で既存の映画館に対応付けられることの確認
+"""
+
+import sqlite3
+
+from conftest import setup_schema
+from complete_eiga_crawler import CompleteEigaCrawler
+
+def crawled_theater(theater_id: int, name: str) -> dict:
+    return {'theater_id': theater_id, 'name': name, 'area': 'shinjuku',
+            'address': f'東京都新宿区（{name}）', 'eiga_com_id': str(3000 + theater_id)}
+
+def crawled_showtime(showtime_id: int, theater_id: int, start_time: str, end_time: str) -> dict:
+    return {'showtime_id': showtime_id, 'movie_id': 1, 'theater_id': theater_id, 'showtime_date': '2025-07-14',
+            'start_time': start_time, 'end_time': end_time, 'screen_number': 1, 'price': 1900}
+
+def read_theaters(db_path: str) -> dict:
+    with sqlite3.connect(db_path) as connection:
+        return {name: (theater_id, latitude, longitude, url) for theater_id, name, latitude, longitude, url
+                in connection.execute('SELECT theater_id, name, latitude, longitude, url FROM theaters')}
+
+def walking_minutes(db_path: str, from_id: int, to_id: int) -> int:
+    with sqlite3.connect(db_path) as connection:
+        return connection.execute('''
+            SELECT walking_minutes FROM theater_distances WHERE from_theater_id = ? AND to_theater_id = ?
+        ''', (from_id, to_id)).fetchone()[0]
+
+def test_update_database_resolves_theaters_by_name(tmp_path):
+    db_path = str(tmp_path / "movie_optimization.db")
+    setup_schema(db_path)
+    before = read_theaters(db_path)
+    
+    crawler = CompleteEigaCrawler(cache_dir=None, db_path=db_path)
+    # クローリング時の theater_id は取得順の番号で、DB の ID とは一致しない
+    crawler.update_database({
+        'theaters': [crawled_theater(1, '新宿ピカデリー'), crawled_theater(2, 'テアトル新宿'),
+                     crawled_theater(3, '新宿新館')],
+        'movies': [{'movie_id': 1, 'title': 'テスト映画', 'duration': 120, 'image_url': '', 'eiga_com_id': '100'}],
+        'showtimes': [crawled_showtime(1, 1, '10:00', '12:00'), crawled_showtime(2, 2, '13:00', '15:00'),
+                      crawled_showtime(3, 3, '16:00', '18:00')]
+    })
+    
+    after = read_theaters(db_path)
+    # 既存の映画館は ID・座標・URL とも変わらず、新しい名前だけが新しい ID で追加される
+    assert {name: row for name, row in after.items() if name in before} == before
+    assert set(after) - set(before) == {'新宿新館'}
+    assert after['新宿新館'][0] not in {row[0] for row in before.values()}
+    
+    piccadilly, teatre, balt9 = (after[name][0] for name in ('新宿ピカデリー', 'テアトル新宿', '新宿バルト9'))
+    assert walking_minutes(db_path, piccadilly, teatre) == 4
+    assert walking_minutes(db_path, piccadilly, balt9) == 5
+    
+    with sqlite3.connect(db_path) as connection:
+        showtimes = dict(connection.execute('SELECT start_time, theater_id FROM showtimes WHERE show_date = ?',
+                                            ('2025-07-14',)))
+    assert showtimes == {'10:00': piccadilly, '13:00': teatre, '16:00': after['新宿新館'][0]}
+
+def test_crawler_does_not_create_database(tmp_path):
+    db_path = tmp_path / "movie_optimization.db"
+    crawler = CompleteEigaCrawler(cache_dir=None, db_path=str(db_path))
+    # 解析やページの生成だけに使う場合、DBがなければ作らずに全ページを変更ありとして扱う
+    crawler.load_page_fingerprints()
+    assert crawler.page_fingerprints == {}
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,65 @@
+"""
+データセット公開 - ステージングとの差分の行だけが本番DBに反映されることの確認
+"""
+
+import sqlite3
+
+from database_manager import DatabaseManager, DATASET_VERSION, SHOWTIME_FLAT_SELECT
+from dataset_publisher import DatasetPublisher
+
+CHANGED_DATE = "2025-07-14"
+OTHER_DATE = "2025-07-15"
+
+def add_audit_triggers(db_path: str):
+    """上映・距離・showtime_flat の行が書き換えられたら記録するトリガーを本番DBに追加"""
+    connection = sqlite3.connect(db_path)
+    connection.execute("CREATE TABLE audit (table_name TEXT, row_id INTEGER)")
+    for table, key, events in (("showtimes", "showtime_id", ("insert", "update", "delete")),
+                               ("theater_distances", "distance_id", ("insert", "update", "delete")),
+                               ("showtime_flat", "showtime_id", ("insert", "delete"))):
+        for event in events:
+            row = "OLD" if event == "delete" else "NEW"
+            connection.execute(f"""
+                CREATE TRIGGER audit_{table}_{event} AFTER {event.upper()} ON {table}
+                BEGIN INSERT INTO audit VALUES ('{table}', {row}.{key}); END
+            """)
+    connection.commit()
+    connection.close()
+
+def test_publish_applies_only_changed_rows(make_database):
+    db_path = make_database(showtimes_by_date={CHANGED_DATE: 50, OTHER_DATE: 50})
+    add_audit_triggers(db_path)
+    with DatabaseManager(db_path) as db:
+        distances_version = db.get_data_version('theater_distances')
+        dataset_version = db.get_data_version(DATASET_VERSION)
+        showtime_id, movie_id = db.connection.execute(
+            "SELECT showtime_id, movie_id FROM showtimes WHERE show_date = ? ORDER BY showtime_id LIMIT 1",
+            (CHANGED_DATE,)).fetchone()
+        changed_date_ids = {row[0] for row in db.connection.execute(
+            "SELECT showtime_id FROM showtimes WHERE show_date = ?", (CHANGED_DATE,))}
+    
+    # 1ページ分の変更: 上映1件の時刻と映画1本のタイトル
+    publisher = DatasetPublisher(db_path)
+    with publisher.staging() as staging:
+        staging.connection.execute("""
+            UPDATE showtimes SET start_time = '23:55', start_min = 1435, end_min = 1555 WHERE showtime_id = ?
+        """, (showtime_id,))
+        staging.connection.execute("UPDATE movies SET title = '改題した映画' WHERE movie_id = ?", (movie_id,))
+        staging.connection.commit()
+    assert publisher.publish() == dataset_version + 1
+    
+    with DatabaseManager(db_path) as db:
+        connection = db.connection
+        # 変わった上映の行だけが書き換えられ、距離表は触られないので移動時間行列のバージョンも変わらない
+        audit = [tuple(row) for row in connection.execute("SELECT table_name, row_id FROM audit")]
+        assert [row for row in audit if row[0] != "showtime_flat"] == [("showtimes", showtime_id)] * 2
+        assert db.get_data_version('theater_distances') == distances_version
+        
+        # showtime_flat は変わった日だけ作り直され（映画のタイトルは他の日も更新）、内容は全体を作り直した場合と同じ
+        assert {row_id for table, row_id in audit if table == "showtime_flat"} == changed_date_ids
+        assert connection.execute("SELECT COUNT(*) FROM showtime_flat WHERE movie_title = '改題した映画'").fetchone()[0] == \
+            connection.execute("SELECT COUNT(*) FROM showtimes WHERE movie_id = ?", (movie_id,)).fetchone()[0]
+        assert [tuple(row) for row in connection.execute("SELECT * FROM showtime_flat ORDER BY showtime_id")] == \
+            [tuple(row) for row in connection.execute(SHOWTIME_FLAT_SELECT + " ORDER BY s.showtime_id")]
+        assert connection.execute("SELECT start_time FROM showtime_flat WHERE showtime_id = ?",
+                                  (showtime_id,)).fetchone()[0] == '23:55'
@@ -0,0 +1,102 @@
+"""
+HTTPキャッシュ - ETag / Last-Modified による条件付き GET、304 でのキャッシュ本文の返却と統計の確認
+"""
+
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from http_cache import HTTPCache, HTTPCacheAdapter
+
+LAST_MODIFIED = "Mon, 14 Jul 2025 10:00:00 GMT"
+
+class ValidatorHandler(BaseHTTPRequestHandler):
+    """/etag は ETag、/modified は Last-Modified で検証できるページを返す（受け取った条件ヘッダーを記録）"""
+    protocol_version = "HTTP/1.1"
+    pages = {}
+    conditions = []
+    
+    def do_GET(self):
+        body = self.pages[self.path]
+        self.conditions.append((self.path, self.headers.get("If-None-Match"), self.headers.get("If-Modified-Since")))
+        if self.path == "/etag":
+            validator, condition = ("ETag", '"' + hashlib.md5(body).hexdigest() + '"'), "If-None-Match"
+        else:
+            validator, condition = ("Last-Modified", LAST_MODIFIED), "If-Modified-Since"
+        status = 304 if self.headers.get(condition) == validator[1] else 200
+        self.send_response(status)
+        self.send_header(*validator)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", "0" if status == 304 else str(len(body)))
+        self.end_headers()
+        if status == 200:
+            self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def server():
+    handler = type("Handler", (ValidatorHandler,), {
+        "pages": {"/etag": "<h1>ETag のページ</h1>".encode("utf-8"),
+                  "/modified": "<h1>Last-Modified のページ</h1>".encode("utf-8")},
+        "conditions": []
+    })
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield handler, f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+def cached_session(cache: HTTPCache) -> requests.Session:
+    session = requests.Session()
+    session.mount("http://", HTTPCacheAdapter(cache))
+    return session
+
+@pytest.mark.parametrize("path", ["/etag", "/modified"])
+def test_not_modified_is_served_from_cache(server, tmp_path, path):
+    handler, base_url = server
+    body = handler.pages[path]
+    cache = HTTPCache(str(tmp_path / "http_cache"))
+    session = cached_session(cache)
+    
+    first = session.get(base_url + path)
+    assert first.status_code == 200 and first.content == body
+    assert not getattr(first, "from_cache", False)
+    
+    # 保存した検証用ヘッダーで条件付き GET し、304 ならキャッシュの本文で 200 の応答を返す
+    second = session.get(base_url + path)
+    assert second.status_code == 200
+    assert second.content == body and second.text == body.decode("utf-8")
+    assert second.from_cache is True
+    _, if_none_match, if_modified_since = handler.conditions[-1]
+    if path == "/etag":
+        assert if_none_match == first.headers["ETag"] and if_modified_since is None
+    else:
+        assert if_modified_since == LAST_MODIFIED and if_none_match is None
+    
+    stats = cache.stats()
+    assert (stats["requests"], stats["hits"], stats["hit_rate"], stats["stores"]) == (2, 1, 50.0, 1)
+    assert stats["bytes_downloaded"] == len(body) and stats["bytes_saved"] == len(body)
+
+def test_changed_page_is_downloaded_and_stored(server, tmp_path):
+    handler, base_url = server
+    cache = HTTPCache(str(tmp_path / "http_cache"))
+    session = cached_session(cache)
+    session.get(base_url + "/etag")
+    
+    # 本文が変われば ETag も変わるので 200 で取得し直し、キャッシュも新しい本文に置き換える
+    handler.pages["/etag"] = "<h1>更新したページ</h1>".encode("utf-8")
+    changed = session.get(base_url + "/etag")
+    assert changed.content == handler.pages["/etag"]
+    assert not getattr(changed, "from_cache", False)
+    assert cache.load(base_url + "/etag")["body"] == handler.pages["/etag"]
+    
+    stats = cache.stats()
+    assert (stats["requests"], stats["hits"], stats["stores"], stats["bytes_saved"]) == (2, 0, 2, 0)
+    assert session.get(base_url + "/etag").from_cache is True
+    assert cache.stats()["hits"] == 1
@@ -0,0 +1,139 @@
+"""
+連続鑑賞プランナー - 辺の条件・タイトル重複・本数・総所要時間の制約とビーム幅での打ち切りの確認
+
+小さなスケジュールでは、ビーム幅を十分に大きくした探索結果を全チェーンの総当たりと比較する
+"""
+
+import random
+from typing import Dict, List, Tuple
+
+import pytest
+
+from enhanced_optimizer import MovieShowtime
+from marathon_planner import MarathonPlanner
+from schedule_index import ScheduleIndex
+from travel_matrix import TravelMatrix
+
+SHOW_DATE = "2025-07-14"
+DEFAULT_TRAVEL = 15  # 未登録（同じ映画館を含む）の移動時間は PairingEngine の既定値
+DISTANCES = {(1, 2): 10, (2, 1): 10, (1, 3): 25, (3, 1): 25, (2, 3): 20, (3, 2): 20}
+
+def make_index(rows: List[Tuple[int, str, int, int]]) -> ScheduleIndex:
+    """(映画館ID, タイトル, 開始分, 上映分) のリストから索引を作成（上映IDは並び順）"""
+    movie_ids: Dict[str, int] = {}
+    schedule = []
+    for showtime_id, (theater_id, title, start, duration) in enumerate(rows, 1):
+        showtime = MovieShowtime(
+            showtime_id=showtime_id, theater_id=theater_id, movie_id=movie_ids.setdefault(title, len(movie_ids) + 1),
+            theater_name=f"映画館{theater_id}", movie_title=title, show_date=SHOW_DATE,
+            start_time=f"{start // 60:02d}:{start % 60:02d}",
+            end_time=f"{(start + duration) // 60:02d}:{(start + duration) % 60:02d}",
+            screen_number=1, price=1900.0, duration=duration, start_min=start, end_min=start + duration)
+        schedule.append((showtime, start, start + duration))
+    return ScheduleIndex(SHOW_DATE, schedule)
+
+def make_travel_matrix() -> TravelMatrix:
+    return TravelMatrix([{'from_theater_id': a, 'to_theater_id': b, 'walking_minutes': minutes}
+                         for (a, b), minutes in DISTANCES.items()])
+
+def position(index: ScheduleIndex, showtime_id: int) -> int:
+    return index.position_by_id[showtime_id]
+
+def random_rows(seed: int, count: int = 14) -> List[Tuple[int, str, int, int]]:
+    """同じタイトルが複数回上映される1日分のスケジュール"""
+    rng = random.Random(seed)
+    return [(rng.randint(1, 3), f"映画{rng.randint(1, 6)}", rng.randrange(9 * 60, 22 * 60, 5), rng.randint(60, 130))
+            for _ in range(count)]
+
+def all_chains(index: ScheduleIndex, time_from: int, time_to: int, buffer_time: int, gap_penalty: float,
+               max_films: int, max_total_duration=None) -> Dict[Tuple[int, ...], float]:
+    """制約を満たす全チェーンとその評価値（総当たり）"""
+    starts, ends = index.start_array.tolist(), index.end_array.tolist()
+    theaters, titles = index.theater_array.tolist(), [s.movie_title for s in index.by_start]
+    durations = index.duration_array.tolist()
+    vertices = [p for p in range(len(starts)) if starts[p] >= time_from and ends[p] <= time_to]
+    
+    def can_follow(first: int, second: int) -> bool:
+        travel = DISTANCES.get((theaters[first], theaters[second]), DEFAULT_TRAVEL)
+        return ends[first] + travel + buffer_time <= starts[second]
+    
+    chains = {}
+    def visit(chain: Tuple[int, ...], value: float):
+        if max_total_duration is not None and ends[chain[-1]] - starts[chain[0]] > max_total_duration:
+            return
+        chains[chain] = value
+        if len(chain) == max_films:
+            return
+        for p in vertices:
+            if can_follow(chain[-1], p) and titles[p] not in {titles[q] for q in chain}:
+                visit(chain + (p,), value + durations[p] - gap_penalty * (starts[p] - ends[chain[-1]]))
+    for p in vertices:
+        visit((p,), float(durations[p]))
+    return chains
+
+def test_edge_requires_travel_and_buffer():
+    # 11:00 に映画館1で終わる上映の後、映画館2（徒歩10分）なら 11:00 + 10 + 15 = 11:25 開始から観られる
+    index = make_index([(1, "前", 540, 120), (2, "ちょうど", 685, 90), (2, "1分足りない", 684, 90),
+                        (1, "同じ映画館", 690, 90), (1, "同じ映画館で1分足りない", 689, 90), (3, "遠い", 700, 90)])
+    planner = MarathonPlanner(index, make_travel_matrix(), 9 * 60, 24 * 60, buffer_time=15)
+    first = position(index, 1)
+    assert set(planner.successors(first).tolist()) == {position(index, 2), position(index, 4), position(index, 6)}
+    for showtime_id in (2, 4, 6):
+        assert first in planner.predecessors(position(index, showtime_id)).tolist()
+    for showtime_id in (3, 5):
+        assert first not in planner.predecessors(position(index, showtime_id)).tolist()
+    
+    # 移動時間の上限を超える映画館には続けない
+    limited = MarathonPlanner(index, make_travel_matrix(), 9 * 60, 24 * 60, buffer_time=15, max_travel_time=10)
+    assert set(limited.successors(first).tolist()) == {position(index, 2)}
+    
+    # 時間枠の終わりを過ぎて終わる上映は頂点にしない
+    narrow = MarathonPlanner(index, make_travel_matrix(), 9 * 60, 12 * 60 + 30, buffer_time=15)
+    assert narrow.successors(first).tolist() == []
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("max_films, max_total_duration", [(5, None), (3, None), (4, 6 * 60)])
+def test_window_chains_match_exhaustive_search(seed, max_films, max_total_duration):
+    index = make_index(random_rows(seed))
+    expected = all_chains(index, 9 * 60, 24 * 60, 15, 0.5, max_films, max_total_duration=max_total_duration)
+    planner = MarathonPlanner(index, make_travel_matrix(), 9 * 60, 24 * 60, buffer_time=15,
+                              beam_width=len(expected), max_total_duration=max_total_duration)
+    chains = planner.window_chains(max_films=max_films, top_k=len(expected) + 1)
+    
+    assert {chain: value for value, chain in chains} == pytest.approx(expected)
+    assert max(len(chain) for _, chain in chains) == min(max_films, max(len(chain) for chain in expected))
+    # 同じタイトルを2回観るチェーンは辺の条件を満たしていても含まれない
+    assert all(len({index.by_start[p].movie_title for p in chain}) == len(chain) for _, chain in chains)
+    if max_total_duration is not None:
+        assert all(index.end_array[chain[-1]] - index.start_array[chain[0]] <= max_total_duration
+                   for _, chain in chains)
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("min_films, max_films, max_total_duration", [(3, 5, None), (2, 2, None), (3, 4, 7 * 60)])
+def test_anchored_chains_match_exhaustive_search(seed, min_films, max_films, max_total_duration):
+    index = make_index(random_rows(seed))
+    chains = all_chains(index, 9 * 60, 24 * 60, 15, 0.5, max_films, max_total_duration=max_total_duration)
+    planner = MarathonPlanner(index, make_travel_matrix(), 9 * 60, 24 * 60, buffer_time=15,
+                              beam_width=len(chains), max_total_duration=max_total_duration)
+    for anchor in range(len(index)):
+        expected = {chain: value for chain, value in chains.items()
+                    if anchor in chain and min_films <= len(chain) <= max_films}
+        found = planner.anchored_chains(anchor, max_films=max_films, min_films=min_films, top_k=len(expected) + 1)
+        assert {chain: value for value, chain in found} == pytest.approx(expected)
+        assert [value for value, _ in found] == sorted((value for value, _ in found), reverse=True)
+
+def test_beam_keeps_best_scored_chains():
+    # 映画館1だけなので、続けるには 終了 + 15 + 15 <= 次の開始。評価値 = 上映分の合計 - 0.5 * 待ち時間
+    index = make_index([(1, "前1", 600, 120), (1, "前2", 700, 100), (1, "前3", 760, 90), (1, "前4", 780, 80),
+                        (1, "メイン", 900, 100)])
+    target = position(index, 5)
+    expected = {(position(index, 1), target): 130.0, (position(index, 2), target): 150.0,
+                (position(index, 3), target): 165.0, (position(index, 4), target): 160.0, (target,): 100.0}
+    
+    def ending_at_target(beam_width: int) -> Dict[Tuple[int, ...], float]:
+        planner = MarathonPlanner(index, make_travel_matrix(), 9 * 60, 24 * 60, buffer_time=15, beam_width=beam_width)
+        return {chain: value for value, chain in planner.window_chains(max_films=2, top_k=100) if chain[-1] == target}
+    
+    assert ending_at_target(8) == expected
+    # 開始時刻順に伸ばすので評価値の低いチェーンが先に入るが、幅を超えたら上位だけが残る
+    assert ending_at_target(2) == {(position(index, 3), target): 165.0, (position(index, 4), target): 160.0}
@@ -0,0 +1,46 @@
+"""
+既存DBの移行 - このシリーズ以前に作成したDBにもバージョン管理と showtime_flat を追加する
+"""
+
+import sqlite3
+
+from conftest import setup_schema
+from database_manager import DatabaseManager, DATASET_VERSION
+from travel_matrix import TravelMatrixCache
+
+def make_legacy_database(db_path: str):
+    """data_versions と距離のバージョン用トリガーがない古いDBを作成"""
+    setup_schema(db_path)
+    connection = sqlite3.connect(db_path)
+    for event in ("insert", "update", "delete"):
+        connection.execute(f"DROP TRIGGER bump_theater_distances_version_{event}")
+    connection.execute("DROP TABLE data_versions")
+    connection.commit()
+    connection.close()
+
+def test_migrate_installs_data_versions(tmp_path):
+    db_path = str(tmp_path / "legacy.db")
+    make_legacy_database(db_path)
+    
+    with DatabaseManager(db_path) as db:
+        assert db.get_data_version('theater_distances') == 0
+        assert db.get_data_version(DATASET_VERSION) == 0
+        triggers = {row[0] for row in db.connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'bump_theater_distances_version_%'")}
+    assert triggers == {f"bump_theater_distances_version_{event}" for event in ("insert", "update", "delete")}
+
+def test_travel_matrix_reloads_after_distance_change_on_migrated_database(tmp_path):
+    db_path = str(tmp_path / "legacy.db")
+    make_legacy_database(db_path)
+    cache = TravelMatrixCache(db_path)
+    
+    first = cache.get()
+    assert first.get(1, 2) == 5
+    with DatabaseManager(db_path) as db:
+        db.connection.execute("UPDATE theater_distances SET walking_minutes = 7 WHERE from_theater_id = 1 AND to_theater_id = 2")
+        db.connection.commit()
+    
+    second = cache.get()
+    assert second is not first
+    assert second.get(1, 2) == 7
+    assert cache.get() is second
@@ -0,0 +1,136 @@
+"""
+最適化API - データ更新後の索引の再構築とプランキャッシュのバージョン
+"""
+
+import threading
+
+import pytest
+
+from database_manager import DatabaseManager, DATASET_VERSION
+from optimization_api import MovieOptimizationAPI
+
+SHOW_DATE = "2025-07-14"
+
+@pytest.fixture
+def api(make_database):
+    db_path = make_database(showtimes_by_date={SHOW_DATE: 300})
+    api = MovieOptimizationAPI(db_path, optimize_workers=0)
+    yield api
+    api.close()
+
+def pick_showtime(api: MovieOptimizationAPI) -> int:
+    """19時台に始まる上映を1つ選ぶ"""
+    return api.get_available_movies(SHOW_DATE, "19:00", "22:00")[0]['showtime_id']
+
+def keep_only(db_path: str, showtime_id: int) -> int:
+    """その日の上映を1つだけ残してデータセットのバージョンを進める（取り込みの代わり）"""
+    with DatabaseManager(db_path) as db:
+        db.connection.execute("DELETE FROM showtimes WHERE show_date = ? AND showtime_id != ?", (SHOW_DATE, showtime_id))
+        version = db.bump_data_version()
+        db.connection.commit()
+    return version
+
+def plan_showtime_ids(result) -> set:
+    """レスポンスのプランに含まれる上映ID"""
+    ids = set()
+    for plan in result['plans']:
+        for showtime in [plan['primary_showtime'], plan['before_showtime'], plan['after_showtime']] + plan['showtimes']:
+            if showtime:
+                ids.add(showtime['showtime_id'])
+    return ids
+
+def test_version_change_rebuilds_index_in_background(api):
+    showtime_id = pick_showtime(api)
+    before = api.optimize_plan(showtime_id, plan_type="all", time_from="09:00", time_to="24:00")
+    old_index = api.optimizer.schedule_indexes.get(SHOW_DATE)
+    scheduled = set(old_index.by_id)
+    assert len(plan_showtime_ids(before) & scheduled) > 1
+    
+    # 再構築を止めておき、その間のリクエストが旧索引で即座に応答することを確認
+    release = threading.Event()
+    loader = api.optimizer.schedule_indexes._loader
+    api.optimizer.schedule_indexes._loader = lambda show_date: (release.wait(10), loader(show_date))[1]
+    new_version = keep_only(api.db_path, showtime_id)
+    
+    during = api.optimize_plan(showtime_id, plan_type="all", time_from="08:00", time_to="24:00")
+    assert during['success']
+    assert api.optimizer.schedule_indexes.get(SHOW_DATE) is old_index
+    # 旧索引で計算したプランは新しいバージョンのキーには保存されない
+    params = (showtime_id, "all", "08:00", "24:00", 15, 30, 480, 5)
+    assert api.plan_cache.get(params + (new_version,)) is None
+    assert api.plan_cache.get(params + (old_index.version,)) is not None
+    
+    release.set()
+    api.optimizer.schedule_indexes.wait()
+    assert api.optimizer.schedule_indexes.get(SHOW_DATE).version == new_version
+    after = api.optimize_plan(showtime_id, plan_type="all", time_from="08:00", time_to="24:00")
+    assert plan_showtime_ids(after) & scheduled == {showtime_id}
+    assert api.plan_cache.get(params + (new_version,)) is not None
+
+def test_refresh_during_refresh_rebuilds_again(api):
+    store = api.optimizer.schedule_indexes
+    store.get(SHOW_DATE)
+    release = threading.Event()
+    loader = store._loader
+    store._loader = lambda show_date: (loader(show_date), release.wait(10))[0]
+    
+    store.refresh()
+    # 1回目の再構築が読み終えた後にデータが更新された場合も、もう一度作り直して新しいデータになる
+    new_version = keep_only(api.db_path, pick_showtime(api))
+    store.refresh()
+    release.set()
+    store.wait()
+    
+    with DatabaseManager(api.db_path) as db:
+        assert db.get_data_version(DATASET_VERSION) == new_version
+    assert store.get(SHOW_DATE).version == new_version
+    assert len(store.get(SHOW_DATE)) == 1
+
+def test_find_best_schedules_follows_dataset_version(api):
+    first = api.find_best_schedules(SHOW_DATE, "09:00", "24:00", max_films=3)
+    scheduled = set(api.optimizer.schedule_indexes.get(SHOW_DATE).by_id)
+    assert len(plan_showtime_ids(first) & scheduled) > 1
+    assert api.find_best_schedules(SHOW_DATE, "09:00", "24:00", max_films=3) == first
+    
+    showtime_id = pick_showtime(api)
+    keep_only(api.db_path, showtime_id)
+    api.find_best_schedules(SHOW_DATE, "09:00", "24:00", max_films=3)
+    api.optimizer.schedule_indexes.wait()
+    
+    after = api.find_best_schedules(SHOW_DATE, "09:00", "24:00", max_films=3)
+    assert plan_showtime_ids(after) == {showtime_id}
+
+def add_showtime(db_path: str) -> tuple:
+    """既存の映画館・映画で上映を1つ追加してデータセットのバージョンを進める（取り込みの代わり）"""
+    with DatabaseManager(db_path) as db:
+        theater_id, movie_id = db.connection.execute(
+            "SELECT theater_id, movie_id FROM showtimes WHERE show_date = ? LIMIT 1", (SHOW_DATE,)).fetchone()
+        showtime_id = db.insert_or_update_showtime(theater_id, movie_id, SHOW_DATE, "19:30", screen_number=99)
+        version = db.bump_data_version()
+        db.connection.commit()
+    return showtime_id, version
+
+def test_new_showtime_waits_for_index_rebuild(api):
+    old_index = api.optimizer.schedule_indexes.get(SHOW_DATE)
+    release = threading.Event()
+    loader = api.optimizer.schedule_indexes._loader
+    api.optimizer.schedule_indexes._loader = lambda show_date: (release.wait(10), loader(show_date))[1]
+    showtime_id, new_version = add_showtime(api.db_path)
+    assert old_index.get(showtime_id) is None
+    
+    # 新しいバージョンにしかない上映は、旧索引で「見つからない」とせず再構築の完了を待つ
+    threading.Timer(0.2, release.set).start()
+    result = api.optimize_plan(showtime_id, plan_type="all", time_from="09:00", time_to="24:00")
+    assert result['success'], result
+    assert api.optimizer.schedule_indexes.get(SHOW_DATE).version == new_version
+    params = (showtime_id, "all", "09:00", "24:00", 15, 30, 480, 5)
+    assert api.plan_cache.get(params + (new_version,)) is not None
+
+def test_new_showtime_loads_index_without_refresh(api):
+    api.optimizer.schedule_indexes.get(SHOW_DATE)
+    showtime_id, new_version = add_showtime(api.db_path)
+    
+    # 再構築が始まっていなくても、DBにある上映なら索引をその場で読み直す
+    plans = api.optimizer.optimize_movie_plan(showtime_id, "all", "09:00", "24:00", show_date=SHOW_DATE)
+    assert plans
+    assert api.optimizer.schedule_indexes.get(SHOW_DATE).version == new_version
@@ -0,0 +1,42 @@
+"""
+最適化のクエリ数 - 1回の optimize_movie_plan が発行するSQL文の数は上映数によらず一定
+"""
+
+from database_manager import DatabaseManager
+from enhanced_optimizer import EnhancedOptimizer
+
+SMALL_DATE = "2025-07-14"
+LARGE_DATE = "2025-07-15"
+
+def first_showtime(db_path: str, show_date: str) -> int:
+    """その日の最初の上映ID"""
+    with DatabaseManager(db_path, read_only=True) as db:
+        return db.get_schedule_snapshot(show_date)[0]['showtime_id']
+
+def test_optimize_movie_plan_issues_constant_number_of_statements(tmp_path, make_database, traced_statements):
+    db_path = str(tmp_path / "movie_optimization.db")
+    statements = traced_statements(db_path)
+    make_database(showtimes_by_date={SMALL_DATE: 10, LARGE_DATE: 2000})
+    showtime_ids = {show_date: first_showtime(db_path, show_date) for show_date in (SMALL_DATE, LARGE_DATE)}
+    
+    cold = {}
+    warm = {}
+    for show_date, showtime_id in showtime_ids.items():
+        optimizer = EnhancedOptimizer(db_path)
+        del statements[:]
+        plans = optimizer.optimize_movie_plan(showtime_id, "all")
+        cold[show_date] = list(statements)
+        assert plans
+        
+        # 索引・移動時間行列の構築後はバージョン確認と上映日の取得だけ
+        del statements[:]
+        assert optimizer.optimize_movie_plan(showtime_id, "all") == plans
+        warm[show_date] = list(statements)
+    
+    # 上映日・移動時間のバージョン・移動時間と、同じ読み取りトランザクションでのデータセットのバージョン・
+    # その日のスケジュール（1回の範囲走査）
+    assert [sql.split()[0] for sql in cold[LARGE_DATE]] == ["SELECT", "SELECT", "SELECT", "BEGIN", "SELECT", "SELECT",
+                                                            "COMMIT"], cold
+    assert len(cold[SMALL_DATE]) == len(cold[LARGE_DATE]), cold
+    assert len(warm[SMALL_DATE]) == len(warm[LARGE_DATE]) == 2, warm
+    assert sum("FROM showtime_flat" in sql for sql in cold[LARGE_DATE]) == 1
@@ -0,0 +1,125 @@
+"""
+ページコーパス - クローリング中に記録したページを保存・読み込みして再生すると、同じバイト列のページが
+parse_page に渡り、記録時と同じ指紋・解析結果になることの確認
+"""
+
+import gzip
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from conftest import REPO_ROOT
+from complete_eiga_crawler import CompleteEigaCrawler
+from page_corpus import PageCorpus
+
+FIXTURES = os.path.join(REPO_ROOT, "tests", "fixtures", "eiga")
+THEATER = '新宿ピカデリー'
+# 映画ID → スケジュールページのフィクスチャ
+SCHEDULES = {
+    "101": "schedule_bare_minutes.html",
+    "102": "schedule_label_after_table.html",
+    "103": "schedule_label_in_fragment.html",
+    "104": "schedule_label_in_head.html",
+    "105": "schedule_no_table.html"
+}
+GZIPPED = "103"  # Content-Encoding: gzip で返すページ（コーパスには展開した本文を記録する）
+
+with open(os.path.join(FIXTURES, "expected.json"), encoding="utf-8") as f:
+    EXPECTED = json.load(f)
+
+def read_fixture(name: str) -> bytes:
+    with open(os.path.join(FIXTURES, name), "rb") as f:
+        return f.read()
+
+class PageHandler(BaseHTTPRequestHandler):
+    """path → 本文 のページを返す"""
+    protocol_version = "HTTP/1.1"
+    pages = {}
+    gzipped = set()
+    
+    def do_GET(self):
+        body = self.pages.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        if self.path in self.gzipped:
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def site():
+    """映画館ページとスケジュールページを返すサーバー（記録が終わったら止める関数も返す）"""
+    crawler = CompleteEigaCrawler(cache_dir=None, base_url="")
+    pages = {crawler.theaters[THEATER]['url']: read_fixture("theater_3017.html")}
+    for movie_id, name in SCHEDULES.items():
+        pages[crawler.movie_schedule_url(movie_id, THEATER)] = read_fixture(name)
+    handler = type("Handler", (PageHandler,), {
+        "pages": pages,
+        "gzipped": {crawler.movie_schedule_url(GZIPPED, THEATER)}
+    })
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    stopped = []
+    
+    def stop():
+        if not stopped:
+            stopped.append(True)
+            httpd.shutdown()
+            httpd.server_close()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", pages, stop
+    stop()
+
+def crawl(crawler: CompleteEigaCrawler) -> list:
+    """映画館ページと各スケジュールページを parse_page を通して取得"""
+    crawler.load_page_fingerprints()
+    return [crawler.get_theater_movies(THEATER)] + \
+        [crawler.get_movie_schedule(movie_id, THEATER) for movie_id in SCHEDULES]
+
+def test_replayed_pages_are_byte_identical(site, tmp_path):
+    base_url, pages, stop = site
+    db_path = str(tmp_path / "movie_optimization.db")  # 作成しないので指紋は空（全ページを解析）
+    
+    recorder = CompleteEigaCrawler(base_url=base_url, cache_dir=None, db_path=db_path)
+    corpus = recorder.record_corpus(PageCorpus(str(tmp_path / "corpus.jsonl.gz")))
+    recorded = crawl(recorder)
+    corpus.save()
+    stop()
+    assert recorded[0] == EXPECTED["theater_3017.html"]
+    assert [schedule['title'] for schedule in recorded[1:]] == [EXPECTED[name]['title'] for name in SCHEDULES.values()]
+    
+    # 保存したコーパスには展開済みの本文を元のバイト列のまま、転送用のヘッダーを除いて記録している
+    loaded = PageCorpus.load(corpus.path)
+    assert {url[len(base_url):]: entry["body"] for url, entry in loaded.entries.items()} == pages
+    for entry in loaded.entries.values():
+        assert entry["status"] == 200
+        assert "Content-Encoding" not in entry["headers"] and "Content-Length" not in entry["headers"]
+    
+    # サーバーを止めても、再生した応答は同じバイト列で parse_page に渡り同じ指紋・解析結果になる
+    replayer = CompleteEigaCrawler(base_url=base_url, cache_dir=None, db_path=db_path)
+    replay = replayer.replay_corpus(loaded)
+    assert crawl(replayer) == recorded
+    assert replayer.changed_fingerprints == recorder.changed_fingerprints
+    assert len(replayer.changed_fingerprints) == len(pages)
+    for path, body in pages.items():
+        response = replayer.session.get(base_url + path)
+        assert response.content == body
+        assert response.encoding == "utf-8" and response.text == body.decode("utf-8")
+    assert replay.stats() == {"pages": len(pages), "replayed": 2 * len(pages), "missing": 0, "latency_ms": 0.0}
+    
+    # 記録されていないページは 404
+    assert replayer.session.get(base_url + "/theater/13/130201/9999/").status_code == 404
+    assert replay.missing == 1
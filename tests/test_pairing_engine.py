@@ -0,0 +1,110 @@
+"""
+前後映画の組み合わせ判定 - 余裕時間・移動時間・同じタイトルの除外・時間枠・総所要時間の一括判定の確認
+"""
+
+from typing import List, Tuple
+
+from enhanced_optimizer import MovieShowtime
+from pairing_engine import PairingEngine
+from schedule_index import ScheduleIndex
+from travel_matrix import TravelMatrix
+
+SHOW_DATE = "2025-07-14"
+TARGET_ID = 1
+
+def make_showtime(showtime_id: int, theater_id: int, movie_id: int, title: str, start: int, end: int,
+                  duration: int = None) -> MovieShowtime:
+    return MovieShowtime(
+        showtime_id=showtime_id, theater_id=theater_id, movie_id=movie_id, theater_name=f"映画館{theater_id}",
+        movie_title=title, show_date=SHOW_DATE, start_time=f"{start // 60:02d}:{start % 60:02d}",
+        end_time=f"{end // 60:02d}:{end % 60:02d}", screen_number=1, price=1900.0,
+        duration=duration or end - start, start_min=start, end_min=end)
+
+def make_engine(showtimes: List[MovieShowtime]) -> Tuple[PairingEngine, MovieShowtime]:
+    # 映画館1 → 2 は徒歩10分、1 → 3 は25分（同じ映画館は未登録なので既定の15分）
+    travel_matrix = TravelMatrix([{'from_theater_id': a, 'to_theater_id': b, 'walking_minutes': minutes}
+                                  for a, b, minutes in ((1, 2, 10), (2, 1, 10), (1, 3, 25), (3, 1, 25))])
+    index = ScheduleIndex(SHOW_DATE, [(s, s.start_min, s.end_min) for s in showtimes])
+    return PairingEngine(index, travel_matrix), index.get(TARGET_ID)
+
+def found_ids(engine: PairingEngine, result) -> List[int]:
+    return sorted(engine.index.by_start[position].showtime_id for position in result.positions.tolist())
+
+def test_before_requires_travel_and_buffer():
+    # メイン映画は映画館1で 15:00 開始。前映画は 終了 + 移動 + 余裕時間15分 <= 15:00 なら観られる
+    engine, target = make_engine([
+        make_showtime(TARGET_ID, 1, 1, "メイン", 900, 1020),
+        make_showtime(2, 2, 2, "徒歩10分ちょうど", 750, 875),
+        make_showtime(3, 2, 3, "徒歩10分で1分足りない", 751, 876),
+        make_showtime(4, 1, 4, "同じ映画館ちょうど", 750, 870),
+        make_showtime(5, 1, 5, "同じ映画館で1分足りない", 751, 871),
+        make_showtime(6, 3, 6, "徒歩25分ちょうど", 740, 860),
+        make_showtime(7, 3, 7, "徒歩25分で1分足りない", 741, 861)
+    ])
+    result = engine.before(target, 540, 1440, buffer_time=15)
+    assert found_ids(engine, result) == [2, 4, 6]
+    assert sorted(result.travel_minutes.tolist()) == [10, 15, 25]
+    
+    # 余裕時間を0分にすると1分足りなかった上映も間に合う
+    assert found_ids(engine, engine.before(target, 540, 1440, buffer_time=0)) == [2, 3, 4, 5, 6, 7]
+    # 移動時間の上限を超える映画館は除外
+    assert found_ids(engine, engine.before(target, 540, 1440, buffer_time=15, max_travel_time=15)) == [2, 4]
+
+def test_after_requires_travel_and_buffer():
+    # メイン映画は映画館1で 17:00 終了。後映画は 17:00 + 移動 + 余裕時間15分 以降に開始なら観られる
+    engine, target = make_engine([
+        make_showtime(TARGET_ID, 1, 1, "メイン", 900, 1020),
+        make_showtime(2, 2, 2, "徒歩10分ちょうど", 1045, 1150),
+        make_showtime(3, 2, 3, "徒歩10分で1分足りない", 1044, 1150),
+        make_showtime(4, 1, 4, "同じ映画館ちょうど", 1050, 1150),
+        make_showtime(5, 1, 5, "同じ映画館で1分足りない", 1049, 1150),
+        make_showtime(6, 3, 6, "徒歩25分ちょうど", 1060, 1150),
+        make_showtime(7, 3, 7, "徒歩25分で1分足りない", 1059, 1150)
+    ])
+    result = engine.after(target, 540, 1440, buffer_time=15)
+    assert found_ids(engine, result) == [2, 4, 6]
+    assert found_ids(engine, engine.after(target, 540, 1440, buffer_time=15, max_travel_time=15)) == [2, 4]
+
+def test_same_title_is_excluded():
+    # 同じ映画（別の上映）と、映画IDは違っても同じタイトルの上映は組み合わせない
+    engine, target = make_engine([
+        make_showtime(TARGET_ID, 1, 1, "メイン", 900, 1020),
+        make_showtime(2, 1, 1, "メイン", 600, 720),
+        make_showtime(3, 1, 8, "メイン", 610, 730),
+        make_showtime(4, 1, 2, "別の映画", 620, 740),
+        make_showtime(5, 1, 1, "メイン", 1200, 1320),
+        make_showtime(6, 1, 8, "メイン", 1210, 1330),
+        make_showtime(7, 1, 3, "別の映画2", 1220, 1340)
+    ])
+    assert found_ids(engine, engine.before(target, 540, 1440)) == [4]
+    assert found_ids(engine, engine.after(target, 540, 1440)) == [7]
+
+def test_window_bounds():
+    # 時間枠 [10:00, 22:00] に開始から終了まで収まる上映だけを候補にする
+    engine, target = make_engine([
+        make_showtime(TARGET_ID, 1, 1, "メイン", 900, 1020),
+        make_showtime(2, 1, 2, "枠の開始ちょうど", 600, 720),
+        make_showtime(3, 1, 3, "枠の開始より前", 599, 720),
+        make_showtime(4, 1, 4, "枠の終了ちょうど", 1200, 1320),
+        make_showtime(5, 1, 5, "枠の終了を過ぎる", 1200, 1321)
+    ])
+    assert found_ids(engine, engine.before(target, 600, 1320)) == [2]
+    assert found_ids(engine, engine.after(target, 600, 1320)) == [4]
+
+def test_total_duration_uses_target_end():
+    # メイン映画の終了時刻は上映分（120分）からではなく索引の終了分（16:40）で数える
+    engine, target = make_engine([
+        make_showtime(TARGET_ID, 1, 1, "メイン", 900, 1000, duration=120),
+        make_showtime(2, 1, 2, "5時間ちょうど", 700, 800),
+        make_showtime(3, 1, 3, "5時間を1分超える", 699, 800),
+        make_showtime(4, 1, 4, "後の5時間ちょうど", 1030, 1200),
+        make_showtime(5, 1, 5, "後の5時間を1分超える", 1030, 1201)
+    ])
+    before = engine.before(target, 540, 1440, max_total_duration=300)
+    assert found_ids(engine, before) == [2]
+    assert before.total_duration.tolist() == [300]
+    assert engine.before(target, 540, 1440).total_duration.tolist() == [301, 300]
+    
+    after = engine.after(target, 540, 1440, max_total_duration=300)
+    assert found_ids(engine, after) == [4]
+    assert after.total_duration.tolist() == [300]
@@ -0,0 +1,65 @@
+"""
+最適化プロセスプール - データ更新（refresh）と並行に最適化を投入しても失敗しない
+"""
+
+import threading
+
+from database_manager import DatabaseManager
+from plan_workers import OptimizationProcessPool
+
+SHOW_DATE = "2025-07-14"
+
+class RefreshOnRelease:
+    """プールのロックの代わり。armed の間は、ロックを手放した直後に別スレッドで refresh() を実行する"""
+    
+    def __init__(self, pool: OptimizationProcessPool):
+        self.pool = pool
+        self.lock = threading.Lock()
+        self.armed = False
+    
+    def __enter__(self):
+        self.lock.acquire()
+        return self
+    
+    def __exit__(self, *exc):
+        self.lock.release()
+        if self.armed:
+            self.armed = False
+            refresher = threading.Thread(target=self.pool.refresh)
+            refresher.start()
+            refresher.join()
+
+def test_optimize_survives_refresh_right_after_dispatch(make_database):
+    db_path = make_database(showtimes_by_date={SHOW_DATE: 100})
+    with DatabaseManager(db_path, read_only=True) as db:
+        showtime_id = db.get_schedule_snapshot(SHOW_DATE)[0]['showtime_id']
+    request = (showtime_id, "all", "09:00", "24:00", 5, 15, None, None)
+    pool = OptimizationProcessPool(db_path, max_workers=1)
+    pool._lock = RefreshOnRelease(pool)
+    try:
+        pool.optimize(SHOW_DATE, request)
+        # 投入した直後にデータ更新でワーカーが停止されても、投入済みの最適化は旧ワーカーで完了する
+        pool._lock.armed = True
+        show_date, plans, _ = pool.optimize(SHOW_DATE, request)
+        assert show_date == SHOW_DATE and plans
+        assert pool.stats()["running"] is False
+    finally:
+        pool.shutdown()
+
+def test_optimize_restarts_crashed_workers(make_database):
+    db_path = make_database(showtimes_by_date={SHOW_DATE: 100})
+    with DatabaseManager(db_path, read_only=True) as db:
+        showtime_id = db.get_schedule_snapshot(SHOW_DATE)[0]['showtime_id']
+    request = (showtime_id, "all", "09:00", "24:00", 5, 15, None, None)
+    pool = OptimizationProcessPool(db_path, max_workers=1)
+    try:
+        expected = pool.optimize(SHOW_DATE, request)
+        # ワーカーが異常終了するとプールは BrokenProcessPool になるが、次の最適化はプールを作り直して成功する
+        for process in list(pool._executor._processes.values()):
+            process.kill()
+            process.join()
+        assert pool.optimize(SHOW_DATE, request) == expected
+        assert pool.stats()["restarts"] == 2
+        assert pool.optimize(SHOW_DATE, request) == expected
+    finally:
+        pool.shutdown()
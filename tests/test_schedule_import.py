@@ -0,0 +1,88 @@
+"""
+スケジュールの一括取り込み - 1行ずつの取り込みと同じ結果になること、取り込みに失敗しても showtime_flat の
+トリガーが元に戻ることの確認
+"""
+
+import json
+import random
+
+import pytest
+
+from database_manager import DatabaseManager
+
+SHOW_DATE = "2025-07-14"
+OTHER_DATE = "2025-07-15"
+
+def table_rows(db: DatabaseManager, table: str, order_by: str) -> list:
+    """作成・更新日時を除いた全行"""
+    columns = [f'"{row[1]}"' for row in db.connection.execute(f"PRAGMA table_info({table})")
+               if row[1] not in ('created_at', 'updated_at')]
+    return [tuple(row) for row in db.connection.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY {order_by}")]
+
+def flat_triggers(db: DatabaseManager) -> set:
+    return {row[0] for row in db.connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'showtime\\_flat\\_%' ESCAPE '\\'")}
+
+def test_bulk_import_matches_row_by_row_import(make_database, tmp_path):
+    with DatabaseManager(make_database("bulk.db", showtimes_by_date={SHOW_DATE: 40, OTHER_DATE: 40})) as db:
+        theater_names = [theater['name'] for theater in db.get_theaters()]
+    rng = random.Random(7)
+    schedule = [{'title': rng.choice(['新作A', '新作B', '新作C', 'テスト映画3', 'テスト映画5', '12:30 新作A', '1']),
+                 'theater_name': rng.choice(theater_names + ['存在しない映画館']),
+                 'date': SHOW_DATE if i % 5 else OTHER_DATE,
+                 'start_time': rng.choice(['10:00', '13:30', '18:45', '23:30'])}
+                for i in range(200)]
+    json_path = tmp_path / "schedule.json"
+    json_path.write_text(json.dumps({'metadata': {'target_date': SHOW_DATE}, 'schedule': schedule},
+                                    ensure_ascii=False), encoding='utf-8')
+    
+    tables = {}
+    results = {}
+    for bulk, name in ((True, "bulk.db"), (False, "rows.db")):
+        db_path = str(tmp_path / name) if bulk else make_database(name, showtimes_by_date={SHOW_DATE: 40, OTHER_DATE: 40})
+        with DatabaseManager(db_path) as db:
+            random.seed(1)  # スクリーン番号は行ごとに乱数で割り当てる
+            result = db.import_schedule_data(str(json_path), bulk=bulk)
+            results[bulk] = {key: value for key, value in result.items() if key != 'source_file'}
+            tables[bulk] = {
+                'theaters': table_rows(db, 'theaters', 'theater_id'),
+                'movies': table_rows(db, 'movies', 'movie_id'),
+                'showtimes': table_rows(db, 'showtimes', 'showtime_id'),
+                'showtime_flat': table_rows(db, 'showtime_flat', 'show_date, start_min, showtime_id')
+            }
+    
+    assert results[True] == results[False]
+    for table in tables[True]:
+        assert tables[True][table] == tables[False][table], table
+    # 既存の映画の更新・新しい映画・日付をまたぐ終了・対象日以外の日付の上映も含まれている
+    showtimes = tables[True]['showtimes']
+    assert any(row[4] == '23:30' and row[5] == '25:30' for row in showtimes)
+    assert {row[3] for row in showtimes} == {SHOW_DATE, OTHER_DATE}
+    assert {'新作A', '新作B', '新作C'} <= {row[1] for row in tables[True]['movies']}
+
+def test_failed_bulk_import_keeps_flat_triggers(make_database, tmp_path):
+    db_path = make_database(showtimes_by_date={SHOW_DATE: 20})
+    json_path = tmp_path / "schedule.json"
+    json_path.write_text(json.dumps({
+        'metadata': {'target_date': SHOW_DATE},
+        'schedule': [
+            {'title': '取り込み映画', 'theater_name': '新宿ピカデリー', 'date': SHOW_DATE, 'start_time': '10:00'},
+            {'title': '日付のない映画', 'theater_name': '新宿ピカデリー', 'start_time': '12:00'}
+        ]
+    }, ensure_ascii=False), encoding='utf-8')
+    
+    with DatabaseManager(db_path) as db:
+        triggers = flat_triggers(db)
+        assert len(triggers) == 9
+        with pytest.raises(KeyError):
+            db.import_schedule_data(str(json_path))
+        assert flat_triggers(db) == triggers
+        assert db.connection.execute("SELECT COUNT(*) FROM showtimes WHERE show_date = ?", (SHOW_DATE,)).fetchone()[0] == 20
+        
+        # トリガーが残っているので、以降の書き込みも showtime_flat に反映される
+        theater_id = db.get_theater_by_name('新宿ピカデリー')['theater_id']
+        showtime_id = db.insert_or_update_showtime(theater_id, db.insert_or_update_movie('後から追加した映画'),
+                                                   SHOW_DATE, '23:50')
+        db.connection.commit()
+        assert db.connection.execute("SELECT movie_title FROM showtime_flat WHERE showtime_id = ?",
+                                     (showtime_id,)).fetchone()[0] == '後から追加した映画'
@@ -0,0 +1,60 @@
+"""
+ページ解析 - 映画.com のページの構造を写したフィクスチャで、各解析方式が従来の解析と同じ結果になることの確認
+
+tests/fixtures/eiga/expected.json は従来（このシリーズ以前）の crawler の解析をそのまま各フィクスチャに
+適用した結果。従来からの変更は、二重エスケープで一致しなかった正規表現の修正と「上映時間：N分」の優先だけ。
+上映日の年は解析した年になるので月日だけ記録している
+"""
+
+import json
+import os
+
+import pytest
+
+from conftest import REPO_ROOT
+from complete_eiga_crawler import CompleteEigaCrawler
+from schedule_parser import available_parsers
+
+FIXTURES = os.path.join(REPO_ROOT, "tests", "fixtures", "eiga")
+
+with open(os.path.join(FIXTURES, "expected.json"), encoding="utf-8") as f:
+    EXPECTED = json.load(f)
+
+def read_fixture(name: str) -> bytes:
+    with open(os.path.join(FIXTURES, name), "rb") as f:
+        return f.read()
+
+def without_year(schedule: dict) -> dict:
+    return {**schedule, 'showtimes': [{**showtime, 'date': showtime['date'][5:]} for showtime in schedule['showtimes']]}
+
+@pytest.mark.parametrize("parser", available_parsers())
+@pytest.mark.parametrize("name", sorted(EXPECTED))
+def test_parser_matches_baseline(parser, name):
+    crawler = CompleteEigaCrawler(cache_dir=None, parser=parser)
+    content = read_fixture(name)
+    if name.startswith("theater_"):
+        assert crawler.parse_theater_movies('新宿ピカデリー', content) == EXPECTED[name]
+    else:
+        assert without_year(crawler.parse_movie_schedule(content)) == EXPECTED[name]
+
+@pytest.mark.parametrize("parser", available_parsers())
+def test_bare_minutes_outside_schedule_are_ignored(parser):
+    # 「上映時間：N分」がなければスケジュール部分の「N分」だけを見る（従来はヘッダーの「徒歩5分」を拾っていた）
+    content = ('<html><header><p>新宿駅から徒歩5分</p></header><h1>作品</h1>'
+               '<table class="weekly-schedule"><tr><td><p class="date">7/14</p><span>10:00</span></td></tr></table>'
+               '</html>').encode('utf-8')
+    schedule = CompleteEigaCrawler(cache_dir=None, parser=parser).parse_movie_schedule(content)
+    assert schedule['duration'] == 120
+    assert schedule['showtimes'][0]['end_time'] == '12:00'
+
+def test_duration_label_outside_schedule_changes_fingerprint():
+    crawler = CompleteEigaCrawler(cache_dir=None)
+    url = "https://eiga.com/movie-theater/101234/13/130201/3017/"
+    content = read_fixture("schedule_label_after_table.html")
+    parse = lambda page: (lambda: crawler.parse_movie_schedule(page))
+    
+    crawler.parse_page(url, content, parse(content))
+    crawler.page_fingerprints = dict(crawler.changed_fingerprints)
+    changed = content.replace("上映時間：119分".encode('utf-8'), "上映時間：121分".encode('utf-8'))
+    assert crawler.parse_page(url, changed, parse(changed))['duration'] == 121
+    assert crawler.page_changes[url] is True
@@ -0,0 +1,56 @@
+"""
+深夜上映 - 日付をまたぐ上映（"25:10" 終了）と 22:00〜26:00 の時間枠を上映日基準の分で扱うことの確認
+"""
+
+from database_manager import DatabaseManager
+from enhanced_optimizer import EnhancedOptimizer
+from optimization_api import MovieOptimizationAPI
+from schedule_time import end_minutes, minutes_to_time, time_to_minutes, window_minutes
+
+SHOW_DATE = "2025-07-20"
+
+def test_time_conversion_past_midnight():
+    assert time_to_minutes("25:10") == 1510 and minutes_to_time(1510) == "25:10"
+    assert end_minutes(time_to_minutes("23:30"), "01:10") == 1510
+    # 終了が開始より前の時間枠は翌日まで（"02:00" は "26:00" と同じ）
+    assert window_minutes("22:00", "26:00") == window_minutes("22:00", "02:00") == (1320, 1560)
+
+def test_late_show_ending_after_midnight(make_database):
+    db_path = make_database(showtimes_by_date={})
+    with DatabaseManager(db_path) as db:
+        theater_id = db.get_theaters()[0]['theater_id']
+        early_id = db.insert_or_update_showtime(theater_id, db.insert_or_update_movie('22時の映画', duration=60),
+                                                SHOW_DATE, '22:00')
+        late_id = db.insert_or_update_showtime(theater_id, db.insert_or_update_movie('レイトショー', duration=100),
+                                               SHOW_DATE, '23:30')
+        db.connection.commit()
+        late = db.connection.execute("SELECT end_time, start_min, end_min FROM showtimes WHERE showtime_id = ?",
+                                     (late_id,)).fetchone()
+        assert tuple(late) == ('25:10', 1410, 1510)
+    
+    # 25:10 に終わる上映は 22:00〜26:00（= 22:00〜02:00）の枠には入り、25:00 までの枠には入らない
+    api = MovieOptimizationAPI(db_path, optimize_workers=0)
+    try:
+        for time_to in ("26:00", "02:00"):
+            assert [m['showtime_id'] for m in api.get_available_movies(SHOW_DATE, "22:00", time_to)] == \
+                [early_id, late_id]
+        assert [m['showtime_id'] for m in api.get_available_movies(SHOW_DATE, "22:00", "25:00")] == [early_id]
+    finally:
+        api.close()
+    
+    # 22:00 の上映（23:00 終了）の後に、同じ映画館（移動15分 + 余裕15分）で 23:30 のレイトショーを続けて観られる
+    # （デモ用の仮想の上映は除いて、DBの上映との組み合わせだけを見る）
+    optimizer = EnhancedOptimizer(db_path)
+    def paired(showtime_id: int, plan_type: str, time_to: str) -> list:
+        side = "after_showtime" if plan_type == "after" else "before_showtime"
+        plans = optimizer.optimize_movie_plan(showtime_id, plan_type, time_from="22:00", time_to=time_to)
+        return [getattr(plan, side) for plan in plans if getattr(plan, side) is not None
+                and getattr(plan, side).showtime_id in (early_id, late_id)]
+    
+    after = paired(early_id, "after", "26:00")
+    assert [(s.showtime_id, s.end_time) for s in after] == [(late_id, "25:10")]
+    assert paired(early_id, "after", "25:00") == []
+    
+    # レイトショーをメインにすると、前に 22:00 の上映を組み合わせられる（25:00 までの枠ではメインが入らない）
+    assert [s.showtime_id for s in paired(late_id, "before", "02:00")] == [early_id]
+    assert optimizer.optimize_movie_plan(late_id, "before", time_from="22:00", time_to="25:00") == []
@@ -0,0 +1,82 @@
+"""
+バッチ書き込み - db.batch() の中では行ごとにコミットせず、バッチ単位（max_rows 行ごと）にまとめてコミットすることの確認
+"""
+
+import sqlite3
+
+import pytest
+
+from database_manager import DatabaseManager
+
+SHOW_DATE = "2025-07-14"
+
+def add_rows(db: DatabaseManager, count: int) -> int:
+    """映画館・映画・上映を1行ずつ書き込み、書き込んだ行数を返す"""
+    theater_id = db.get_or_create_theater("バッチ映画館")
+    movie_id = db.get_or_create_movie("バッチ映画", duration=100)
+    for i in range(count):
+        start = 9 * 60 + i * 5
+        db.add_showtime(movie_id, theater_id, SHOW_DATE, f"{start // 60:02d}:{start % 60:02d}",
+                        f"{(start + 100) // 60:02d}:{(start + 100) % 60:02d}")
+    return count + 2
+
+def committed_showtimes(db_path: str) -> int:
+    """別の接続から見えるコミット済みの上映数"""
+    connection = sqlite3.connect(db_path)
+    try:
+        return connection.execute("SELECT COUNT(*) FROM showtimes WHERE show_date = ?", (SHOW_DATE,)).fetchone()[0]
+    finally:
+        connection.close()
+
+def commits(statements: list) -> int:
+    return sum(sql.strip().upper() == "COMMIT" for sql in statements)
+
+def test_rows_are_committed_one_by_one_without_batch(tmp_path, make_database, traced_statements):
+    db_path = str(tmp_path / "movie_optimization.db")
+    statements = traced_statements(db_path)
+    make_database(showtimes_by_date={})
+    with DatabaseManager(db_path) as db:
+        del statements[:]
+        rows = add_rows(db, 30)
+        assert commits(statements) == rows
+
+def test_batch_commits_once(tmp_path, make_database, traced_statements):
+    db_path = str(tmp_path / "movie_optimization.db")
+    statements = traced_statements(db_path)
+    make_database(showtimes_by_date={})
+    with DatabaseManager(db_path) as db:
+        del statements[:]
+        with db.batch(max_rows=1000, max_interval_ms=60_000) as batch:
+            rows = add_rows(db, 30)
+            # 入れ子のバッチは外側に合流する
+            with db.batch(max_rows=1):
+                db.add_showtime(db.get_or_create_movie("バッチ映画"), db.get_or_create_theater("バッチ映画館"),
+                                SHOW_DATE, "23:00", "24:40")
+            assert commits(statements) == 0
+            assert committed_showtimes(db_path) == 0
+        assert commits(statements) == 1
+        assert (batch.commits, batch.written_rows, batch.pending_rows) == (1, rows + 1, 0)
+        assert committed_showtimes(db_path) == 31
+
+def test_batch_commits_every_max_rows(tmp_path, make_database, traced_statements):
+    db_path = str(tmp_path / "movie_optimization.db")
+    statements = traced_statements(db_path)
+    make_database(showtimes_by_date={})
+    with DatabaseManager(db_path) as db:
+        del statements[:]
+        with db.batch(max_rows=10, max_interval_ms=60_000) as batch:
+            rows = add_rows(db, 23)
+            assert commits(statements) == rows // 10
+        # 残りの行はブロックを抜けた時にまとめてコミット
+        assert commits(statements) == batch.commits == rows // 10 + 1
+        assert batch.written_rows == rows
+
+def test_failed_batch_rolls_back_pending_rows(tmp_path, make_database):
+    db_path = make_database(showtimes_by_date={})
+    with DatabaseManager(db_path) as db:
+        with pytest.raises(RuntimeError):
+            with db.batch(max_rows=10, max_interval_ms=60_000):
+                add_rows(db, 23)
+                raise RuntimeError("取り込み失敗")
+        # max_rows ごとにコミット済みの20行（映画館・映画と上映18件）は残り、未コミットの分だけ取り消される
+        assert committed_showtimes(db_path) == 18
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+映画館間移動時間マトリクス - theater_distances の密行列キャッシュ
+"""
+
+import threading
+from array import array
+from typing import Dict, List, Optional
+import logging
+from database_manager import DatabaseManager
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 移動手段と theater_distances のカラム名
+TRAVEL_MODES = {
+    'walking': 'walking_minutes',
+    'train': 'train_minutes',
+    'taxi': 'taxi_minutes'
+}
+
+class TravelMatrix:
+    """theater_id で添字付けした NxN の移動時間行列（未登録は -1）"""
+    
+    def __init__(self, distances: List[Dict], version: Optional[int] = None):
+        self.version = version
+        max_id = 0
+        for d in distances:
+            max_id = max(max_id, d['from_theater_id'], d['to_theater_id'])
+        self.size = max_id + 1
+        
+        self.minutes: Dict[str, array] = {}
+        for mode in TRAVEL_MODES:
+            self.minutes[mode] = array('i', [-1]) * (self.size * self.size)
+        
+        for d in distances:
+            offset = d['from_theater_id'] * self.size + d['to_theater_id']
+            for mode, column in TRAVEL_MODES.items():
+                if d.get(column) is not None:
+                    self.minutes[mode][offset] = d[column]
+    
+    def get(self, from_theater_id: int, to_theater_id: int, mode: str = 'walking') -> Optional[int]:
+        """2つの映画館間の移動時間を取得（未登録の場合は None）"""
+        if not (0 <= from_theater_id < self.size and 0 <= to_theater_id < self.size):
+            return None
+        minutes = self.minutes[mode][from_theater_id * self.size + to_theater_id]
+        return minutes if minutes >= 0 else None
+
+class TravelMatrixCache:
+    """TravelMatrix を保持し、theater_distances のデータバージョンが変わった時だけ再読み込み"""
+    
+    def __init__(self, db_path: str = "movie_optimization.db"):
+        self.db_path = db_path
+        self._matrix: Optional[TravelMatrix] = None
+        self._lock = threading.Lock()
+    
+    def get(self, db: DatabaseManager = None) -> TravelMatrix:
+        """最新の TravelMatrix を取得（接続済みの DatabaseManager があれば再利用）"""
+        if db is None:
+            with DatabaseManager(self.db_path) as db:
+                return self.get(db)
+        
+        version = db.get_data_version('theater_distances')
+        matrix = self._matrix
+        # バージョン管理のない古いDBでは初回読み込み分を使い続ける
+        if matrix is not None and (version is None or version == matrix.version):
+            return matrix
+        
+        with self._lock:
+            if self._matrix is matrix:
+                self._matrix = TravelMatrix(db.get_theater_distances(), version)
+                logger.info(f"Travel matrix loaded: {self._matrix.size - 1} theaters (version {version})")
+            return self._matrix
+    
+    def invalidate(self):
+        """キャッシュを破棄（次回アクセス時に再読み込み）"""
+        with self._lock:
+            self._matrix = None